@@ -0,0 +1,141 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Adaptive vs. dense window scan (window_acc_exp.py --scan adaptive) on the
+# landmark data.
+#
+# For every participant and window size this runs the dense stride-1 scan
+# (read from / saved to the result store, so it is only ever computed once)
+# and the adaptive one, and reports how many windows the adaptive scan
+# evaluated, how often the window verdicts agree, and how far the per-frame
+# fake segments of the 1-3 fakes cases move: the number of frames whose
+# verdict differs and the largest shift of a segment boundary.
+
+import argparse
+import functools
+import json
+import os
+import time
+import numpy as np
+
+from window_acc_exp import cellParams, scoreVersion, waveletScores, windowScores
+from socialverify.adaptive import adaptiveScan, frameVerdicts, segments
+from socialverify.detect import detectFakes
+from socialverify.estimators import ESTIMATORS
+from socialverify.landmarks import loadStreams, participantIDs
+from socialverify.store import ResultStore, cellKey
+
+
+def boundaryShift(dense, adaptive):
+    # Largest distance from a segment boundary of one verdict to the nearest
+    # boundary of the other (0 when neither has segments)
+    edges = [np.array([b for seg in segments(f) for b in seg]) for f in (dense, adaptive)]
+    if not len(edges[0]) and not len(edges[1]):
+        return 0
+    if not len(edges[0]) or not len(edges[1]):
+        return len(dense)
+    d = np.abs(edges[0][:, None] - edges[1][None, :])
+    return int(max(d.min(axis=1).max(), d.min(axis=0).max()))
+
+
+def scores(args, streams, j, store=None, key=None, scan=None):
+    if args.features == 'wavelet':
+        return waveletScores(streams, j, store, key, scan=scan)
+    return windowScores(streams, j, args.num_pcs, args.pca_engine, args.seed, args.estimator, store, key,
+                        scan=scan)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Adaptive vs. dense window scan report')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py)')
+    parser.add_argument('--store', type=str, default='results/results.sqlite',
+                    help='Result store holding (or receiving) the dense scans')
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--num_participants', type=int, default=25,
+                    help='Number of participants')
+    parser.add_argument("--window-sizes", nargs="+", type=int, default=[250])
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[1.3, 1.5])
+    parser.add_argument('--coarse-stride', type=int, default=32)
+    parser.add_argument('--ratio-tol', type=float, default=None)
+    parser.add_argument('--features', type=str, default='pca', choices=['pca', 'wavelet'])
+    parser.add_argument('--pca-engine', type=str, default='rolling', choices=['rolling', 'batched', 'refit'])
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS))
+    parser.add_argument('--seed', type=int, default=0,
+                    help='Random state for the MCD estimator')
+    parser.add_argument('--out', type=str, default='results/adaptive_report.json',
+                    help='Where to write the per-participant results')
+
+    args = parser.parse_args()
+    args.compact = False
+    args.cascade = False
+    args.align = 'none'
+    return args
+
+
+def main():
+    args = parse_args()
+    store = ResultStore(args.store)
+    version = scoreVersion()
+    scan = functools.partial(adaptiveScan, threshes=args.thresholds, stride=args.coarse_stride,
+                             ratioTol=args.ratio_tol)
+    report = []
+
+    for i in participantIDs(args.num_participants):
+        streams = loadStreams(args.data_dir, i, camsFrom=3, cache_dir=args.cache_dir)
+        fullLen = streams.shape[1]
+        for j in args.window_sizes:
+            params = cellParams(args, i, j, version)
+            key = cellKey(params)
+            store.addCell(key, params, fullLen, fullLen - j)
+            t0 = time.perf_counter()
+            dense = scores(args, streams, j, store, key)
+            denseSeconds = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            adaptive = scores(args, streams, j, scan=scan)
+            adaptiveSeconds = time.perf_counter() - t0
+
+            numWin = dense[0].shape[1]
+            numFakes = [detectFakes(r, l, args.thresholds) for r, l in (dense[:2], adaptive[:2])]
+            entry = {'participant': i, 'window': j, 'windows': numWin, 'evaluated': int(np.sum(adaptive[2])),
+                     'adaptive_seconds': adaptiveSeconds, 'dense_seconds': denseSeconds,
+                     'verdict_agreement': float(np.mean(numFakes[0] == numFakes[1])),
+                     'frames_differ': [], 'boundary_shift': []}
+            for t in range(len(args.thresholds)):
+                frames = [frameVerdicts(n[t, 1:] > 0, j, fullLen) for n in numFakes]
+                entry['frames_differ'].append(np.sum(frames[0] != frames[1], axis = 1).tolist())
+                entry['boundary_shift'].append([boundaryShift(d, a) for d, a in zip(*frames)])
+            report.append(entry)
+            print(f'ID: {i}. Window size: {j}. Evaluated {entry["evaluated"]} of {numWin} windows, '
+                  f'verdicts agree {entry["verdict_agreement"]:.3f}, frames differ {entry["frames_differ"]}')
+    store.close()
+
+    evaluated = sum(e['evaluated'] for e in report) / max(sum(e['windows'] for e in report), 1)
+    shifts = np.array([e['boundary_shift'] for e in report])
+    differ = np.array([e['frames_differ'] for e in report])
+    print(f'Evaluated {100 * evaluated:.1f}% of the windows. '
+          f'Verdict agreement {np.mean([e["verdict_agreement"] for e in report]):.4f}.')
+    for t, thresh in enumerate(args.thresholds):
+        print(f'Threshold {thresh}: frames differing per participant (1-3 fakes) '
+              f'{np.round(np.mean(differ[:, t], axis = 0), 1)}, median boundary shift '
+              f'{np.median(shifts[:, t], axis = 0)}, max {np.max(shifts[:, t], axis = 0)}')
+
+    outDir = os.path.dirname(args.out)
+    if outDir and not os.path.exists(outDir):
+        os.makedirs(outDir)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Temporal alignment (socialverify.align, --align of the experiments) on
+# synthetic cameras with known start offsets and clock drifts.
+#
+# recovery:   offset and drift errors of the estimates, and how far the
+#             re-indexed frames are from the reference frame they stand for
+# detection:  agreement of the real cameras of synthetic participants whose
+#             cameras start at different times, as recorded (cropped to a
+#             common length) and aligned: the correlation of their mouth
+#             opening with cam1's and the windows the --cascade pre-filter
+#             finds consistent
+# throughput: alignment of many cameras at full sequence length, against a
+#             brute-force lag search extrapolated from a sample of its lags
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from socialverify.align import alignParticipant, alignSignals, alignStreams, frameIndex
+from socialverify.geometry import Cascade, consistentWindows, mouthOpening, mouthSignals
+from socialverify.synthetic import iterUnsyncedCameras, syntheticParticipant, unsyncedCameras
+
+
+def drawShifts(rng, numCams, maxOffset, maxDrift):
+    offsets = np.r_[0, rng.uniform(-maxOffset, maxOffset, numCams - 1)]
+    drifts = np.r_[0, rng.uniform(-maxDrift, maxDrift, numCams - 1)]
+    return offsets, drifts
+
+
+def frameErrors(alignments, offsets, drifts, length):
+    # |true reference time - reference frame| of every re-indexed frame
+    index = frameIndex(alignments, [length] * len(offsets))
+    start = int(np.ceil(max(a.offset for a in alignments) - 0.5))
+    r = start + np.arange(index.shape[1])
+    return np.abs(offsets[:, None] + (1 + drifts[:, None]) * index - r)
+
+
+def recovery(args, drift):
+    rng = np.random.default_rng(args.seed)
+    offsetErr, driftErr, frameErr = [], [], []
+    for trial in range(args.trials):
+        offsets, drifts = drawShifts(rng, args.cameras, args.max_offset, args.max_drift if drift else 0)
+        streams = unsyncedCameras(args.cameras, args.length, offsets, drifts, seed=args.seed + trial)
+        _, alignments = alignStreams(list(streams), drift=drift)
+        offsetErr += [abs(a.offset - o) for a, o in zip(alignments[1:], offsets[1:])]
+        driftErr += [abs(a.drift - d) for a, d in zip(alignments[1:], drifts[1:])]
+        frameErr.append(frameErrors(alignments, offsets, drifts, args.length)[1:].ravel())
+    frameErr = np.concatenate(frameErr)
+    return dict(drift=drift, pairs=len(offsetErr),
+                offset_error_mean=float(np.mean(offsetErr)), offset_error_max=float(np.max(offsetErr)),
+                drift_error_ppm_mean=float(np.mean(driftErr) * 1e6),
+                drift_error_ppm_max=float(np.max(driftErr) * 1e6),
+                frames_within_1=float(np.mean(frameErr <= 1)), frame_error_max=float(frameErr.max()))
+
+
+def shiftedParticipant(length, offsets, seed):
+    # syntheticParticipant whose cameras start offsets[c] frames after cam1
+    # (fakes with their camera), all `length` frames long
+    margin = int(np.max(np.abs(offsets)))
+    streams = syntheticParticipant(length + 2 * margin, seed=seed)
+    starts = margin + np.r_[offsets, offsets[1:4]].astype(int)
+    return np.stack([stream[s:s + length] for stream, s in zip(streams, starts)])
+
+
+def agreement(streams, window, cascade):
+    # Mean correlation of the real cameras' mouth opening with cam1's, and
+    # the fraction of windows the geometric pre-filter finds consistent
+    signals = mouthSignals(streams[:6])
+    opening = signals[0] - signals[0].mean(axis=1, keepdims=True)
+    corr = opening[1:] @ opening[0] / np.sqrt((opening[1:] ** 2).sum(axis=1) * (opening[0] ** 2).sum())
+    numWin = signals.shape[2] - window
+    consistent = consistentWindows(signals, window, numWin, cascade.min_opening, cascade.min_speed)
+    return float(corr.mean()), float(consistent.mean())
+
+
+def detection(args):
+    # The geometric signals of the detection stages on participants whose
+    # cameras are not synchronized, as recorded and aligned
+    rng = np.random.default_rng(args.seed)
+    cascade = Cascade(args.cascade_min_opening, args.cascade_min_speed, 'blocks')
+    recorded, aligned = [], []
+    for trial in range(args.participants):
+        offsets, _ = drawShifts(rng, 6, args.max_offset, 0)
+        streams = shiftedParticipant(args.participant_length, np.rint(offsets), args.seed + trial)
+        recorded.append(agreement(streams, args.window, cascade))
+        aligned.append(agreement(alignParticipant(streams)[0], args.window, cascade))
+    recorded, aligned = np.mean(recorded, axis=0), np.mean(aligned, axis=0)
+    return dict(participants=args.participants, window=args.window,
+                recorded=dict(correlation=recorded[0], consistent_windows=recorded[1]),
+                aligned=dict(correlation=aligned[0], consistent_windows=aligned[1]))
+
+
+def bruteOffset(ref, sig, lags):
+    # Normalized correlation of sig against ref at every given lag, one dot
+    # product each
+    corr = []
+    for d in lags:
+        lo, hi = max(d, 0), min(d + len(sig), len(ref))
+        a, b = ref[lo:hi], sig[lo - d:hi - d]
+        corr.append(a @ b / np.sqrt((a @ a) * (b @ b)))
+    return lags[int(np.argmax(corr))]
+
+
+def throughput(args):
+    rng = np.random.default_rng(args.seed)
+    offsets, drifts = drawShifts(rng, args.throughput_cameras, args.max_offset, args.max_drift)
+    t = time.perf_counter()
+    signals = [mouthOpening(stream) for stream in iterUnsyncedCameras(
+        args.throughput_cameras, args.throughput_length, offsets, drifts, seed=args.seed)]
+    extract = time.perf_counter() - t
+    report = dict(cameras=args.throughput_cameras, length=args.throughput_length, signal_seconds=extract)
+    for drift in (False, True):
+        t = time.perf_counter()
+        alignments = alignSignals(signals, drift=drift)
+        elapsed = time.perf_counter() - t
+        report['drift' if drift else 'offset'] = dict(seconds=elapsed, cameras_per_second=(len(signals) - 1) / elapsed)
+    report['drift'].update(offset_error_max=float(max(abs(a.offset - o) for a, o in zip(alignments, offsets))),
+                           drift_error_ppm_max=float(max(abs(a.drift - d) for a, d in zip(alignments, drifts)) * 1e6))
+    # every lag with at least half the frames in common, as estimateOffset
+    n = args.throughput_length
+    sample = np.linspace(-(n // 2), n // 2, args.brute_lags).astype(int)
+    t = time.perf_counter()
+    bruteOffset(signals[0], signals[1], sample)
+    perLag = (time.perf_counter() - t) / len(sample)
+    report['brute_force_seconds_per_pair'] = perLag * (n + 1)
+    report['fft_seconds_per_pair'] = report['offset']['seconds'] / (len(signals) - 1)
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Temporal alignment report on synthetic cameras')
+
+    parser.add_argument('--cameras', type=int, default=6,
+                    help='Cameras per recovery trial')
+    parser.add_argument('--length', type=int, default=9000,
+                    help='Frames per camera in the recovery trials')
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--max-offset', type=float, default=300,
+                    help='Start offsets are drawn from +-this many frames')
+    parser.add_argument('--max-drift', type=float, default=2e-3,
+                    help='Clock drifts are drawn from +-this (frames per frame)')
+    parser.add_argument('--participants', type=int, default=10,
+                    help='Synthetic participants of the detection check')
+    parser.add_argument('--participant-length', type=int, default=3000)
+    parser.add_argument('--window', type=int, default=250,
+                    help='Window size of the pre-filter')
+    parser.add_argument('--cascade-min-opening', type=float, default=0.8)
+    parser.add_argument('--cascade-min-speed', type=float, default=0.7)
+    parser.add_argument('--throughput-cameras', type=int, default=100)
+    parser.add_argument('--throughput-length', type=int, default=108000,
+                    help='Frames per camera of the throughput run (one hour at 30 fps)')
+    parser.add_argument('--brute-lags', type=int, default=200,
+                    help='Lags timed to extrapolate the brute-force search')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=str, default='results/align_report.json',
+                    help='Where to write the report')
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    report = dict(recovery=[recovery(args, False), recovery(args, True)], detection=detection(args),
+                  throughput=throughput(args))
+
+    print('Recovery over %d camera pairs (offsets within +-%g frames)' % (report['recovery'][0]['pairs'], args.max_offset))
+    print('%-8s %12s %12s %14s %14s %12s %10s' % ('model', 'offset err', 'max', 'drift err ppm', 'max',
+                                                 'frames <=1', 'max'))
+    for r in report['recovery']:
+        print('%-8s %12.3f %12.3f %14.1f %14.1f %11.1f%% %10.2f' % (
+            'drift' if r['drift'] else 'offset', r['offset_error_mean'], r['offset_error_max'],
+            r['drift_error_ppm_mean'], r['drift_error_ppm_max'], 100 * r['frames_within_1'],
+            r['frame_error_max']))
+    d = report['detection']
+    print('Real cameras of %d shifted participants: opening correlation with cam1, consistent %d-frame windows'
+          % (d['participants'], d['window']))
+    for name in ('recorded', 'aligned'):
+        print('  %-9s %.3f  %5.1f%%' % (name, d[name]['correlation'], 100 * d[name]['consistent_windows']))
+    t = report['throughput']
+    print('Throughput: %d cameras x %d frames (signals %.2fs)' % (t['cameras'], t['length'], t['signal_seconds']))
+    for model in ('offset', 'drift'):
+        print('  %-7s %.2fs, %.1f cameras/s' % (model, t[model]['seconds'], t[model]['cameras_per_second']))
+    print('  drift model errors: offset %.3f frames, drift %.1f ppm (max)' % (t['drift']['offset_error_max'],
+                                                                              t['drift']['drift_error_ppm_max']))
+    print('  per pair: FFT %.4fs, brute-force lag search %.1fs (extrapolated)' % (
+        t['fft_seconds_per_pair'], t['brute_force_seconds_per_pair']))
+
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark suite on synthetic landmark streams (socialverify.synthetic), so
+# it runs without the dataset.
+#
+#   micro  single stages: mahalanobisDistances, topOfTree, clusterHelper,
+#          socialVerificationOnlyPCA / NoPCA, wavelet features (full sequence
+#          and every window), one refit window, detectCrowd over N cameras
+#          (and the full linkage it replaces), scoreWindows
+#   macro  the experiment entry points: full_sequence_exp.participantCell,
+#          window_acc_exp.windowScores / waveletScores over --num-windows
+#          window starts, waveletScores over all of them with the adaptive
+#          scan, the full sequence pipeline over N cameras one camera at a
+#          time, and the library calls verify_sequence / verify_windows
+#          (--num-windows windows) over N cameras
+#
+# Benchmarks are parameterized over --cams, --lengths and --window-sizes
+# (each only over the ones it depends on). Timings go to a JSON file; with
+# --compare BASELINE every benchmark is checked against the baseline's
+# median and the run exits with status 1 if any got slower than --tolerance.
+#
+#   python code/benchmarks.py --out results/bench-baseline.json
+#   python code/benchmarks.py --compare results/bench-baseline.json
+
+import argparse
+import functools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import warnings
+import numpy as np
+from scipy.cluster.hierarchy import linkage
+
+import full_sequence_exp
+import window_acc_exp
+from socialverify.adaptive import adaptiveScan
+from socialverify.detect import detectCameras, detectCrowd, detectFakes, linkScores, topOfTree, trackingFailures
+from socialverify.landmarks import CASE_ROWS
+from socialverify.scoring import scoreWindows
+from socialverify.synthetic import syntheticCameras, syntheticDistances, syntheticParticipant
+from socialverify.verify import mahalanobisDistances, sequenceFeatures, verify_sequence, verify_windows, \
+    windowFeatures
+from socialverify.wavelets import iterWindowFeatures, waveletFeatures
+
+
+# Every benchmark maps its params to a zero-argument callable to time. The
+# data is generated outside the timed call.
+
+def benchMahalanobis(p):
+    streams = syntheticCameras(1, p['length'], seed=p['seed'])[0]
+    return lambda: mahalanobisDistances(streams, p['num_pcs'], random_state=p['seed'])
+
+
+def _distances(p):
+    # Features of cam1..cam6, fake2..fake4
+    streams = syntheticParticipant(p['length'], seed=p['seed'])
+    return sequenceFeatures(streams, 'pca', p['num_pcs'], random_state=p['seed'])
+
+
+def benchTopOfTree(p):
+    X = _distances(p)[CASE_ROWS[3]]
+    return lambda: topOfTree(X)
+
+
+def benchClusterHelper(p):
+    X = _distances(p)
+    return lambda: full_sequence_exp.clusterHelper(X, p['thresh'])
+
+
+def benchOnlyPCA(p):
+    streams = syntheticParticipant(p['length'], seed=p['seed'])
+    return lambda: full_sequence_exp.socialVerificationOnlyPCA(streams, p['thresh'], p['num_pcs'], p['seed'])
+
+
+def benchNoPCA(p):
+    streams = syntheticParticipant(p['length'], seed=p['seed'])
+    return lambda: full_sequence_exp.socialVerificationNoPCA(streams, p['thresh'])
+
+
+def benchWaveletFeatures(p):
+    streams = syntheticParticipant(p['length'], seed=p['seed'])
+    return lambda: waveletFeatures(streams)
+
+
+def benchWindowWavelets(p):
+    # Features of every window start, consumed chunk by chunk
+    streams = syntheticParticipant(p['length'], seed=p['seed'])
+    return lambda: sum(f.shape[1] for _, f in iterWindowFeatures(streams, p['window']))
+
+
+def benchWindow(p):
+    # One window, with the scaler/PCA fitted to it
+    streams, _ = window_acc_exp.spliceStreams(syntheticParticipant(p['length'], seed=p['seed']))
+    windows = windowFeatures(streams, p['window'], engine='refit', num_pcs=p['num_pcs'], random_state=p['seed'])
+    return lambda: [window_acc_exp.clusterWindow(X) for X in windows([0])]
+
+
+def benchDetectCrowd(p):
+    X = syntheticDistances(p['cams'], p['length'], numFakes=max(1, p['cams'] // 10), seed=p['seed'])
+    return lambda: detectCrowd(X, p['thresh'])
+
+
+def benchLinkageCrowd(p):
+    # The same detection through a full scipy linkage, for comparison
+    X = syntheticDistances(p['cams'], p['length'], numFakes=max(1, p['cams'] // 10), seed=p['seed'])
+    def run():
+        Y = X[:, ~trackingFailures(X)]
+        ratio, c = linkScores(linkage(Y))
+        return detectFakes(ratio, c, p['thresh'])
+    return run
+
+
+def benchScoreWindows(p):
+    rng = np.random.default_rng(p['seed'])
+    numWin = p['length'] - p['window']
+    ratios = rng.uniform(0.8, 2, (4, numWin))
+    labels = rng.integers(1, 3, (4, numWin, 6))
+    threshes = np.linspace(1, 2, 50)
+    return lambda: scoreWindows(ratios, labels, p['length'] // 3, threshes, p['window'])
+
+
+def benchParticipantCell(p):
+    streams = syntheticParticipant(p['length'], seed=p['seed'])
+    return lambda: full_sequence_exp.participantCell(streams, p['thresh'], p['num_pcs'], p['seed'], 'mcd')
+
+
+def benchWindowScores(p):
+    # Only the first num_windows window starts, the full sweep takes hours
+    streams = syntheticParticipant(p['length'], seed=p['seed'])[:, :p['window'] + p['num_windows']]
+    return lambda: window_acc_exp.windowScores(streams, p['window'], p['num_pcs'], p['engine'],
+                                               p['seed'], 'mcd')
+
+
+def benchWaveletScores(p):
+    streams = syntheticParticipant(p['length'], seed=p['seed'])[:, :p['window'] + p['num_windows']]
+    return lambda: window_acc_exp.waveletScores(streams, p['window'])
+
+
+def benchAdaptiveScan(p):
+    # Every window start of the full sequence, through the adaptive scan
+    streams = syntheticParticipant(p['length'], seed=p['seed'])
+    scan = functools.partial(adaptiveScan, threshes=p['thresh'])
+    return lambda: window_acc_exp.waveletScores(streams, p['window'], scan=scan)
+
+
+def benchCameraPipeline(p):
+    streams, _ = syntheticCameras(p['cams'], p['length'], fakeCams=(), seed=p['seed'])
+    def run():
+        X = np.array([mahalanobisDistances(s[None], p['num_pcs'], random_state=p['seed'])[0] for s in streams])
+        return detectCameras(X, p['thresh'])
+    return run
+
+
+def benchVerifySequence(p):
+    # The library call on N cameras (one stacked PCA), against cameraPipeline
+    streams, _ = syntheticCameras(p['cams'], p['length'], fakeCams=(), seed=p['seed'])
+    return lambda: verify_sequence(streams, p['thresh'], num_pcs=p['num_pcs'], random_state=p['seed'])
+
+
+def benchVerifyWindows(p):
+    streams, _ = syntheticCameras(p['cams'], p['window'] + p['num_windows'] - 1, fakeCams=(), seed=p['seed'])
+    return lambda: verify_windows(streams, p['window'], 1, p['thresh'], num_pcs=p['num_pcs'],
+                                  random_state=p['seed'])
+
+
+# name: (kind, benchmark, grid params it depends on)
+BENCHMARKS = {
+    'mahalanobisDistances': ('micro', benchMahalanobis, ('length',)),
+    'topOfTree': ('micro', benchTopOfTree, ('length',)),
+    'clusterHelper': ('micro', benchClusterHelper, ('length',)),
+    'socialVerificationOnlyPCA': ('micro', benchOnlyPCA, ('length',)),
+    'socialVerificationNoPCA': ('micro', benchNoPCA, ('length',)),
+    'waveletFeatures': ('micro', benchWaveletFeatures, ('length',)),
+    'windowWavelets': ('micro', benchWindowWavelets, ('length', 'window')),
+    'refit_window': ('micro', benchWindow, ('window',)),
+    'detectCrowd': ('micro', benchDetectCrowd, ('cams', 'length')),
+    'linkageCrowd': ('micro', benchLinkageCrowd, ('cams', 'length')),
+    'scoreWindows': ('micro', benchScoreWindows, ('length', 'window')),
+    'participantCell': ('macro', benchParticipantCell, ('length',)),
+    'windowScores': ('macro', benchWindowScores, ('window', 'engine')),
+    'waveletScores': ('macro', benchWaveletScores, ('window',)),
+    'adaptiveScan': ('macro', benchAdaptiveScan, ('length', 'window')),
+    'cameraPipeline': ('macro', benchCameraPipeline, ('cams', 'length')),
+    'verify_sequence': ('macro', benchVerifySequence, ('cams', 'length')),
+    'verify_windows': ('macro', benchVerifyWindows, ('cams', 'window')),
+}
+
+
+def benchCases(args):
+    grid = {'cams': args.cams, 'length': args.lengths, 'window': args.window_sizes,
+            'engine': args.engines}
+    fixed = {'seed': args.seed, 'num_pcs': args.num_pcs, 'thresh': args.threshold,
+             'num_windows': args.num_windows}
+    for name, (kind, bench, depends) in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        if args.kind != 'all' and kind != args.kind:
+            continue
+        cases = [{}]
+        for key in depends:
+            cases = [dict(c, **{key: v}) for c in cases for v in grid[key]]
+        for case in cases:
+            if 'window' in case and case['window'] >= min(args.lengths):
+                continue
+            params = dict(fixed, **case)
+            # windowed benchmarks need a sequence to slide over
+            params.setdefault('length', max(args.lengths))
+            yield name, kind, case, params
+
+
+def caseKey(name, case):
+    return name + ''.join(f' {k}={case[k]}' for k in sorted(case))
+
+
+def timeCase(func, repeat, minSeconds=0.05):
+    # Seconds per call, repeat times. The warm-up run also decides how many
+    # calls go into one timing, so microsecond stages aren't all timer noise.
+    t0 = time.perf_counter()
+    func()
+    number = max(1, int(minSeconds / max(time.perf_counter() - t0, 1e-9)))
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - t0) / number)
+    return times
+
+
+def compare(results, baseline, tolerance):
+    # Print the change against the baseline per benchmark, return the
+    # regressions (slower than 1 + tolerance times the baseline median)
+    base = baseline['results']
+    regressions = []
+    print(f'{"benchmark":<48} {"baseline":>11} {"now":>11} {"ratio":>7}')
+    for key, r in results.items():
+        if key not in base:
+            print(f'{key:<48} {"-":>11} {r["median"]:11.4g} {"new":>7}')
+            continue
+        ratio = r['median'] / base[key]['median']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print(f'{key:<48} {base[key]["median"]:11.4g} {r["median"]:11.4g} {ratio:7.2f}{flag}')
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmarks on synthetic landmark streams')
+
+    parser.add_argument('--kind', type=str, default='all', choices=['all', 'micro', 'macro'])
+    parser.add_argument('--only', nargs='+', default=None, choices=sorted(BENCHMARKS),
+                    help='Run only these benchmarks')
+    parser.add_argument('--cams', nargs='+', type=int, default=[6],
+                    help='Camera counts (for the N-camera benchmarks)')
+    parser.add_argument('--lengths', nargs='+', type=int, default=[1000],
+                    help='Sequence lengths in frames')
+    parser.add_argument('--window-sizes', nargs='+', type=int, default=[250])
+    parser.add_argument('--engines', nargs='+', default=['rolling'], choices=['rolling', 'batched', 'refit'],
+                    help='PCA engines for the windowScores benchmark')
+    parser.add_argument('--num-windows', type=int, default=10,
+                    help='Window starts per windowScores run')
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--threshold', type=float, default=1.3,
+                    help='Cluster threshold')
+    parser.add_argument('--seed', type=int, default=0,
+                    help='Seed of the synthetic data and the MCD estimator')
+    parser.add_argument('--repeat', type=int, default=3,
+                    help='Timed runs per benchmark (after one warm-up run)')
+    parser.add_argument('--out', type=str, default='results/benchmarks.json',
+                    help='Where to write the timings')
+    parser.add_argument('--compare', type=str, default=None,
+                    help='Baseline timings to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                    help='Allowed slowdown against the baseline median (0.2 = 20%%)')
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    results = {}
+    for name, kind, case, params in benchCases(args):
+        with warnings.catch_warnings():
+            # pywt warns about the wavedec2 level in socialVerificationNoPCA
+            warnings.simplefilter('ignore', UserWarning)
+            times = timeCase(BENCHMARKS[name][1](params), args.repeat)
+        key = caseKey(name, case)
+        results[key] = {'name': name, 'kind': kind, 'params': params,
+                        'median': statistics.median(times), 'min': min(times), 'times': times}
+        print(f'{key:<48} {kind:<6} median {results[key]["median"]:.4g}s  min {results[key]["min"]:.4g}s')
+
+    report = {'python': platform.python_version(), 'numpy': np.__version__,
+              'machine': platform.machine(), 'cpus': os.cpu_count(),
+              'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}
+    outDir = os.path.dirname(args.out)
+    if outDir and not os.path.exists(outDir):
+        os.makedirs(outDir)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent = 1)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {args.tolerance:.0%}')
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
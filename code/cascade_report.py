@@ -0,0 +1,131 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Geometric pre-filter cascade (window_acc_exp.py --cascade) vs. the full
+# pipeline on the landmark data.
+#
+# For every participant and window size this runs the sliding window
+# experiment with and without the cascade (both read from / saved to the
+# result store, so each is only ever computed once) and reports the fraction
+# of windows the pre-filter skips, the cases it settles as consistent, and
+# the TP / FP rates of the 1-3 fakes cases (and the X0 false positives) at
+# every threshold for both, with their time when computed.
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from window_acc_exp import cascadeFilter, cascadeSettings, cellParams, scoreVersion, spliceStreams, \
+    waveletScores, windowScores
+from socialverify.estimators import ESTIMATORS
+from socialverify.geometry import LAYOUTS
+from socialverify.landmarks import loadStreams, participantIDs
+from socialverify.scoring import scoreWindows, windowRates
+from socialverify.store import ResultStore, cellKey
+
+
+def scores(args, streams, j, store, key, cascade):
+    if args.features == 'wavelet':
+        return waveletScores(streams, j, store, key, cascade=cascade)
+    return windowScores(streams, j, args.num_pcs, args.pca_engine, args.seed, args.estimator, store, key,
+                        cascade=cascade)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Geometric pre-filter cascade report')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py)')
+    parser.add_argument('--store', type=str, default='results/results.sqlite',
+                    help='Result store holding (or receiving) the window outputs')
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--num_participants', type=int, default=25,
+                    help='Number of participants')
+    parser.add_argument("--window-sizes", nargs="+", type=int, default=[250])
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[1.3, 1.5])
+    parser.add_argument('--cascade-min-opening', type=float, default=0.8)
+    parser.add_argument('--cascade-min-speed', type=float, default=0.7)
+    parser.add_argument('--landmark-layout', type=str, default='blocks', choices=sorted(LAYOUTS))
+    parser.add_argument('--features', type=str, default='pca', choices=['pca', 'wavelet'])
+    parser.add_argument('--pca-engine', type=str, default='rolling', choices=['rolling', 'batched', 'refit'])
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS))
+    parser.add_argument('--seed', type=int, default=0,
+                    help='Random state for the MCD estimator')
+    parser.add_argument('--out', type=str, default='results/cascade_report.json',
+                    help='Where to write the per-participant results')
+
+    args = parser.parse_args()
+    args.compact = False
+    args.align = 'none'
+    return args
+
+
+def main():
+    args = parse_args()
+    store = ResultStore(args.store)
+    version = scoreVersion()
+    args.cascade = True
+    cascade = cascadeSettings(args)
+    report = []
+
+    for i in participantIDs(args.num_participants):
+        streams = loadStreams(args.data_dir, i, camsFrom=3, cache_dir=args.cache_dir)
+        fullLen = streams.shape[1]
+        spliced, intervalWin = spliceStreams(streams)
+        for j in args.window_sizes:
+            numWin = fullLen - j
+            t0 = time.perf_counter()
+            consistent = cascadeFilter(spliced, j, numWin, cascade)
+            filterSeconds = time.perf_counter() - t0
+            entry = {'participant': i, 'window': j, 'windows': numWin, 'filter_seconds': filterSeconds,
+                     'skipped': float(np.mean(np.all(consistent, axis = 0))),
+                     'consistent_cases': np.mean(consistent, axis = 1).tolist()}
+            for name, enabled in (('full', False), ('cascade', True)):
+                args.cascade = enabled
+                params = cellParams(args, i, j, version)
+                key = cellKey(params)
+                computed = store.load(key) is None
+                store.addCell(key, params, fullLen, numWin)
+                t0 = time.perf_counter()
+                ratios, labels = scores(args, streams, j, store, key, cascade if enabled else None)
+                tpr, fpr, acc = windowRates(scoreWindows(ratios, labels, intervalWin, args.thresholds, j))
+                entry[name] = {'tpr': tpr.tolist(), 'fpr': fpr.tolist(), 'acc': acc.tolist(),
+                               'seconds': time.perf_counter() - t0 if computed else None}
+            report.append(entry)
+            print(f'ID: {i}. Window size: {j}. Skipped {100 * entry["skipped"]:.1f}% of {numWin} windows '
+                  f'(pre-filter {1e3 * filterSeconds:.1f}ms), consistent cases '
+                  f'{np.round(entry["consistent_cases"], 3)}')
+    store.close()
+
+    print(f'Skipped {100 * np.mean([e["skipped"] for e in report]):.1f}% of the windows.')
+    for t, thresh in enumerate(args.thresholds):
+        for name in ('full', 'cascade'):
+            tpr = np.mean([e[name]['tpr'][t] for e in report], axis = 0)
+            fpr = np.mean([e[name]['fpr'][t] for e in report], axis = 0)
+            print(f'Threshold {thresh} {name:<8}: TP rate (1-3 fakes) {np.round(tpr[1:], 3)}, '
+                  f'FP rate (0-3 fakes) {np.round(fpr, 3)}')
+    seconds = {name: [e[name]['seconds'] for e in report if e[name]['seconds'] is not None]
+               for name in ('full', 'cascade')}
+    if seconds['full'] and seconds['cascade']:
+        print(f'Computed cells: full {np.sum(seconds["full"]):.1f}s, cascade {np.sum(seconds["cascade"]):.1f}s')
+
+    outDir = os.path.dirname(args.out)
+    if outDir and not os.path.exists(outDir):
+        os.makedirs(outDir)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# One-time conversion of the processed landmark .mat files into the
+# memory-mapped landmark cache read by the experiments' --cache-dir option
+# (see socialverify/landmarks.py for the layout).
+
+import argparse
+import time
+from socialverify.landmarks import convertParticipant, openCached, participantIDs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert landmark .mat files into a memory-mapped cache')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default='data/landmark-cache',
+                    help='Directory to write the cache to')
+    parser.add_argument('--num_participants', type=int, default=25,
+                    help='Number of participants')
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    people = participantIDs(args.num_participants)
+
+    t0 = time.perf_counter()
+    for i in people:
+        meta = convertParticipant(args.data_dir, args.cache_dir, i)
+        print(f'ID{i}: {meta["fullLen"]} frames x {meta["numFeatures"]} features, '
+              f'lengths {meta["lengths"]}')
+    print(f'Converted {len(people)} participants in {time.perf_counter() - t0:.2f}s')
+
+    t0 = time.perf_counter()
+    for i in people:
+        openCached(args.cache_dir, i)
+    print(f'Opening the cache takes {time.perf_counter() - t0:.4f}s')
+
+
+if __name__ == "__main__":
+    main()
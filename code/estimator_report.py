@@ -0,0 +1,133 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Accuracy vs. speed of the covariance estimators in socialverify.estimators,
+# against the MinCovDet baseline ('mcd'), on the landmark data.
+#
+# For every participant and estimator this runs
+#   - the full sequence PCA experiment (accuracy for the 0-3 fakes cases), and
+#   - the first --num-windows windows of the sliding window sweep, recording
+#     the time per window, how closely the distance vectors follow the
+#     baseline's, and how often the detected number of fakes agrees with it.
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+from scipy.stats import spearmanr
+
+from full_sequence_exp import socialVerificationOnlyPCA
+from window_acc_exp import clusterWindow, spliceStreams
+from socialverify.detect import detectFakes
+from socialverify.estimators import ESTIMATORS
+from socialverify.landmarks import loadStreams, participantIDs
+from socialverify.scoring import scoreWindows, windowRates
+from socialverify.verify import windowFeatures
+
+
+def windowRun(streams, window, numWin, num_pcs, seed, estimator):
+    windows = windowFeatures(streams, window, num_pcs=num_pcs, random_state=seed, estimator=estimator)
+    dists = np.zeros((len(streams), numWin, window))
+    ratios = np.zeros((4, numWin))
+    labels = np.zeros((4, numWin, 6), dtype = np.int32)
+    t0 = time.perf_counter()
+    for start, X in enumerate(windows(range(numWin))):
+        dists[:, start] = X
+        ratios[:, start], labels[:, start, :] = clusterWindow(X)
+    return dists, ratios, labels, (time.perf_counter() - t0) / numWin
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Covariance estimator accuracy/speed report')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py)')
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--num_participants', type=int, default=25,
+                    help='Number of participants')
+    parser.add_argument('--estimators', nargs='+', default=sorted(ESTIMATORS),
+                    choices=sorted(ESTIMATORS))
+    parser.add_argument('--threshold', type=float, default=1.3,
+                    help='Cluster threshold')
+    parser.add_argument('--window-size', type=int, default=250)
+    parser.add_argument('--num-windows', type=int, default=200,
+                    help='Number of window starts per participant to evaluate')
+    parser.add_argument('--seed', type=int, default=0,
+                    help='Random state for the randomized estimators')
+    parser.add_argument('--out', type=str, default='results/estimator_report.json',
+                    help='Where to write the per-participant results')
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    estimators = ['mcd'] + [e for e in args.estimators if e != 'mcd']
+    report = {e: {'full_acc': [], 'full_seconds': [], 'window_seconds': [],
+                  'window_acc': [], 'dist_spearman': [], 'dist_rel_err': [],
+                  'verdict_agreement': []} for e in estimators}
+
+    for i in participantIDs(args.num_participants):
+        streams = loadStreams(args.data_dir, i, cache_dir=args.cache_dir)
+        if args.cache_dir is None:
+            windowStreams, intervalWin = spliceStreams(loadStreams(args.data_dir, i, camsFrom=3))
+        else:
+            windowStreams, intervalWin = spliceStreams(streams)
+        numWin = min(args.num_windows, windowStreams[0].shape[0] - args.window_size)
+
+        baseline = None
+        for name in estimators:
+            r = report[name]
+            t0 = time.perf_counter()
+            result = socialVerificationOnlyPCA(streams, args.threshold, args.num_pcs, args.seed, name)
+            r['full_seconds'].append(time.perf_counter() - t0)
+            r['full_acc'].append(result[0].tolist())
+
+            dists, ratios, labels, seconds = windowRun(windowStreams, args.window_size, numWin,
+                                                       args.num_pcs, args.seed, name)
+            numFakes = detectFakes(ratios, labels, args.threshold)[0]
+            _, _, acc = windowRates(scoreWindows(ratios, labels, intervalWin, args.threshold, args.window_size))
+            r['window_seconds'].append(seconds)
+            r['window_acc'].append(acc[0].tolist())
+            if baseline is None:
+                baseline = dists, numFakes
+            rel = np.abs(dists - baseline[0]) / np.maximum(np.abs(baseline[0]), 1e-12)
+            rho = np.mean([spearmanr(d.ravel(), b.ravel())[0]
+                           for d, b in zip(dists, baseline[0])])
+            r['dist_rel_err'].append(float(np.median(rel)))
+            r['dist_spearman'].append(float(rho))
+            r['verdict_agreement'].append(float(np.mean(numFakes == baseline[1])))
+
+        print(f'ID: {i} done')
+
+    print(f'{"estimator":<10} {"full s":>8} {"window ms":>10} {"speedup":>8} '
+          f'{"dist rho":>9} {"rel err":>8} {"agree":>6}  full acc (0-3 fakes)')
+    baseSeconds = np.mean(report['mcd']['window_seconds'])
+    for name in estimators:
+        r = report[name]
+        seconds = np.mean(r['window_seconds'])
+        print(f'{name:<10} {np.mean(r["full_seconds"]):8.3f} {1e3 * seconds:10.2f} '
+              f'{baseSeconds / seconds:8.1f} {np.mean(r["dist_spearman"]):9.4f} '
+              f'{np.mean(r["dist_rel_err"]):8.4f} {np.mean(r["verdict_agreement"]):6.3f}  '
+              f'{np.round(np.mean(r["full_acc"], axis = 0), 3)}')
+
+    outDir = os.path.dirname(args.out)
+    if outDir and not os.path.exists(outDir):
+        os.makedirs(outDir)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
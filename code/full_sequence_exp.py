@@ -8,163 +8,97 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import os
+import time
 import numpy as np
-from scipy.io import loadmat
-from sklearn.decomposition import PCA
-from sklearn.covariance import MinCovDet
-from scipy.cluster.hierarchy import linkage, fcluster
-from pywt import wavedec2, dwt_max_level
-
-def mahalanobis_calculate(data, num_pcs):
-    pca = PCA(num_pcs)
-    T = pca.fit_transform(data)
-    # fit a Minimum Covariance Determinant (MCD) robust estimator to data 
-    robust_cov = MinCovDet().fit(T)
-    # Get the Mahalanobis distance
-    m = robust_cov.mahalanobis(T)
-    return m
-
-# numFakes will be the number of
-# fakes detected, and c will be a vector of numCams integers, which are 
-# partitioned into two sets. We assume the larger partition is real.
-
-def detectFakesTree(link, thresh):
-    
-    ratio = link[-1][-2] / link[-2][-2]
-    if ratio > thresh:
-        c = fcluster(link, 2,criterion='maxclust')
-        partition1 = len(np.argwhere(c==1))
-        partition2 = len(np.argwhere(c==2))
-        if (partition1 > partition2):
-            numFakes = partition2
-        else:
-            numFakes = partition1
-    else:
-        numFakes = 0
-        c = 0
-    return numFakes, c
-
-
-def resultsHelper(numFakes, cLst, result):
-    if numFakes[0] == 0:
-        result[0][0] = 1
-    
-    if numFakes[1] == 1:
-        if (np.all(cLst[0] == np.array([1,1,1,2,1,1])) or np.all(cLst[0] == np.array([2,2,2,1,2,2]))):
-            result[0][1] = 1
-            
-    if numFakes[2] == 2:
-        if (np.all(cLst[1] == np.array([1,1,2,2,1,1])) or np.all(cLst[1] == np.array([2,2,1,1,2,2]))):
-            result[0][2] = 1
-            
-    if numFakes[3] == 3:
-        if (np.all(cLst[2] == np.array([1,2,2,2,1,1])) or np.all(cLst[2] == np.array([2,1,1,1,2,2]))):
-            result[0][3] = 1
-    return result
-
-
-
-def clusterHelper(X0, X1, X2, X3, thresh, result):
-    #Test for tracking failures and remove
-    badInds = []
-    
-    for i, row in enumerate(X0.T):
-        if np.max(row) >= 10:
-            badInds.append(i)
-    
-    X0 = np.delete(X0, badInds, axis = 1)
-    X1 = np.delete(X1, badInds, axis = 1)
-    X2 = np.delete(X2, badInds, axis = 1)
-    X3 = np.delete(X3, badInds, axis = 1)
-    
-    #generate the linkage matrices with euclidean metric, we will cluster data ourselves
-    link0 = linkage(X0)
-    link1 = linkage(X1)
-    link2 = linkage(X2)
-    link3 = linkage(X3)
-    
-    numFakes0, _ = detectFakesTree(link0, thresh)
-    numFakes1, c1 = detectFakesTree(link1, thresh)
-    numFakes2, c2 = detectFakesTree(link2, thresh)
-    numFakes3, c3 = detectFakesTree(link3, thresh)
-    
-    return resultsHelper([numFakes0, numFakes1, numFakes2, numFakes3], [c1,c2,c3], result)
-    
-    
-def createDecompVector(coeff):
-    output = []
-    for i in range(len(coeff)):
-        for j in range(len(coeff[i])):
-            output.append(coeff[i][j].flatten())
-    return np.hstack(output)
-
-def socialVerificationNoPCA(data2,data3,data4, thresh):
+from socialverify.align import alignParticipant
+from socialverify.detect import detectFakes, isPartition, minority
+from socialverify.estimators import ESTIMATORS
+from socialverify.geometry import LAYOUTS
+from socialverify import instrument
+from socialverify.instrument import Instrumented, Progress, stage
+from socialverify.landmarks import CASE_ROWS, MappedArray, loadStreams, participantIDs
+from socialverify.parallel import SharedArray, asArray, runCells
+from socialverify.verify import caseScores, sequenceFeatures
+
+# Rows of X0..X3 that hold fakes
+FAKE_ROWS = (set(), {3}, {2, 3}, {1, 2, 3})
+
+# numFakes will be the number of fakes detected, and fakes the rows
+# (cameras) flagged as fake: the smaller side of the top single linkage
+# split, see socialverify.detect. We assume the larger partition is real.
+# A case is correct when exactly its fake rows are flagged.
+
+def clusterHelper(X, thresh):
+    #X holds the features of cam1..cam6, fake2..fake4. Tracking failures
+    #(from X0) are removed and X0..X3 scored at the top of their single
+    #linkage trees (euclidean metric)
     result = np.zeros((1,4))
-    fullLen = min(data2['cam1'].shape[0], data3['cam1'].shape[0], data4['cam1'].shape[0])
-    
-    level = dwt_max_level(fullLen, 'haar')
+    ratios, labels = caseScores(X, CASE_ROWS)
     
-    cam1_dist = createDecompVector(wavedec2(data2['cam1'][:fullLen,:], level = level, wavelet ='haar'))
-    cam2_dist = createDecompVector(wavedec2(data2['cam2'][:fullLen,:], level = level, wavelet ='haar'))
-    cam3_dist = createDecompVector(wavedec2(data2['cam3'][:fullLen,:], level = level, wavelet ='haar'))
-    cam4_dist = createDecompVector(wavedec2(data2['cam4'][:fullLen,:], level = level, wavelet ='haar'))
-    cam5_dist = createDecompVector(wavedec2(data2['cam5'][:fullLen,:], level = level, wavelet ='haar'))
-    cam6_dist = createDecompVector(wavedec2(data2['cam6'][:fullLen,:], level = level, wavelet ='haar'))
-    fake2_dist = createDecompVector(wavedec2(data2['fake'][:fullLen,:], level = level, wavelet ='haar'))
-    fake3_dist = createDecompVector(wavedec2(data3['fake'][:fullLen,:], level = level, wavelet ='haar'))
-    fake4_dist = createDecompVector(wavedec2(data4['fake'][:fullLen,:], level = level, wavelet ='haar'))
+    with stage('scoring'):
+        for k, (ratio, c) in enumerate(zip(ratios, labels)):
+            numFakes = detectFakes(ratio, c, thresh)[0]
+            fakes = minority(c) if numFakes else []
+            if numFakes == k and isPartition(fakes, FAKE_ROWS[k], len(CASE_ROWS[k])):
+                result[0][k] = 1
+        return result
     
-    X0 = np.array([cam1_dist, cam2_dist, cam3_dist, cam4_dist, cam5_dist, cam6_dist])
-    X1 = np.array([cam1_dist, cam2_dist, cam3_dist, fake4_dist, cam5_dist, cam6_dist])
-    X2 = np.array([cam1_dist, cam2_dist, fake3_dist, fake4_dist, cam5_dist, cam6_dist])
-    X3 = np.array([cam1_dist, fake2_dist, fake3_dist, fake4_dist, cam5_dist, cam6_dist])
     
-    return clusterHelper(X0, X1, X2, X3, thresh, result)
-    
-
+def socialVerificationNoPCA(streams, thresh):
+    #wavedec2 (haar, maximum level) of all nine streams in one pass, one
+    #flattened coefficient vector per stream
+    return clusterHelper(sequenceFeatures(streams, 'wavelet'), thresh)
 
 
-
-def socialVerificationOnlyPCA(data2,data3,data4, thresh, num_pcs):
+def socialVerificationOnlyPCA(streams, thresh, num_pcs, random_state=None, estimator='mcd'):
     #storing the accuracy for the 0,1,2,3 fake cases
-    result = np.zeros((1,4))
-    fullLen = min(data2['cam1'].shape[0], data3['cam1'].shape[0], data4['cam1'].shape[0])
-    
-    cam1_dist = mahalanobis_calculate(data2['cam1'][:fullLen,:], num_pcs)
-    cam2_dist = mahalanobis_calculate(data2['cam2'][:fullLen,:], num_pcs)
-    cam3_dist = mahalanobis_calculate(data2['cam3'][:fullLen,:], num_pcs)
-    cam4_dist = mahalanobis_calculate(data2['cam4'][:fullLen,:], num_pcs)
-    cam5_dist = mahalanobis_calculate(data2['cam5'][:fullLen,:], num_pcs)
-    cam6_dist = mahalanobis_calculate(data2['cam6'][:fullLen,:], num_pcs)
-    fake2_dist = mahalanobis_calculate(data2['fake'][:fullLen,:], num_pcs)
-    fake3_dist = mahalanobis_calculate(data3['fake'][:fullLen,:], num_pcs)
-    fake4_dist = mahalanobis_calculate(data4['fake'][:fullLen,:], num_pcs)
-    
-    
-    X0 = np.array([cam1_dist, cam2_dist, cam3_dist, cam4_dist, cam5_dist, cam6_dist])
-    X1 = np.array([cam1_dist, cam2_dist, cam3_dist, fake4_dist, cam5_dist, cam6_dist])
-    X2 = np.array([cam1_dist, cam2_dist, fake3_dist, fake4_dist, cam5_dist, cam6_dist])
-    X3 = np.array([cam1_dist, fake2_dist, fake3_dist, fake4_dist, cam5_dist, cam6_dist])
-    
-    return clusterHelper(X0, X1, X2, X3, thresh, result)
-    
-    
-    
+    X = sequenceFeatures(streams, 'pca', num_pcs, random_state=random_state, estimator=estimator)
+    return clusterHelper(X, thresh)
+
 
+def participantCell(streams, thresh, num_pcs, random_state, estimator, compact=False):
+    streams = asArray(streams)
+    if compact:
+        streams = streams.astype(np.float32, copy=False)
+    resultPCA = socialVerificationOnlyPCA(streams, thresh, num_pcs, random_state, estimator)
+    resultSimple = socialVerificationNoPCA(streams, thresh)
+    return resultPCA, resultSimple
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description='DeepFake Detection Experiment')
 
-    parser.add_argument('--data-dir', type=str, default='Data',
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
                     help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py); participants missing from it are converted on first use')
     parser.add_argument('--num_pcs', type=int, default=5,
                     help='Number of principal components to use')
     parser.add_argument('--threshold', type=float, default=1.3,
                     help='Cluster threshold')
     parser.add_argument('--num_participants', type=int, default=25,
                     help='Number of participants')
+    parser.add_argument('--compact', action='store_true',
+                    help='Memory-bounded mode: float32 landmarks in one array, PCA and wavelets in float32 '
+                    '(distances and clustering stay float64)')
+    parser.add_argument('--align', type=str, default='none', choices=['none', 'offset', 'drift'],
+                    help='Re-index the cameras onto cam1\'s frames before detection, by the cross-correlation of '
+                    'their mouth opening: a start offset per camera, or an offset and a linear clock drift')
+    parser.add_argument('--landmark-layout', type=str, default='blocks', choices=sorted(LAYOUTS),
+                    help='Order of the landmark coordinates in a frame: x0..x19 then y0..y19 (blocks), or '
+                    'x0, y0, x1, ... (interleaved)')
+    parser.add_argument('--seed', type=int, default=0,
+                    help='Random state for the MCD estimator')
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS),
+                    help='Covariance estimator for the Mahalanobis distances')
+    parser.add_argument('--jobs', type=int, default=1,
+                    help='Number of worker processes to spread the participants over')
+    parser.add_argument('--timings', type=str, default=None,
+                    help='Time the pipeline stages and append JSON-lines records (one per participant and run) to this file')
+    parser.add_argument('--profile', type=str, default=None,
+                    help='Write a cProfile dump of the run here (with --jobs, workers write <profile>.<pid>)')
+    parser.add_argument('--no-progress', dest='progress', action='store_false',
+                    help='Do not draw the progress bar')
     
     
     args = parser.parse_args()
@@ -175,6 +109,14 @@ def parse_args():
 
 def main():
     args = parse_args()
+    with instrument.profiled(args.profile):
+        run(args)
+
+
+def run(args):
+    t0 = time.perf_counter()
+    if args.timings is not None:
+        instrument.enable(args.timings)
     
     # There is no data for ID 17
     if args.num_participants >= 17:
@@ -185,35 +127,60 @@ def main():
         averageSimple = np.zeros((args.num_participants, 4))
         
     
-    for i in range(args.num_participants):
-        
-        # There is no data for ID 17
-        if i == 16:
-            continue
-        
-        args.data_dir = 'data/Processed-Landmarks/'
-        data2 = loadmat(os.path.join(args.data_dir, f'mouth-data-fake2-ID{i+1}.mat'))
-        data3 = loadmat(os.path.join(args.data_dir, f'mouth-data-fake3-ID{i+1}.mat'))
-        data4 = loadmat(os.path.join(args.data_dir, f'mouth-data-fake4-ID{i+1}.mat'))
+    people = participantIDs(args.num_participants)
+    shared = []
+    cells = []
+    loads = []
+    for i in people:
+        #The features are fitted to the whole sequence, so the whole
+        #recording is read (a memory map with --cache-dir)
+        with stage('load'):
+            streams = loadStreams(args.data_dir, i, cache_dir=args.cache_dir,
+                                  dtype=np.float32 if args.compact else None)
+        if args.align != 'none':
+            with stage('align'):
+                streams, _ = alignParticipant(streams, args.align == 'drift', args.landmark_layout)
+        loads.append(instrument.takeStages())
+        if args.jobs > 1:
+            #The cache holds the streams as recorded, not aligned
+            if args.cache_dir is not None and args.align == 'none':
+                streams = MappedArray(args.cache_dir, i)
+            else:
+                streams = SharedArray(streams)
+                shared.append(streams)
+        cells.append((streams, args.threshold, args.num_pcs, args.seed, args.estimator, args.compact))
+    
+    #Workers time their own stages and hand them back with the results
+    func = Instrumented(participantCell, args.timings is not None, args.profile if args.jobs > 1 else None)
+    bar = Progress(len(cells), 'Participants') if args.progress else None
+    try:
+        results = runCells(func, cells, args.jobs, done = bar.update if bar else None)
+    finally:
+        for streams in shared:
+            streams.release()
+    if bar is not None:
+        bar.close()
+    
+    totals = {}
+    for person, (i, ((resultPCA, resultSimple), stages, seconds)) in enumerate(zip(people, results)):
+        stages = instrument.mergeStages(loads[person], stages)
+        totals = instrument.mergeStages(totals, stages)
+        instrument.record('participant', script='full_sequence_exp', participant=i,
+                          estimator=args.estimator, seconds=seconds, stages=stages)
+        print(f'Iteration: {i}. PCA Result: {resultPCA}')
+        print(f'Iteration: {i}. SimpleMethod Result: {resultSimple}')
         
-        resultPCA = socialVerificationOnlyPCA(data2,data3,data4,args.threshold, args.num_pcs)
-        
-        resultSimple = socialVerificationNoPCA(data2,data3,data4, args.threshold)
-        
-        print(f'Iteration: {i+1}. PCA Result: {resultPCA}')
-        print(f'Iteration: {i+1}. SimpleMethod Result: {resultSimple}')
-        
-        # There is no data for ID 17
-        if i > 16:
-            averagePCA[i-1] = resultPCA
-            averageSimple[i-1] = resultSimple
-            
-        else:
-            averagePCA[i] = resultPCA
-            averageSimple[i] = resultSimple
+        averagePCA[person] = resultPCA
+        averageSimple[person] = resultSimple
         
     print(f'Average accuracy PCA: {np.mean(averagePCA, axis = 0)}')
     print(f'Average accuracy No PCA: {np.mean(averageSimple, axis = 0)}')
+    
+    instrument.record('run', script='full_sequence_exp', participants=people, jobs=args.jobs,
+                      seconds=time.perf_counter() - t0, totals=totals)
+    if instrument.enabled():
+        instrument.summary(totals)
+        instrument.disable()
 
 
 
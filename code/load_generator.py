@@ -0,0 +1,227 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Load generator for the verification service (serve.py). Every participant
+# is replayed --rounds times as events of six simulated phones, which upload
+# their landmark streams concurrently over --phones keep-alive connections;
+# event k has camera 2, 3 or 4 replaced by its fake (or none, in turn). A
+# poller fetches the verdicts as they come.
+#
+# Reports requests per second, p50/p99 latency of the uploads and of the
+# verdicts (from an event's last upload being accepted to its result being
+# seen, and the service's own queue + compute time), the uploads refused by
+# backpressure, the events whose result expired before it was fetched (lost),
+# and whether each verdict flagged exactly the faked camera.
+# Without --port the service is started in this process with the options of
+# serve.py.
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import numpy as np
+
+from serve import makeService, serviceArgs
+from socialverify.detect import isPartition
+from socialverify.landmarks import STREAMS, participantIDs, loadStreams
+from socialverify.service import Client, encodeStream
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': None, 'p99': None}
+    return {'p50': float(np.percentile(values, 50)), 'p99': float(np.percentile(values, 99))}
+
+
+def makeEvents(args):
+    # [(event, fake camera or None, [(camera, .npy bytes)])]
+    events = []
+    for i in participantIDs(args.num_participants):
+        streams = loadStreams(args.data_dir, i, cache_dir=args.cache_dir)
+        if args.max_frames is not None:
+            streams = streams[:, :args.max_frames]
+        for r in range(args.rounds):
+            fake = (None, 2, 3, 4)[len(events) % 4]
+            uploads = [(str(c), encodeStream(streams[STREAMS.index(f'fake{c}')] if c == fake else streams[c - 1]))
+                       for c in range(1, 7)]
+            events.append((f'p{i}-r{r}', fake, uploads))
+    return events
+
+
+class LoadGenerator:
+
+    def __init__(self, host, port, events, phones, poll, retry_wait):
+        self.host, self.port = host, port
+        self.events = events
+        self.phones = phones
+        self.poll = poll
+        self.retry_wait = retry_wait
+        self.uploadLatency = []
+        self.requests = 0
+        self.rejected = 0
+        self.completed = {}
+        self.results = {}
+        self.lost = set()
+
+    async def send(self, client, method, path, body=b''):
+        self.requests += 1
+        return await client.request(method, path, body)
+
+    async def phone(self, work):
+        client = Client(self.host, self.port)
+        try:
+            while not work.empty():
+                event, camera, body, remaining = work.get_nowait()
+                while True:
+                    t0 = time.perf_counter()
+                    status, payload, _ = await self.send(client, 'POST', f'/events/{event}/cameras/{camera}', body)
+                    if status != 503:
+                        break
+                    self.rejected += 1
+                    await asyncio.sleep(self.retry_wait)
+                if status != 202:
+                    raise RuntimeError(f'upload {event}/{camera} failed with {status}: {payload}')
+                self.uploadLatency.append(time.perf_counter() - t0)
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    self.completed[event] = time.perf_counter()
+        finally:
+            await client.close()
+
+    async def poller(self, done):
+        client = Client(self.host, self.port)
+        try:
+            while not (done.is_set() and len(self.results) + len(self.lost) == len(self.completed)):
+                for event in [e for e in self.completed if e not in self.results and e not in self.lost]:
+                    status, payload, _ = await self.send(client, 'GET', f'/events/{event}')
+                    if status == 404:
+                        #dropped by the service (--keep-seconds) before we saw it
+                        self.lost.add(event)
+                    elif payload['state'] in ('done', 'failed'):
+                        self.results[event] = (time.perf_counter() - self.completed[event], payload)
+                await asyncio.sleep(self.poll)
+        finally:
+            await client.close()
+
+    async def run(self):
+        work = asyncio.Queue()
+        for event, _, uploads in self.events:
+            remaining = [len(uploads)]
+            for camera, body in uploads:
+                work.put_nowait((event, camera, body, remaining))
+        done = asyncio.Event()
+        t0 = time.perf_counter()
+        poller = asyncio.create_task(self.poller(done))
+        await asyncio.gather(*[self.phone(work) for _ in range(self.phones)])
+        uploadSeconds = time.perf_counter() - t0
+        done.set()
+        await poller
+        return uploadSeconds, time.perf_counter() - t0
+
+    def report(self, uploadSeconds, seconds):
+        verdictLatency = [latency for latency, _ in self.results.values()]
+        serviceLatency = [p['latency'] for _, p in self.results.values() if 'latency' in p]
+        correct, failed = [], 0
+        for event, fake, _ in self.events:
+            if event not in self.results:
+                continue
+            payload = self.results[event][1]
+            if payload['state'] == 'failed':
+                failed += 1
+                continue
+            result = payload['result']
+            cameras = result['cameras']
+            trueFakes = [] if fake is None else [cameras.index(str(fake))]
+            fakes = [cameras.index(c) for c in result['fakes']]
+            correct.append(isPartition(fakes, trueFakes, len(cameras)))
+        uploads = sum(len(uploads) for _, _, uploads in self.events)
+        return {'events': len(self.events), 'uploads': uploads, 'requests': self.requests,
+                'rejected': self.rejected, 'failed': failed, 'lost': len(self.lost), 'seconds': seconds,
+                'upload_seconds': uploadSeconds, 'requests_per_second': self.requests / seconds,
+                'uploads_per_second': uploads / uploadSeconds, 'events_per_second': len(self.events) / seconds,
+                'upload_latency': percentiles(self.uploadLatency),
+                'verdict_latency': percentiles(verdictLatency),
+                'service_latency': percentiles(serviceLatency),
+                'accuracy': float(np.mean(correct)) if correct else None}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay landmark files against the verification service')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py)')
+    parser.add_argument('--num_participants', type=int, default=25,
+                    help='Number of participants')
+    parser.add_argument('--rounds', type=int, default=1,
+                    help='Events per participant')
+    parser.add_argument('--max-frames', type=int, default=None)
+    parser.add_argument('--phones', type=int, default=12,
+                    help='Concurrent uploading connections')
+    parser.add_argument('--poll', type=float, default=0.01,
+                    help='Seconds between result polls')
+    parser.add_argument('--retry-wait', type=float, default=0.05,
+                    help='Seconds to wait before retrying a refused upload')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None,
+                    help='Port of a running service; without it one is started in this process')
+    parser.add_argument('--out', type=str, default=None,
+                    help='Where to write the report as JSON')
+    serviceArgs(parser)
+
+    args = parser.parse_args()
+    return args
+
+
+async def generate(args, events):
+    service = None
+    host, port = args.host, args.port
+    if port is None:
+        service = makeService(args)
+        host, port = await service.start(args.host, 0)
+    try:
+        generator = LoadGenerator(host, port, events, args.phones, args.poll, args.retry_wait)
+        report = generator.report(*await generator.run())
+        client = Client(host, port)
+        report['service'] = (await client.request('GET', '/status'))[1]
+        await client.close()
+    finally:
+        if service is not None:
+            await service.stop()
+    return report
+
+
+def main():
+    args = parse_args()
+    events = makeEvents(args)
+    report = asyncio.run(generate(args, events))
+
+    print(f'{report["events"]} events, {report["uploads"]} uploads, {report["requests"]} requests in '
+          f'{report["seconds"]:.2f}s: {report["requests_per_second"]:.1f} req/s, '
+          f'{report["uploads_per_second"]:.1f} uploads/s, {report["events_per_second"]:.2f} events/s')
+    for name in ('upload_latency', 'verdict_latency', 'service_latency'):
+        p = report[name]
+        if p['p50'] is not None:
+            print(f'{name.replace("_", " ")}: p50 {1e3 * p["p50"]:.1f}ms, p99 {1e3 * p["p99"]:.1f}ms')
+    print(f'Refused uploads (backpressure): {report["rejected"]}. Failed events: {report["failed"]}. '
+          f'Lost (expired before fetched): {report["lost"]}. '
+          f'Batches: {report["service"]["batches"]}. Accuracy: {report["accuracy"]}')
+
+    if args.out is not None:
+        outDir = os.path.dirname(args.out)
+        if outDir and not os.path.exists(outDir):
+            os.makedirs(outDir)
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Peak memory and accuracy of the --compact mode against the default one.
+#
+# For every participant, experiment (full sequence cell, first --num-windows
+# windows of the sliding window sweep) and mode, a fresh process loads the
+# participant and runs the experiment, and reports its peak RSS: over the
+# whole process, and above the RSS it had after the imports (the part that
+# grows with the recording). --tile repeats every recording along time, to
+# see how that part scales towards hour-long recordings.
+#
+# Accuracy is compared on the same runs: the full sequence results (0-3
+# fakes cases, PCA and no-PCA), and for the windows the detected number of
+# fakes per window, the window accuracy and the largest change of a ratio.
+
+import argparse
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+
+from full_sequence_exp import participantCell
+from window_acc_exp import waveletScores, windowScores
+from socialverify.detect import detectFakes
+from socialverify.estimators import ESTIMATORS
+from socialverify.landmarks import loadStreams, participantIDs
+from socialverify.scoring import scoreWindows, windowRates
+
+MODES = ('default', 'compact')
+
+
+def peakRSS():
+    # In MB; ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def tileStreams(streams, n):
+    out = np.empty((streams.shape[0], n * streams.shape[1], streams.shape[2]), dtype=streams.dtype)
+    for k in range(n):
+        out[:, k * streams.shape[1]:(k + 1) * streams.shape[1]] = streams
+    return out
+
+
+def measure(experiment, args, person, compact):
+    # Runs in its own process: (result, RSS after imports, peak RSS, seconds)
+    rss0 = peakRSS()
+    t0 = time.perf_counter()
+    dtype = np.float32 if compact else None
+    camsFrom = 2 if experiment == 'full' else 3
+    streams = loadStreams(args.data_dir, person, camsFrom, cache_dir=args.cache_dir, dtype=dtype)
+    if args.tile > 1:
+        streams = tileStreams(streams, args.tile)
+    if experiment == 'full':
+        result = participantCell(streams, args.threshold, args.num_pcs, args.seed, args.estimator, compact)
+    else:
+        numWin = min(args.num_windows, streams.shape[1] - args.window_size)
+        if args.features == 'wavelet':
+            ratios, labels = waveletScores(streams, args.window_size, compact=compact, numWin=numWin)
+        else:
+            ratios, labels = windowScores(streams, args.window_size, args.num_pcs, args.pca_engine, args.seed,
+                                          args.estimator, compact=compact, numWin=numWin)
+        result = ratios, labels, streams.shape[1] // 3
+    return result, rss0, peakRSS(), time.perf_counter() - t0
+
+
+def isolated(*cell):
+    # measure(*cell) in a fresh process, so every peak RSS is its own
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(measure, *cell).result()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Memory and accuracy report of the compact mode')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py)')
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--num_participants', type=int, default=25,
+                    help='Number of participants')
+    parser.add_argument('--experiments', nargs='+', default=['full', 'window'], choices=['full', 'window'])
+    parser.add_argument('--threshold', type=float, default=1.3,
+                    help='Cluster threshold')
+    parser.add_argument('--window-size', type=int, default=250)
+    parser.add_argument('--num-windows', type=int, default=50,
+                    help='Number of window starts per participant to evaluate')
+    parser.add_argument('--features', type=str, default='pca', choices=['pca', 'wavelet'],
+                    help='Per-window features of the window experiment')
+    parser.add_argument('--pca-engine', type=str, default='rolling', choices=['rolling', 'batched', 'refit'])
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS))
+    parser.add_argument('--tile', type=int, default=1,
+                    help='Repeat every recording this many times along time')
+    parser.add_argument('--seed', type=int, default=0,
+                    help='Random state for the MCD estimator')
+    parser.add_argument('--out', type=str, default='results/memory_report.json',
+                    help='Where to write the per-participant results')
+
+    args = parser.parse_args()
+    return args
+
+
+def compareFull(results):
+    (pca, simple), (pcaC, simpleC) = results['default'], results['compact']
+    return {'pca': pca[0].tolist(), 'pca_compact': pcaC[0].tolist(),
+            'simple': simple[0].tolist(), 'simple_compact': simpleC[0].tolist(),
+            'agree': bool(np.array_equal(pca, pcaC) and np.array_equal(simple, simpleC))}
+
+
+def compareWindows(results, args):
+    out = {}
+    numFakes = {}
+    for mode, (ratios, labels, intervalWin) in results.items():
+        numFakes[mode] = detectFakes(ratios, labels, args.threshold)
+        _, _, acc = windowRates(scoreWindows(ratios, labels, intervalWin, args.threshold, args.window_size))
+        out['acc' if mode == 'default' else 'acc_compact'] = acc[0].tolist()
+    ratios, ratiosC = results['default'][0], results['compact'][0]
+    out['ratio_max_rel_err'] = float(np.max(np.abs(ratiosC - ratios) / np.abs(ratios)))
+    out['verdict_agreement'] = float(np.mean(numFakes['default'] == numFakes['compact']))
+    return out
+
+
+def main():
+    args = parse_args()
+    report = {e: [] for e in args.experiments}
+
+    for i in participantIDs(args.num_participants):
+        for experiment in args.experiments:
+            entry = {'participant': i}
+            results = {}
+            for mode in MODES:
+                result, rss0, peak, seconds = isolated(experiment, args, i, mode == 'compact')
+                results[mode] = result
+                entry[mode] = {'rss_after_imports': rss0, 'peak_rss': peak, 'seconds': seconds}
+            entry.update(compareFull(results) if experiment == 'full' else compareWindows(results, args))
+            report[experiment].append(entry)
+            print(f'ID: {i}. {experiment}: peak RSS {entry["default"]["peak_rss"]:.0f} MB -> '
+                  f'{entry["compact"]["peak_rss"]:.0f} MB')
+
+    print(f'{"experiment":<10} {"peak MB":>9} {"compact":>9} {"grown MB":>9} {"compact":>9} '
+          f'{"saved":>6}  accuracy')
+    for experiment, entries in report.items():
+        peak = {m: np.mean([e[m]['peak_rss'] for e in entries]) for m in MODES}
+        grown = {m: np.mean([e[m]['peak_rss'] - e[m]['rss_after_imports'] for e in entries]) for m in MODES}
+        saved = 1 - grown['compact'] / grown['default'] if grown['default'] > 0 else 0.0
+        if experiment == 'full':
+            accuracy = (f'PCA {np.round(np.mean([e["pca"] for e in entries], axis = 0), 3)} -> '
+                        f'{np.round(np.mean([e["pca_compact"] for e in entries], axis = 0), 3)}, '
+                        f'no PCA {np.round(np.mean([e["simple"] for e in entries], axis = 0), 3)} -> '
+                        f'{np.round(np.mean([e["simple_compact"] for e in entries], axis = 0), 3)}')
+        else:
+            accuracy = (f'{np.round(np.mean([e["acc"] for e in entries], axis = 0), 3)} -> '
+                        f'{np.round(np.mean([e["acc_compact"] for e in entries], axis = 0), 3)}, '
+                        f'verdicts agree {np.mean([e["verdict_agreement"] for e in entries]):.3f}, '
+                        f'ratio rel err <= {np.max([e["ratio_max_rel_err"] for e in entries]):.1e}')
+        print(f'{experiment:<10} {peak["default"]:9.1f} {peak["compact"]:9.1f} {grown["default"]:9.1f} '
+              f'{grown["compact"]:9.1f} {100 * saved:5.0f}%  {accuracy}')
+
+    outDir = os.path.dirname(args.out)
+    if outDir and not os.path.exists(outDir):
+        os.makedirs(outDir)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
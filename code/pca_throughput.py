@@ -0,0 +1,89 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Throughput of the per-window scaler + PCA step: the sklearn loop of the
+# original scripts (one StandardScaler and PCA per stream per window)
+# against socialverify.batched, on the spliced streams of one participant.
+# Also checks that the batched scores match sklearn's up to the sign of each
+# component.
+
+import argparse
+import time
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+
+from socialverify.batched import iterBatchedScores
+from socialverify.landmarks import loadStreams
+from window_acc_exp import spliceStreams
+
+
+def sklearnScores(streams, j, num_pcs, numWin):
+    out = np.zeros((len(streams), numWin, j, num_pcs))
+    for start in range(numWin):
+        for k, cam in enumerate(streams):
+            out[k, start] = PCA(num_pcs).fit_transform(StandardScaler().fit_transform(cam[start:start + j]))
+    return out
+
+
+def signAligned(a, b):
+    # Flip the components of a to the signs of b's
+    signs = np.sign(np.sum(a * b, axis=-2, keepdims=True))
+    return a * np.where(signs == 0, 1, signs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Batched vs. per-window PCA throughput')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py)')
+    parser.add_argument('--id', type=int, default=1,
+                    help='Participant to use')
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--window-size', type=int, default=250)
+    parser.add_argument('--num-windows', type=int, default=200,
+                    help='Number of window starts to reduce')
+    parser.add_argument('--chunks', nargs='+', type=int, default=[32, 128, 512],
+                    help='Chunk sizes (windows per stacked call) to try')
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    streams, _ = spliceStreams(loadStreams(args.data_dir, args.id, camsFrom=3, cache_dir=args.cache_dir))
+    j = args.window_size
+    numWin = min(args.num_windows, streams[0].shape[0] - j)
+    streams = np.stack(streams)
+    numFits = len(streams) * numWin
+
+    t0 = time.perf_counter()
+    reference = sklearnScores(streams, j, args.num_pcs, numWin)
+    loopSeconds = time.perf_counter() - t0
+    print(f'{"method":<8} {"chunk":>6} {"windows/s":>10} {"speedup":>8} {"max abs err":>12}')
+    print(f'{"sklearn":<8} {"-":>6} {numFits / loopSeconds:10.0f} {1.0:8.1f} {0.0:12.2e}')
+
+    for method in ('eigh', 'svd'):
+        for chunk in args.chunks:
+            out = np.zeros_like(reference)
+            t0 = time.perf_counter()
+            for block, scores in iterBatchedScores(streams, j, args.num_pcs, chunk=chunk, method=method,
+                                                   starts=range(numWin)):
+                out[:, block] = scores
+            seconds = time.perf_counter() - t0
+            err = np.max(np.abs(signAligned(out, reference) - reference))
+            print(f'{method:<8} {chunk:>6} {numFits / seconds:10.0f} {loopSeconds / seconds:8.1f} {err:12.2e}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Accuracy over every fake placement (socialverify.placements) instead of the
+# fixed X1..X3 cases of full_sequence_exp.py: each subset of the cameras
+# that have a fake swapped for it. The landmark data has fakes for cameras
+# 2, 3 and 4 only, so that is 8 placements; --synthetic generates
+# participants with a fake of every camera, for all 64 placements of 6.
+#
+# Per participant, the features of the real and fake streams (PCA +
+# Mahalanobis distances, or the haar wavelets of the no-PCA method) and their
+# pairwise distances are computed once, over the whole sequence or, with
+# --window-size, every --stride frames. Prints the accuracy of every
+# placement and by number of fakes, per threshold. --naive also runs the
+# per-placement recomputation (features of the placement's six streams,
+# then detectSplit) to check the results and compare the time.
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from socialverify.detect import detectSplit, isPartition, trackingFailures
+from socialverify.estimators import ESTIMATORS
+from socialverify.landmarks import FAKE_CAMS, loadStreams, participantIDs
+from socialverify.placements import allPlacements, featureDistances, placementCorrect, placementRows, \
+    placementScores
+from socialverify.synthetic import syntheticCameras
+from socialverify.verify import sequenceFeatures, windowFeatures
+
+NUM_CAMS = 6
+
+
+def participantStreams(args, i):
+    # (numCams + len(fakeCams), frames, features) streams and fakeCams
+    if args.synthetic:
+        streams, fakes = syntheticCameras(NUM_CAMS, args.length, fakeCams=tuple(range(1, NUM_CAMS + 1)), seed=i)
+        return np.concatenate([streams, fakes]), tuple(range(1, NUM_CAMS + 1))
+    return loadStreams(args.data_dir, i, cache_dir=args.cache_dir), FAKE_CAMS
+
+
+def streamFeatures(args, streams):
+    return sequenceFeatures(streams, args.features, args.num_pcs, random_state=args.seed, estimator=args.estimator)
+
+
+def windowDistances(args, streams):
+    # (numWin, numStreams, numStreams) feature distances of every window
+    windows = windowFeatures(streams, args.window_size, num_pcs=args.num_pcs, random_state=args.seed,
+                             estimator=args.estimator)
+    starts = range(0, streams.shape[1] - args.window_size + 1, args.stride)
+    D = [featureDistances(X, ~trackingFailures(X[:NUM_CAMS])) for X in windows(starts)]
+    return np.array(D)
+
+
+def naiveCorrect(args, streams, fakeCams, placements):
+    # Recompute the six streams' features for every placement
+    out = np.zeros((len(args.thresholds), len(placements)), dtype=bool)
+    keep = ~trackingFailures(streamFeatures(args, streams[:NUM_CAMS]))
+    for p, placement in enumerate(placements):
+        rows = placementRows(NUM_CAMS, fakeCams, [placement])[0]
+        X = streamFeatures(args, streams[rows])
+        for t, thresh in enumerate(args.thresholds):
+            numFakes, fakes, _ = detectSplit(X[:, keep], thresh)
+            out[t, p] = numFakes == len(placement) and isPartition(fakes, [c - 1 for c in placement], NUM_CAMS)
+    return out
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Accuracy over every fake placement')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py)')
+    parser.add_argument('--num_participants', type=int, default=25,
+                    help='Number of participants')
+    parser.add_argument('--synthetic', action='store_true',
+                    help='Synthetic participants with a fake of every camera (all 64 placements)')
+    parser.add_argument('--length', type=int, default=1000,
+                    help='Frames per synthetic participant')
+    parser.add_argument('--features', type=str, default='pca', choices=['pca', 'wavelet'])
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[1.3, 1.5])
+    parser.add_argument('--window-size', type=int, default=None,
+                    help='Evaluate windows of this size instead of the whole sequence (pca features)')
+    parser.add_argument('--stride', type=int, default=30,
+                    help='Frames between window starts')
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS))
+    parser.add_argument('--seed', type=int, default=0,
+                    help='Random state for the MCD estimator')
+    parser.add_argument('--naive', action='store_true',
+                    help='Also recompute the features per placement, to check and time against')
+    parser.add_argument('--out', type=str, default='results/placement_exp.json',
+                    help='Where to write the per-participant results')
+
+    args = parser.parse_args()
+    if args.window_size is not None and args.features != 'pca':
+        parser.error('--window-size needs --features pca')
+    if args.window_size is not None and args.naive:
+        parser.error('--naive compares whole sequences only')
+    return args
+
+
+def main():
+    args = parse_args()
+    report = []
+    correct = []
+
+    for i in participantIDs(args.num_participants):
+        streams, fakeCams = participantStreams(args, i)
+        placements = allPlacements(fakeCams)
+        rows = placementRows(NUM_CAMS, fakeCams, placements)
+        t0 = time.perf_counter()
+        if args.window_size is None:
+            features = streamFeatures(args, streams)
+            D = featureDistances(features, ~trackingFailures(features[:NUM_CAMS]))
+        else:
+            D = windowDistances(args, streams)
+        featureSeconds = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        ratios, labels = placementScores(D, rows)
+        ok = placementCorrect(ratios, labels, placements, args.thresholds)
+        if ok.ndim == 3:
+            ok = ok.mean(axis=1)
+        detectSeconds = time.perf_counter() - t0
+        entry = {'participant': i, 'placements': [list(p) for p in placements], 'correct': ok.tolist(),
+                 'feature_seconds': featureSeconds, 'detect_seconds': detectSeconds}
+        message = (f'ID: {i}. {len(placements)} placements: features {featureSeconds:.2f}s, '
+                   f'detection {1e3 * detectSeconds:.1f}ms')
+        if args.naive:
+            t0 = time.perf_counter()
+            naive = naiveCorrect(args, streams, fakeCams, placements)
+            entry['naive_seconds'] = time.perf_counter() - t0
+            entry['naive_agrees'] = bool(np.array_equal(naive, ok))
+            message += f', naive {entry["naive_seconds"]:.2f}s (agrees: {entry["naive_agrees"]})'
+        print(message)
+        report.append(entry)
+        correct.append(ok)
+
+    correct = np.array(correct)
+    sizes = np.array([len(p) for p in placements])
+    for t, thresh in enumerate(args.thresholds):
+        acc = correct[:, t].mean(axis=0)
+        print(f'Threshold {thresh}')
+        print(f'  {"placement":<36} accuracy')
+        for p, placement in enumerate(placements):
+            name = ', '.join(f'cam{c}' for c in placement) or 'none'
+            print(f'  {name:<36} {acc[p]:.3f}')
+        byFakes = ', '.join(f'{k}: {acc[sizes == k].mean():.3f}' for k in np.unique(sizes))
+        print(f'  {"by number of fakes":<36} {byFakes}; all placements {acc.mean():.3f}')
+
+    outDir = os.path.dirname(args.out)
+    if outDir and not os.path.exists(outDir):
+        os.makedirs(outDir)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
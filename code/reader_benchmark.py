@@ -0,0 +1,192 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Time to first verdict and peak memory of the lazy landmark reader on a long
+# synthetic recording.
+#
+# Writes a participant of --hours of seeded synthetic landmarks at --fps as
+# MATLAB v7.3 files (mouth-data-fake{2,3,4}-ID1.mat, chunked by --chunk
+# frames; kept and reused while the length matches), then, each in a fresh
+# process, runs the streaming detector over camera 1..6 until --verdicts
+# verdicts are out:
+#   eager  reads the whole recording first (ParticipantReader.read, what
+#          loadStreams does)
+#   lazy   reads it in blocks of --block frames as the detector goes
+#          (streamBlocks)
+#   v5     the original loadmat path on v5 copies of the files (--v5)
+# and reports the seconds to the first verdict, the RSS at that point and the
+# peak RSS, each above the process's RSS after the imports.
+
+import argparse
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from scipy.io import savemat
+
+from socialverify.estimators import ESTIMATORS
+from socialverify.landmarks import ParticipantReader, loadParticipant, participantFiles, streamBlocks, \
+    _stackStreams
+from socialverify.reader import Mat73Writer, MatReader
+from socialverify.streaming import StreamingDetector
+from socialverify.synthetic import syntheticParticipant
+
+PIECE = 9000
+
+
+def peakRSS():
+    # In MB. VmHWM, as ru_maxrss carries over the peak of the parent that
+    # spawned the process (which wrote the recording)
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def recordingPieces(frames, seed):
+    # The recording as (start, (9, n, 40)) pieces of 5 minutes at 30fps,
+    # generated one at a time
+    for start in range(0, frames, PIECE):
+        yield start, syntheticParticipant(min(PIECE, frames - start), seed=seed + start)
+
+
+def writeRecording(out_dir, frames, chunk, seed, v5=False):
+    paths = participantFiles(out_dir, 1)
+    if all(os.path.exists(p) for p in paths.values()):
+        with MatReader(paths[2]) as f:
+            if f.hdf5 and f.shape('cam1')[0] == frames:
+                return
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    names = [f'cam{c}' for c in range(1, 7)] + ['fake']
+    writers = {k: Mat73Writer(p, names, frames, 40, chunk) for k, p in paths.items()}
+    for start, piece in recordingPieces(frames, seed):
+        for k, w in writers.items():
+            for c in range(6):
+                w.write(names[c], start, piece[c])
+            w.write('fake', start, piece[4 + k])
+    for w in writers.values():
+        w.close()
+
+
+def writeV5(out_dir, v5_dir):
+    # v5 copies of the v7.3 files, one file in memory at a time
+    if not os.path.exists(v5_dir):
+        os.makedirs(v5_dir)
+    for k, path in participantFiles(out_dir, 1).items():
+        target = participantFiles(v5_dir, 1)[k]
+        if os.path.exists(target) and os.path.getmtime(target) > os.path.getmtime(path):
+            continue
+        with MatReader(path) as f:
+            savemat(target, {name: f.read(name) for name in f.variables})
+
+
+def measure(mode, args, data_dir):
+    # Runs in its own process
+    rss0 = peakRSS()
+    t0 = time.perf_counter()
+    if mode == 'lazy':
+        frames = (block[:6, t] for _, block in streamBlocks(data_dir, 1, block=args.block)
+                  for t in range(block.shape[1]))
+    else:
+        if mode == 'eager':
+            with ParticipantReader(data_dir, 1) as reader:
+                streams = reader.read()
+        else:
+            streams = _stackStreams(loadParticipant(data_dir, 1), 2)
+        frames = (streams[:6, t] for t in range(streams.shape[1]))
+    detector = StreamingDetector(6, 40, args.window_size, args.stride, args.num_pcs, args.threshold,
+                                 estimator=args.estimator)
+    first, firstRSS, verdicts = None, None, 0
+    for frame in frames:
+        if detector.push(frame) is None:
+            continue
+        verdicts += 1
+        if first is None:
+            first, firstRSS = time.perf_counter() - t0, peakRSS()
+        if verdicts == args.verdicts:
+            break
+    return {'first_verdict_seconds': first, 'seconds': time.perf_counter() - t0,
+            'rss_after_imports': rss0, 'first_verdict_rss': firstRSS - rss0, 'peak_rss': peakRSS() - rss0}
+
+
+def isolated(*cell):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(measure, *cell).result()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Time to first verdict and memory of the lazy reader')
+
+    parser.add_argument('--out-dir', type=str, default='results/long-recording',
+                    help='Where the synthetic recording is written')
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--chunk', type=int, default=1024,
+                    help='HDF5 chunk size of the recording, in frames')
+    parser.add_argument('--block', type=int, default=1024,
+                    help='Frames read at a time in lazy mode')
+    parser.add_argument('--verdicts', type=int, default=10,
+                    help='Verdicts to run per mode')
+    parser.add_argument('--v5', action='store_true',
+                    help='Also time the loadmat path on v5 copies of the recording')
+    parser.add_argument('--window-size', type=int, default=250)
+    parser.add_argument('--stride', type=int, default=30)
+    parser.add_argument('--threshold', type=float, default=1.3,
+                    help='Cluster threshold')
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=str, default=None,
+                    help='Where to write the results as JSON')
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    frames = int(args.hours * 3600 * args.fps)
+    t0 = time.perf_counter()
+    writeRecording(args.out_dir, frames, args.chunk, args.seed)
+    print(f'Recording: {frames} frames x 9 streams ({args.hours}h at {args.fps}fps), '
+          f'{sum(os.path.getsize(p) for p in participantFiles(args.out_dir, 1).values()) / 2**20:.0f}MB '
+          f'on disk, ready in {time.perf_counter() - t0:.1f}s')
+
+    cells = [('eager', args.out_dir), ('lazy', args.out_dir)]
+    if args.v5:
+        v5_dir = os.path.join(args.out_dir, 'v5')
+        writeV5(args.out_dir, v5_dir)
+        cells.append(('v5', v5_dir))
+
+    report = {'frames': frames, 'hours': args.hours}
+    print(f'{"mode":<6} {"first verdict s":>15} {"RSS MB":>8} {"peak MB":>8} {"total s":>8}')
+    for mode, data_dir in cells:
+        r = report[mode] = isolated(mode, args, data_dir)
+        print(f'{mode:<6} {r["first_verdict_seconds"]:15.3f} {r["first_verdict_rss"]:8.1f} '
+              f'{r["peak_rss"]:8.1f} {r["seconds"]:8.2f}')
+
+    if args.out is not None:
+        outDir = os.path.dirname(args.out)
+        if outDir and not os.path.exists(outDir):
+            os.makedirs(outDir)
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Replay harness for socialverify.streaming: feeds a participant's landmark
+# streams to a StreamingDetector as if six phones were pushing frames live at
+# --fps, and reports per-verdict latency, sustained throughput and memory.
+# Latency counts from the time a verdict's last frame was due on the --fps
+# schedule, so a replay that falls behind shows it.
+
+import argparse
+import resource
+import time
+import numpy as np
+
+from socialverify.estimators import ESTIMATORS
+from socialverify.landmarks import STREAMS, streamBlocks
+from socialverify.streaming import StreamingDetector
+
+
+def pacedFrames(frames, fps, clock):
+    # Yield (time due, frame set) with one frame per camera, no faster than
+    # fps (0: as fast as possible, every frame due when it is read) from the
+    # replay's start time clock
+    for n, frame in enumerate(frames):
+        if fps > 0:
+            due = clock + n / fps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            due = time.perf_counter()
+        yield due, frame
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay landmark files through the streaming detector')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py)')
+    parser.add_argument('--id', type=int, default=1,
+                    help='Participant to replay')
+    parser.add_argument('--fakes', nargs='*', type=int, default=[],
+                    help='Cameras (2, 3 or 4) to replace with their fake stream')
+    parser.add_argument('--fps', type=float, default=30,
+                    help='Frame rate of the simulated phones, 0 for as fast as possible')
+    parser.add_argument('--window-size', type=int, default=250)
+    parser.add_argument('--stride', type=int, default=30,
+                    help='Emit a verdict every this many frames')
+    parser.add_argument('--threshold', type=float, default=1.3,
+                    help='Cluster threshold')
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS))
+    parser.add_argument('--max-frames', type=int, default=None)
+    parser.add_argument('--block', type=int, default=1024,
+                    help='Frames read from the landmark files at a time')
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    # Frames are read in blocks as the replay goes, so it starts before a
+    # long recording is read and holds one block at a time
+    rows = [STREAMS.index(f'fake{c}') if c in args.fakes else c - 1 for c in range(1, 7)]
+    blocks = streamBlocks(args.data_dir, args.id, cache_dir=args.cache_dir, block=args.block,
+                          stop=args.max_frames)
+    frames = (block[rows, t] for _, block in blocks for t in range(block.shape[1]))
+
+    detector = None
+    clock = time.perf_counter()
+    latencies = []
+    rss = []
+    for due, frame in pacedFrames(frames, args.fps, clock):
+        if detector is None:
+            detector = StreamingDetector(len(rows), frame.shape[1], args.window_size, args.stride,
+                                         args.num_pcs, args.threshold, estimator=args.estimator)
+        verdict = detector.push(frame, due)
+        if verdict is None:
+            continue
+        latencies.append(verdict.latency)
+        rss.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        print(f'Frame {verdict.frame}: {verdict.numFakes} fakes {list(verdict.fakes)}, '
+              f'ratio {verdict.ratio:.3f}, latency {1e3 * verdict.latency:.1f}ms')
+    elapsed = time.perf_counter() - clock
+
+    if not latencies:
+        print('Stream shorter than the window, no verdicts')
+        return
+    latencies = 1e3 * np.array(latencies)
+    print(f'{detector.count} frames x {len(rows)} cameras in {elapsed:.2f}s: '
+          f'{detector.count / elapsed:.1f} frames/s, {len(latencies) / elapsed:.2f} verdicts/s')
+    print(f'Verdict latency p50 {np.percentile(latencies, 50):.1f}ms, '
+          f'p95 {np.percentile(latencies, 95):.1f}ms, p99 {np.percentile(latencies, 99):.1f}ms, '
+          f'max {latencies.max():.1f}ms')
+    # ru_maxrss is in kilobytes on Linux
+    print(f'Peak RSS after first verdict {rss[0] / 1024:.1f}MB, at the end {rss[-1] / 1024:.1f}MB')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run the event ingestion and verification service (socialverify.service)
+# on --host/--port. Phones upload their landmarks with
+#   curl --data-binary @cam1.npy http://HOST:PORT/events/<event>/cameras/1
+# and fetch the verdict from GET /events/<event>. load_generator.py replays
+# the landmark files against it.
+
+import argparse
+import asyncio
+
+from socialverify.estimators import ESTIMATORS
+from socialverify.service import VerificationService
+
+
+def serviceArgs(parser):
+    # Service options, shared with load_generator.py
+    parser.add_argument('--min-cams', type=int, default=6,
+                    help='Verify an event once this many cameras have uploaded')
+    parser.add_argument('--workers', type=int, default=2,
+                    help='Processes of the verification pool')
+    parser.add_argument('--queue-size', type=int, default=16,
+                    help='Complete events that may wait for the pool before uploads are refused')
+    parser.add_argument('--batch-size', type=int, default=4,
+                    help='Most events sent to a worker at once')
+    parser.add_argument('--max-mb', type=float, default=512,
+                    help='Landmarks held in memory before uploads are refused')
+    parser.add_argument('--mode', type=str, default='full', choices=['full', 'window'])
+    parser.add_argument('--window-size', type=int, default=250)
+    parser.add_argument('--stride', type=int, default=30,
+                    help='Frames between window starts in window mode')
+    parser.add_argument('--threshold', type=float, default=1.3,
+                    help='Cluster threshold')
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS))
+    parser.add_argument('--seed', type=int, default=0,
+                    help='Random state for the MCD estimator')
+    parser.add_argument('--keep-seconds', type=float, default=600,
+                    help='How long the result of a finished event can be fetched')
+    parser.add_argument('--keep-events', type=int, default=10000,
+                    help='Most finished events kept; the oldest are dropped first')
+    parser.add_argument('--collect-seconds', type=float, default=300,
+                    help='Seconds without an upload after which an incomplete event is dropped')
+
+
+def makeService(args):
+    return VerificationService(args.min_cams, args.workers, args.queue_size, args.batch_size,
+                               int(args.max_mb * (1 << 20)), mode=args.mode, num_pcs=args.num_pcs,
+                               thresh=args.threshold, window=args.window_size, stride=args.stride,
+                               seed=args.seed, estimator=args.estimator, keep_seconds=args.keep_seconds,
+                               keep_events=args.keep_events, collect_seconds=args.collect_seconds)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Event ingestion and verification service')
+
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    serviceArgs(parser)
+
+    args = parser.parse_args()
+    return args
+
+
+async def serve(args):
+    service = makeService(args)
+    host, port = await service.start(args.host, args.port)
+    print(f'Listening on http://{host}:{port} ({args.workers} workers, {args.mode} mode)')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.stop()
+
+
+def main():
+    args = parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+# Shared building blocks used by the experiment scripts in ../
+#
+
+from socialverify.verify import verify_sequence, verify_windows
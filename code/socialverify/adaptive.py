@@ -0,0 +1,80 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Coarse-to-fine scan of the sliding window starts.
+#
+# The verdict of a window only changes where the window starts or stops
+# overlapping a faked segment, so long runs of starts give the same answer.
+# adaptiveScan evaluates every `stride`-th start first, then, round by round,
+# the midpoint of every pair of neighbouring evaluated starts whose outputs
+# differ: the number of fakes detected at any of the thresholds, the flagged
+# partition (where both flag fakes), or optionally the linkage ratio by more
+# than a relative ratioTol. Pairs that agree are taken to agree throughout,
+# and the starts between them get the left one's outputs.
+#
+# frameVerdicts and segments turn the window verdicts into per-frame fake /
+# real decisions and their (start, end) runs.
+
+import numpy as np
+from socialverify.detect import detectFakes
+
+
+def _changed(ratios, labels, a, b, threshes, ratioTol):
+    # Whether the outputs at starts a and b (index arrays) differ
+    na = detectFakes(ratios[:, a], labels[:, a], threshes)
+    nb = detectFakes(ratios[:, b], labels[:, b], threshes)
+    changed = np.any(na != nb, axis=(0, 1))
+    la, lb = labels[:, a], labels[:, b]
+    same = np.all(la == lb, axis=-1) | np.all(la == 3 - lb, axis=-1)
+    changed |= np.any((na > 0) & (nb > 0) & ~same, axis=(0, 1))
+    if ratioTol is not None:
+        ra, rb = ratios[:, a], ratios[:, b]
+        changed |= np.any(np.abs(ra - rb) > ratioTol * np.minimum(ra, rb), axis=0)
+    return changed
+
+
+def adaptiveScan(windows, numWin, threshes, stride=32, ratioTol=None):
+    # windows(starts) yields the (ratios (4,), labels (4, numCams)) outputs of
+    # the window starts in the increasing array starts, as
+    # window_acc_exp.clusterWindow does. Returns ratios (4, numWin), labels
+    # (4, numWin, numCams) and the mask of the starts that were evaluated.
+    threshes = np.atleast_1d(threshes)
+    evaluated = np.zeros(numWin, dtype=bool)
+    ratios, labels = None, None
+    todo = np.unique(np.r_[np.arange(0, numWin, stride), numWin - 1]) if numWin else np.zeros(0, int)
+    while len(todo):
+        for start, (r, c) in zip(todo, windows(todo)):
+            if ratios is None:
+                ratios = np.zeros((4, numWin))
+                labels = np.zeros((4, numWin, c.shape[-1]), dtype=np.int32)
+            ratios[:, start], labels[:, start, :] = r, c
+        evaluated[todo] = True
+        done = np.flatnonzero(evaluated)
+        a, b = done[:-1], done[1:]
+        split = (b - a > 1) & _changed(ratios, labels, a, b, threshes, ratioTol)
+        todo = (a[split] + b[split]) // 2
+    if ratios is None:
+        return np.zeros((4, 0)), np.zeros((4, 0, 0), dtype=np.int32), evaluated
+    left = np.maximum.accumulate(np.where(evaluated, np.arange(numWin), 0))
+    return ratios[:, left], labels[:, left], evaluated
+
+
+def frameVerdicts(flagged, window, numFrames):
+    # flagged (..., numWin) window verdicts -> (..., numFrames) frame verdicts:
+    # a frame is fake when most of the windows covering it are flagged
+    numWin = flagged.shape[-1]
+    counts = np.zeros(flagged.shape[:-1] + (numWin + 1,))
+    np.cumsum(flagged, axis=-1, out=counts[..., 1:])
+    frames = np.arange(numFrames)
+    lo = np.clip(frames - window + 1, 0, numWin)
+    hi = np.clip(frames + 1, 0, numWin)
+    return 2 * (counts[..., hi] - counts[..., lo]) > hi - lo
+
+
+def segments(frames):
+    # (start, end) runs of True in a 1D frame verdict
+    edges = np.diff(np.r_[0, np.asarray(frames, dtype=np.int8), 0])
+    return list(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
@@ -0,0 +1,175 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Temporal alignment of unsynchronized camera streams.
+#
+# Phones start recording at different times and their clocks drift. Every
+# camera is aligned to a reference camera by the cross-correlation of their
+# mouth opening signals (geometry.mouthOpening), computed with FFTs in
+# O(n log n) per pair instead of trying every lag. A camera's mapping is
+#
+#   reference frame = offset + (1 + drift) * camera frame
+#
+# with drift 0 unless asked for; then the offset is also measured on
+# pieces of the camera and a line is fitted through them. reindex then
+# gathers, for every reference frame the cameras all cover, the nearest
+# frame of each camera.
+
+from collections import namedtuple
+import numpy as np
+
+from socialverify.geometry import LAYOUTS, clipOutliers, mouthOpening
+
+# offset and drift map camera frames to reference frames (see above); score
+# is the peak normalized cross-correlation
+Alignment = namedtuple('Alignment', ['offset', 'drift', 'score'])
+
+
+def _standardize(x):
+    x = clipOutliers(np.asarray(x, dtype=np.float64))
+    x = x - x.mean()
+    std = x.std()
+    return x / std if std > 0 else x
+
+
+def crossCorrelation(ref, sig, minOverlap):
+    # Normalized cross-correlation of two standardized signals for every lag
+    # d with at least minOverlap frames in common, where sig[t] is compared
+    # with ref[t + d]. Returns (lags, correlations).
+    n, m = len(ref), len(sig)
+    size = 1 << int(np.ceil(np.log2(n + m)))
+    spectrum = np.fft.rfft(ref, size) * np.conj(np.fft.rfft(sig, size))
+    full = np.fft.irfft(spectrum, size)
+    lags = np.arange(-(m - 1), n)
+    corr = full[lags % size]
+    # products summed over the overlap, and the overlap's sums of squares
+    # for the normalization, from prefix sums
+    r2 = np.r_[0, np.cumsum(ref ** 2)]
+    s2 = np.r_[0, np.cumsum(sig ** 2)]
+    lo, hi = np.maximum(lags, 0), np.minimum(lags + m, n)
+    overlap = hi - lo
+    keep = overlap >= minOverlap
+    lags, corr, lo, hi = lags[keep], corr[keep], lo[keep], hi[keep]
+    energy = (r2[hi] - r2[lo]) * (s2[hi - lags] - s2[lo - lags])
+    return lags, corr / np.sqrt(np.maximum(energy, 1e-12))
+
+
+def _peak(lags, corr):
+    # Lag of the highest correlation, refined to a fraction of a frame by a
+    # parabola through its neighbours
+    k = int(np.argmax(corr))
+    lag = float(lags[k])
+    if 0 < k < len(corr) - 1:
+        a, b, c = corr[k - 1], corr[k], corr[k + 1]
+        curve = a - 2 * b + c
+        if curve < 0:
+            lag += 0.5 * (a - c) / curve
+    return float(lag), float(corr[k])
+
+
+def estimateOffset(ref, sig, minOverlap=None, maxLag=None):
+    # Alignment (drift 0) of signal sig against signal ref
+    ref, sig = _standardize(ref), _standardize(sig)
+    if minOverlap is None:
+        minOverlap = min(len(ref), len(sig)) // 2
+    lags, corr = crossCorrelation(ref, sig, minOverlap)
+    if maxLag is not None:
+        near = np.abs(lags) <= maxLag
+        lags, corr = lags[near], corr[near]
+    lag, score = _peak(lags, corr)
+    return Alignment(lag, 0.0, score)
+
+
+def _fitPieces(ref, sig, offset, drift, length, search):
+    # Offsets of the length-frame pieces of sig, each searched within
+    # +-search frames of where (offset, drift) puts it, against only that
+    # stretch of ref; a line through them weighted by the peak correlations.
+    # ref is standardized. None when fewer than two pieces lie within ref.
+    centers, positions, weights = [], [], []
+    for start in range(0, len(sig) - length + 1, length):
+        expected = offset + (1 + drift) * start
+        lo, hi = int(np.floor(expected)) - search, int(np.ceil(expected)) + search + length
+        if lo < 0 or hi > len(ref):
+            continue
+        piece = _standardize(sig[start:start + length])
+        lags, corr = crossCorrelation(ref[lo:hi], piece, length)
+        lags = lags + lo
+        near = np.abs(lags - expected) <= search
+        lag, score = _peak(lags[near], corr[near])
+        # reference position of the piece centre
+        centers.append(start + length / 2)
+        positions.append(lag + length / 2)
+        weights.append(max(score, 0))
+    if len(centers) < 2 or sum(weights) == 0:
+        return None
+    slope, intercept = np.polyfit(centers, positions, 1, w=weights)
+    return float(intercept), float(slope - 1)
+
+
+def estimateDrift(ref, sig, segments=8, piece=1024, minOverlap=None, maxLag=None):
+    # Alignment of sig against ref with a linear drift. The whole signal's
+    # offset places `segments` long pieces of sig, searched within a tenth
+    # of their length, and a line through their offsets places pieces of
+    # `piece` frames, short enough that the drift doesn't smear their peaks,
+    # for the final fit. Every piece is correlated with the stretch of ref
+    # around it only, so this stays O(n log n).
+    whole = estimateOffset(ref, sig, minOverlap, maxLag)
+    ref = _standardize(ref)
+    length = len(sig) // segments
+    coarse = _fitPieces(ref, sig, whole.offset, 0.0, length, length // 10)
+    if coarse is None:
+        return whole
+    fine = _fitPieces(ref, sig, *coarse, piece, max(piece // 16, 8))
+    offset, drift = fine if fine is not None else coarse
+    return Alignment(offset, drift, whole.score)
+
+
+def alignSignals(signals, reference=0, drift=False, **kwargs):
+    # Alignment of every signal (a list, lengths may differ) to
+    # signals[reference]
+    ref = signals[reference]
+    estimate = estimateDrift if drift else estimateOffset
+    return [Alignment(0.0, 0.0, 1.0) if k == reference else estimate(ref, sig, **kwargs)
+            for k, sig in enumerate(signals)]
+
+
+def frameIndex(alignments, lengths):
+    # (numCams, L) nearest frame of every camera for each of the L reference
+    # frames that all cameras cover (to within half a frame)
+    starts = [a.offset for a in alignments]
+    ends = [a.offset + (1 + a.drift) * (n - 1) for a, n in zip(alignments, lengths)]
+    lo, hi = int(np.ceil(max(starts) - 0.5)), int(np.floor(min(ends) + 0.5))
+    if hi < lo:
+        raise ValueError('the aligned cameras do not overlap')
+    r = np.arange(lo, hi + 1)
+    return np.array([np.clip(np.rint((r - a.offset) / (1 + a.drift)), 0, n - 1).astype(int)
+                     for a, n in zip(alignments, lengths)])
+
+
+def reindex(streams, index):
+    # (numCams, L, features) frames streams[c][index[c]]
+    return np.stack([np.asarray(stream)[idx] for stream, idx in zip(streams, index)])
+
+
+def alignStreams(streams, reference=0, drift=False, layout='blocks', **kwargs):
+    # Align landmark streams (a list of (frames, features) arrays) to
+    # streams[reference]. Returns the re-indexed (numCams, L, features)
+    # array and the alignments.
+    signals = [mouthOpening(s, LAYOUTS[layout]) for s in streams]
+    alignments = alignSignals(signals, reference, drift, **kwargs)
+    return reindex(streams, frameIndex(alignments, [len(s) for s in streams])), alignments
+
+
+def alignParticipant(streams, drift=False, layout='blocks', **kwargs):
+    # alignStreams for a (9, frames, features) STREAMS stack: cam1..cam6 are
+    # aligned to cam1 and every fake stream follows the camera it replaces
+    # (fake2..fake4 are made from cam2..cam4's videos)
+    cams = list(streams[:6])
+    signals = [mouthOpening(s, LAYOUTS[layout]) for s in cams]
+    alignments = alignSignals(signals, 0, drift, **kwargs)
+    index = frameIndex(alignments, [len(s) for s in cams])
+    index = np.concatenate([index, index[1:4]])
+    return reindex(streams, index), alignments
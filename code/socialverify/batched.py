@@ -0,0 +1,83 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Batched PCA over many cameras and windows at once.
+#
+# Fitting a fresh sklearn StandardScaler + PCA per camera per window costs
+# more in estimator overhead than in math, for 40 features and a few hundred
+# frames. Here the windows of all cameras are taken as a
+# (n_cameras, n_windows, window, n_features) view of the stacked streams
+# (sliding_window_view, no copies), and each chunk of windows is standardized
+# and decomposed with a single stacked NumPy call. Only one chunk is ever
+# materialized, so `chunk` bounds the memory.
+#
+# Scores match sklearn's PCA(num_pcs).fit_transform up to the sign of each
+# component.
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from socialverify.instrument import stage
+from socialverify.landmarks import asFloats
+
+
+def windowView(streams, window):
+    # (n_cameras, n_frames, n_features) -> (n_cameras, n_windows, window, n_features)
+    return np.swapaxes(sliding_window_view(streams, window, axis=1), -1, -2)
+
+
+def standardize(X, scale):
+    # StandardScaler over the frames (axis -2) of every window or stream
+    Z = X - X.mean(axis=-2, keepdims=True)
+    if scale:
+        std = np.sqrt(np.mean(Z * Z, axis=-2, keepdims=True))
+        std[std < 10 * np.finfo(np.float64).eps] = 1.0
+        Z /= std
+    return Z
+
+
+def pcaScores(Z, num_pcs, method='eigh'):
+    # PCA(num_pcs).fit_transform of every standardized window or stream
+    if method == 'svd':
+        U, S, _ = np.linalg.svd(Z, full_matrices=False)
+        return U[..., :num_pcs] * S[..., None, :num_pcs]
+    # The (n_features x n_features) scatter matrices are much smaller than the
+    # windows themselves, so eigh on those is the cheaper route
+    _, evecs = np.linalg.eigh(np.swapaxes(Z, -1, -2) @ Z)
+    return Z @ evecs[..., ::-1][..., :num_pcs]
+
+
+def iterBatchedScores(streams, window, num_pcs, chunk=256, scale=True, method='eigh',
+                      starts=None):
+    # Yield (window starts, scores) per chunk of windows, with scores of
+    # shape (n_cameras, n_chunk_windows, window, num_pcs). starts picks the
+    # windows (a range or any increasing sequence of window starts, default
+    # all of them).
+    streams = asFloats(streams)
+    view = windowView(streams, window)
+    numWin = view.shape[1]
+    starts = np.arange(numWin) if starts is None else np.asarray(starts)
+    starts = starts[starts < numWin]
+    for s in range(0, len(starts), chunk):
+        block = starts[s:s + chunk]
+        # consecutive starts are a view of the windows, others a gathered copy
+        if block[-1] - block[0] == len(block) - 1:
+            windows = view[:, block[0]:block[-1] + 1]
+        else:
+            windows = view[:, block]
+        with stage('scaling'):
+            Z = standardize(windows, scale)
+        with stage('pca'):
+            scores = pcaScores(Z, num_pcs, method)
+        yield block, scores
+
+
+def batchedPCAScores(streams, window, num_pcs, chunk=256, scale=True, method='eigh',
+                     numWin=None):
+    # All window scores at once, (n_cameras, n_windows, window, num_pcs)
+    starts = None if numWin is None else range(numWin)
+    return np.concatenate([scores for _, scores in
+                           iterBatchedScores(streams, window, num_pcs, chunk, scale, method, starts)],
+                          axis=1)
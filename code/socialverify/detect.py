@@ -0,0 +1,216 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Fake detection from per-camera feature vectors: single linkage clustering of
+# the cameras, where a large jump between the last two merge heights means the
+# cameras split into two groups. We assume the larger partition is real.
+#
+# Only the top of the single linkage tree is ever used, and single linkage is
+# the minimum spanning tree of the pairwise distances: the merge heights are
+# its edge weights, so the top two are its two longest edges, and cutting the
+# longest edge gives the 2-cluster partition. topOfTree gets both from an
+# O(n_cameras^2) Prim's MST instead of a full linkage, which keeps hundreds
+# of cameras interactive.
+
+import numpy as np
+from scipy.cluster.hierarchy import fcluster
+
+
+def trackingFailures(X):
+    # Columns (frames) where any camera's distance is >= 10 are tracking
+    # failures rather than evidence, and get dropped before clustering
+    return np.max(X, axis = 0) >= 10
+
+
+def pairwiseDistances(X):
+    # Euclidean distances between the rows of X, through the Gram matrix
+    # (centered first, to keep the cancellation small), in float64 whatever
+    # the precision of X
+    X = np.asarray(X, dtype = np.float64)
+    X = X - X.mean(axis = 0)
+    sq = np.einsum('ij,ij->i', X, X)
+    D2 = sq[:, None] + sq[None, :] - 2 * (X @ X.T)
+    np.fill_diagonal(D2, 0)
+    return np.sqrt(np.clip(D2, 0, None))
+
+
+def spanningTree(D):
+    # Prim's minimum spanning tree of a dense distance matrix, grown from
+    # node 0. Returns the nodes in the order they joined, and for each node
+    # its parent in the tree and the weight of the edge to it (-1 and 0 for
+    # the root).
+    n = D.shape[0]
+    order = np.zeros(n, dtype = int)
+    parent = np.full(n, -1)
+    weight = np.zeros(n)
+    inTree = np.zeros(n, dtype = bool)
+    inTree[0] = True
+    best = D[0].astype(np.float64)
+    nearest = np.zeros(n, dtype = int)
+    for k in range(1, n):
+        v = np.argmin(np.where(inTree, np.inf, best))
+        order[k], parent[v], weight[v] = v, nearest[v], best[v]
+        inTree[v] = True
+        closer = D[v] < best
+        best[closer] = D[v][closer]
+        nearest[closer] = v
+    return order, parent, weight
+
+
+def topOfTree(X):
+    # Same as linkScores(linkage(X)) for the rows of X (n_cameras >= 3), from
+    # the minimum spanning tree: the ratio of the top two merge heights and
+    # the 2-cluster labels, numbered the way fcluster numbers them.
+    # One exception: when the top two merge heights tie exactly, fcluster
+    # can't cut the tree into 2 clusters and labels every camera 1, while
+    # this cuts one of the longest edges anyway. The ratio is then 1, so no
+    # threshold above 1 flags fakes in either case.
+    n = X.shape[0]
+    if n < 3:
+        raise ValueError(f'need at least 3 cameras, got {n}')
+    order, parent, weight = spanningTree(pairwiseDistances(X))
+    top, second = np.argsort(weight)[-1:-3:-1]
+    ratio = weight[top] / weight[second]
+
+    # Cutting the longest edge leaves the subtree below `top`; nodes join
+    # after their parent, so one pass in join order finds it
+    below = np.zeros(n, dtype = bool)
+    below[top] = True
+    for v in order[np.flatnonzero(order == top)[0] + 1:]:
+        below[v] = below[parent[v]]
+
+    # fcluster numbers the merged clusters before single cameras, and of two
+    # merged clusters the one completed first (shorter longest internal edge)
+    # before the other
+    def rank(members):
+        if members.sum() == 1:
+            return np.inf
+        inner = members & members[np.maximum(parent, 0)] & (parent >= 0)
+        return np.max(weight[inner])
+    c = np.where(below, 1, 2)
+    if rank(~below) < rank(below):
+        c = 3 - c
+    return ratio, c
+
+
+def spanningTrees(D):
+    # spanningTree of every matrix of a stack (P, n, n) at once; the outputs
+    # get shape (P, n)
+    D = np.asarray(D, dtype = np.float64)
+    P, n = D.shape[0], D.shape[-1]
+    rows = np.arange(P)
+    order = np.zeros((P, n), dtype = int)
+    parent = np.full((P, n), -1)
+    weight = np.zeros((P, n))
+    inTree = np.zeros((P, n), dtype = bool)
+    inTree[:, 0] = True
+    best = D[:, 0].copy()
+    nearest = np.zeros((P, n), dtype = int)
+    for k in range(1, n):
+        v = np.argmin(np.where(inTree, np.inf, best), axis = 1)
+        order[:, k], parent[rows, v], weight[rows, v] = v, nearest[rows, v], best[rows, v]
+        inTree[rows, v] = True
+        Dv = D[rows, v]
+        closer = Dv < best
+        best = np.where(closer, Dv, best)
+        nearest = np.where(closer, v[:, None], nearest)
+    return order, parent, weight
+
+
+def topOfTrees(D):
+    # topOfTree from a stack of distance matrices (P, n, n) between n >= 3
+    # cameras at once, e.g. every fake placement of one set of features:
+    # ratios (P,) and labels (P, n), the same as topOfTree gives per matrix.
+    # The single camera set paths keep topOfTree, which has less overhead.
+    P, n = D.shape[0], D.shape[-1]
+    if n < 3:
+        raise ValueError(f'need at least 3 cameras, got {n}')
+    rows = np.arange(P)
+    order, parent, weight = spanningTrees(D)
+    ranked = np.argsort(weight, axis = 1)
+    top, second = ranked[:, -1], ranked[:, -2]
+    ratio = weight[rows, top] / weight[rows, second]
+
+    # Cutting the longest edge leaves the subtree below `top`; nodes join
+    # after their parent, so one pass in join order finds it
+    below = np.zeros((P, n), dtype = bool)
+    below[rows, top] = True
+    joined = np.argmax(order == top[:, None], axis = 1)
+    for k in range(1, n):
+        v = order[:, k]
+        below[rows, v] |= (k > joined) & below[rows, parent[rows, v]]
+
+    # fcluster numbers the merged clusters before single cameras, and of two
+    # merged clusters the one completed first (shorter longest internal edge)
+    # before the other
+    up = np.maximum(parent, 0)
+    def rank(members):
+        inner = members & np.take_along_axis(members, up, axis = 1) & (parent >= 0)
+        height = np.max(np.where(inner, weight, -np.inf), axis = 1)
+        return np.where(members.sum(axis = 1) == 1, np.inf, height)
+    c = np.where(below, 1, 2)
+    c = np.where((rank(~below) < rank(below))[:, None], 3 - c, c)
+    return ratio, c
+
+
+def minority(c):
+    # Indices of the smaller partition of 2-cluster labels (label 1 on a tie)
+    partition1 = np.sum(c == 1)
+    partition2 = np.sum(c == 2)
+    return np.flatnonzero(c == (2 if partition1 > partition2 else 1))
+
+
+def linkScores(link):
+    # Everything the fake detection needs from a linkage matrix, none of it
+    # depending on the threshold: the ratio of the top two merge heights and
+    # the 2-cluster partition
+    ratio = link[-1][-2] / link[-2][-2]
+    c = fcluster(link, 2,criterion='maxclust')
+    return ratio, c
+
+
+# Number of fakes from the top of the linkage tree, vectorized over cached
+# scores. ratios has shape (...) and labels (..., numCams); the result holds
+# numFakes for every threshold, with shape (len(threshes), ...).
+
+def detectFakes(ratios, labels, threshes):
+    threshes = np.reshape(threshes, (-1,) + (1,) * np.ndim(ratios))
+    partition1 = np.sum(labels == 1, axis = -1)
+    partition2 = np.sum(labels == 2, axis = -1)
+    return np.where(ratios > threshes, np.minimum(partition1, partition2), 0)
+
+
+def detectCameras(X, thresh):
+    # X is (numCams, numFrames), one feature vector per camera. Returns the
+    # number of fakes, the 2-cluster labels and the linkage ratio
+    X = X[:, ~trackingFailures(X)]
+    ratio, c = topOfTree(X)
+    return int(detectFakes(ratio, c, thresh)[0]), c, ratio
+
+
+def detectSplit(X, thresh):
+    # Number of fakes, indices of the cameras flagged as fake (empty when the
+    # ratio is below thresh) and the ratio, for any number of cameras. X is
+    # used as is, see detectCrowd for the tracking failure filter.
+    ratio, c = topOfTree(X)
+    numFakes = int(detectFakes(ratio, c, thresh)[0])
+    fakes = minority(c) if numFakes else np.zeros(0, dtype = int)
+    return numFakes, fakes, ratio
+
+
+def detectCrowd(X, thresh):
+    return detectSplit(X[:, ~trackingFailures(X)], thresh)
+
+
+def isPartition(fakes, trueFakes, numCams=None):
+    # Ground truth check by set membership: exactly the true fakes flagged.
+    # An even split can't tell fakes from reals, so given numCams the other
+    # half counts too.
+    flagged = set(np.asarray(fakes).tolist())
+    if flagged == set(trueFakes):
+        return True
+    return numCams is not None and 2 * len(flagged) == numCams and \
+        set(range(numCams)) - flagged == set(trueFakes)
@@ -0,0 +1,230 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Covariance estimators for the Mahalanobis distance step of
+# verify.mahalanobisDistances.
+#
+# Every estimator follows the sklearn covariance interface (fit, then
+# mahalanobis), with fit taking an optional `index`: the frame numbers of the
+# rows of X. The estimates are always computed in float64, whatever the
+# precision of X. Estimators that carry state from one window to the next (mcd-warm)
+# use it to find the frames the previous window shares with this one; the
+# others ignore it.
+#
+#   mcd        MinCovDet, as in the experiments, with a fixed random_state
+#   mcd-warm   MCD whose C-steps start from the previous window's support
+#   detmcd     deterministic MCD (Hubert, Rousseeuw & Verdonck, 2012)
+#   trimmed    classical estimate, refit without the most outlying frames
+#   empirical  classical (non-robust) mean and covariance
+
+import numpy as np
+from scipy import linalg
+from scipy.stats import norm, rankdata
+from sklearn.covariance import EmpiricalCovariance, MinCovDet, empirical_covariance
+
+
+def _supportSize(n_samples, n_features, support_fraction=None):
+    # Same default h as sklearn's MinCovDet
+    if support_fraction is None:
+        return int(np.ceil(0.5 * (n_samples + n_features + 1)))
+    return int(support_fraction * n_samples)
+
+
+def _mahalanobisSq(X, location, covariance):
+    centered = X - location
+    return np.sum(centered @ linalg.pinvh(covariance) * centered, axis=1)
+
+
+def cSteps(X, support, n_support, max_iter=30):
+    # Concentration steps from an initial support (boolean mask or indices):
+    # refit on the n_support frames closest to the current estimate until the
+    # covariance determinant stops decreasing
+    X_support = X[support]
+    location = X_support.mean(axis=0)
+    covariance = empirical_covariance(X_support)
+    det = np.linalg.slogdet(covariance)[1]
+    for _ in range(max_iter):
+        dist = _mahalanobisSq(X, location, covariance)
+        X_support = X[np.argpartition(dist, n_support - 1)[:n_support]]
+        newCovariance = empirical_covariance(X_support)
+        newDet = np.linalg.slogdet(newCovariance)[1]
+        if newDet > det:
+            break
+        converged = np.isclose(newDet, det)
+        location, covariance, det = X_support.mean(axis=0), newCovariance, newDet
+        if converged:
+            break
+    support = np.zeros(X.shape[0], dtype=bool)
+    dist = _mahalanobisSq(X, location, covariance)
+    support[np.argpartition(dist, n_support - 1)[:n_support]] = True
+    return location, covariance, det, support, dist
+
+
+class SeededMCD(MinCovDet):
+
+    def fit(self, X, y=None, index=None):
+        return super().fit(np.asarray(X, dtype=np.float64))
+
+
+class _RawMCD(MinCovDet):
+    # MinCovDet with a different search for the raw (location, covariance).
+    # The consistency correction and reweighting are left to sklearn, so the
+    # final estimate is directly comparable with MinCovDet's.
+
+    def _rawEstimate(self, X, index):
+        raise NotImplementedError
+
+    def fit(self, X, y=None, index=None):
+        X = np.asarray(X, dtype=np.float64)
+        location, covariance, support, dist = self._rawEstimate(X, index)
+        self.raw_location_ = location
+        self.raw_covariance_ = covariance
+        self.raw_support_ = support
+        self.location_ = location
+        self.support_ = support
+        self.dist_ = dist
+        self.correct_covariance(X)
+        self.reweight_covariance(X)
+        return self
+
+
+class WarmStartMCD(_RawMCD):
+    # Consecutive windows share all but one frame, so the previous window's
+    # support is almost always a near-optimal start. We keep it as frame
+    # numbers (the PCA basis changes between windows, so the previous
+    # location/covariance can't be reused directly), run C-steps from it, and
+    # fall back to a full FastMCD search for the first window, when the
+    # windows don't overlap enough, or every `restart` fits to avoid getting
+    # stuck in a local optimum.
+
+    def __init__(self, *, store_precision=True, assume_centered=False,
+                 support_fraction=None, random_state=None, restart=20):
+        super().__init__(store_precision=store_precision, assume_centered=assume_centered,
+                         support_fraction=support_fraction, random_state=random_state)
+        self.restart = restart
+
+    def _rawEstimate(self, X, index):
+        n_samples, n_features = X.shape
+        n_support = _supportSize(n_samples, n_features, self.support_fraction)
+        if index is None:
+            index = np.arange(n_samples)
+        frames = getattr(self, '_supportFrames', None)
+        fits = getattr(self, '_fitsSinceRestart', self.restart)
+        start = None
+        if frames is not None and fits < self.restart:
+            start = np.isin(index, frames)
+            if start.sum() <= n_features:
+                start = None
+        if start is None:
+            full = MinCovDet(support_fraction=self.support_fraction,
+                             random_state=self.random_state).fit(X)
+            start = full.raw_support_
+            self._fitsSinceRestart = 0
+        else:
+            self._fitsSinceRestart = fits + 1
+        location, covariance, _, support, dist = cSteps(X, start, n_support)
+        self._supportFrames = index[support]
+        return location, covariance, support, dist
+
+
+def _qnScale(x):
+    # MAD scale, used in place of Qn for the univariate scale estimates
+    mad = np.median(np.abs(x - np.median(x, axis=0)), axis=0) * 1.4826
+    return np.where(mad > 0, mad, 1.0)
+
+
+class DeterministicMCD(_RawMCD):
+    # DetMCD: instead of random subsets, C-steps start from a few robust but
+    # deterministic initial estimates computed on the robustly standardized
+    # data, and the result with the lowest determinant is kept.
+
+    def _initialSupports(self, Z, h0):
+        n_samples = Z.shape[0]
+        starts = []
+        # 1. hyperbolic tangent correlation, 2. Spearman correlation,
+        # 3. normal scores correlation, 4. spatial sign covariance
+        ranks = rankdata(Z, axis=0)
+        scatters = [np.corrcoef(np.tanh(Z), rowvar=False),
+                    np.corrcoef(ranks, rowvar=False),
+                    np.corrcoef(norm.ppf((ranks - 1 / 3) / (n_samples + 1 / 3)), rowvar=False)]
+        norms = np.linalg.norm(Z, axis=1, keepdims=True)
+        signs = Z / np.where(norms > 0, norms, 1.0)
+        scatters.append(signs.T @ signs / n_samples)
+        for S in scatters:
+            S = np.atleast_2d(np.nan_to_num(S))
+            _, E = np.linalg.eigh(S)
+            B = Z @ E
+            L = _qnScale(B) ** 2
+            covariance = (E * L) @ E.T
+            # coordinatewise median in the whitened coordinates, mapped back
+            location = (E * np.sqrt(L)) @ np.median(B / np.sqrt(L), axis=0)
+            dist = _mahalanobisSq(Z, location, covariance)
+            starts.append(np.argsort(dist)[:h0])
+        # 5. the h0 frames closest to the coordinatewise median
+        starts.append(np.argsort(np.linalg.norm(Z, axis=1))[:h0])
+        return starts
+
+    def _rawEstimate(self, X, index):
+        n_samples, n_features = X.shape
+        n_support = _supportSize(n_samples, n_features, self.support_fraction)
+        Z = (X - np.median(X, axis=0)) / _qnScale(X)
+        h0 = int(np.ceil(n_samples / 2))
+        best = None
+        for start in self._initialSupports(Z, h0):
+            result = cSteps(X, start, n_support)
+            if best is None or result[2] < best[2]:
+                best = result
+        location, covariance, _, support, dist = best
+        return location, covariance, support, dist
+
+
+class TrimmedCovariance(EmpiricalCovariance):
+    # Classical estimate refit `n_iter` times on the frames that are not among
+    # the `trim` fraction furthest from the previous fit
+
+    def __init__(self, *, store_precision=True, assume_centered=False,
+                 trim=0.1, n_iter=2):
+        super().__init__(store_precision=store_precision, assume_centered=assume_centered)
+        self.trim = trim
+        self.n_iter = n_iter
+
+    def fit(self, X, y=None, index=None):
+        X = np.asarray(X, dtype=np.float64)
+        keep = X.shape[0] - int(self.trim * X.shape[0])
+        support = np.ones(X.shape[0], dtype=bool)
+        for it in range(self.n_iter + 1):
+            super().fit(X[support])
+            if it == self.n_iter:
+                break
+            dist = self.mahalanobis(X)
+            support = np.zeros(X.shape[0], dtype=bool)
+            support[np.argpartition(dist, keep - 1)[:keep]] = True
+        self.support_ = support
+        return self
+
+
+class Empirical(EmpiricalCovariance):
+
+    def fit(self, X, y=None, index=None):
+        return super().fit(np.asarray(X, dtype=np.float64))
+
+
+ESTIMATORS = {
+    'mcd': SeededMCD,
+    'mcd-warm': WarmStartMCD,
+    'detmcd': DeterministicMCD,
+    'trimmed': TrimmedCovariance,
+    'empirical': Empirical,
+}
+
+
+def makeEstimator(name='mcd', random_state=None):
+    if name not in ESTIMATORS:
+        raise ValueError(f'Unknown estimator {name!r}, expected one of {sorted(ESTIMATORS)}')
+    cls = ESTIMATORS[name]
+    if 'random_state' in cls().get_params():
+        return cls(random_state=random_state)
+    return cls()
@@ -0,0 +1,114 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Geometric signals of the mouth landmarks and the cheap pre-filter built on
+# them.
+#
+# mouthOpening is the gap between the inner lips over the mouth width (the
+# lip distance test of the README: is the mouth open in one view but closed
+# in another?), mouthSpeed the mean landmark displacement between frames
+# over the mouth width. Both are scale free, so the cameras' views compare
+# directly.
+#
+# The pre-filter scores every window of every camera by the correlation of
+# its signals with the consensus of all cameras (their per-frame median, so
+# a minority of fakes doesn't drag it along), in O(frames x cameras) with
+# prefix sums. Windows where every camera follows the consensus closely are
+# clearly consistent and can skip the PCA/MCD/linkage path; the others are
+# ambiguous and take it.
+
+from collections import namedtuple
+import numpy as np
+
+# Where a frame keeps its landmarks: the columns of the x and y coordinates
+# of the 20 mouth landmarks, the upper and lower inner lip landmarks facing
+# each other, and the two mouth corners, as landmark numbers 0-19. The
+# landmarks are points 49-68 of the 68 point face model (12 on the outer lip
+# from the left corner, then 8 on the inner lip).
+MouthLayout = namedtuple('MouthLayout', ['x', 'y', 'upper', 'lower', 'corners'])
+
+LAYOUTS = {
+    # x0..x19 then y0..y19 (also socialverify.synthetic's layout)
+    'blocks': MouthLayout(slice(0, 20), slice(20, 40), (13, 14, 15), (19, 18, 17), (0, 6)),
+    # x0, y0, x1, y1, ...
+    'interleaved': MouthLayout(slice(0, 40, 2), slice(1, 40, 2), (13, 14, 15), (19, 18, 17), (0, 6)),
+}
+
+# Pre-filter thresholds: a window is consistent when every camera's opening
+# and speed correlate with the consensus by at least min_opening and
+# min_speed. layout is a LAYOUTS key.
+Cascade = namedtuple('Cascade', ['min_opening', 'min_speed', 'layout'])
+
+
+def _width(x, y, layout):
+    a, b = layout.corners
+    return np.maximum(np.hypot(x[..., a] - x[..., b], y[..., a] - y[..., b]), 1e-9)
+
+
+def mouthOpening(frames, layout=LAYOUTS['blocks']):
+    # (..., frames, features) -> (..., frames)
+    frames = np.asarray(frames, dtype=np.float64)
+    x, y = frames[..., layout.x], frames[..., layout.y]
+    upper, lower = list(layout.upper), list(layout.lower)
+    gap = np.hypot(x[..., upper] - x[..., lower], y[..., upper] - y[..., lower]).mean(axis=-1)
+    return gap / _width(x, y, layout)
+
+
+def mouthSpeed(frames, layout=LAYOUTS['blocks']):
+    # (..., frames, features) -> (..., frames), 0 for the first frame
+    frames = np.asarray(frames, dtype=np.float64)
+    x, y = frames[..., layout.x], frames[..., layout.y]
+    speed = np.zeros(frames.shape[:-1])
+    step = np.hypot(np.diff(x, axis=-2), np.diff(y, axis=-2)).mean(axis=-1)
+    speed[..., 1:] = step / _width(x, y, layout)[..., 1:]
+    return speed
+
+
+def clipOutliers(signal, scale=6):
+    # Clip a signal (..., frames) to its median +- scale MADs: a tracking
+    # failure frame would otherwise dominate every correlation it is in
+    med = np.median(signal, axis=-1, keepdims=True)
+    mad = np.median(np.abs(signal - med), axis=-1, keepdims=True)
+    return np.clip(signal, med - scale * mad, med + scale * mad)
+
+
+def mouthSignals(streams, layout=LAYOUTS['blocks']):
+    # (2, numStreams, frames): opening and speed of every stream with their
+    # outliers clipped, computed one stream at a time (streams may be memory
+    # maps or FrameViews)
+    signals = np.array([[f(stream, layout) for stream in streams] for f in (mouthOpening, mouthSpeed)])
+    return clipOutliers(signals)
+
+
+def windowCorrelation(a, b, window, numWin):
+    # Pearson correlation of a and b (..., frames) over the windows
+    # [s, s + window) for s < numWin; 0 where either is constant
+    def sums(x):
+        c = np.zeros(x.shape[:-1] + (x.shape[-1] + 1,))
+        np.cumsum(x, axis=-1, out=c[..., 1:])
+        return c[..., window:window + numWin] - c[..., :numWin]
+    # centred first, so the sums don't cancel
+    a = a - a.mean(axis=-1, keepdims=True)
+    b = b - b.mean(axis=-1, keepdims=True)
+    sa, sb = sums(a), sums(b)
+    cov = window * sums(a * b) - sa * sb
+    var = (window * sums(a * a) - sa ** 2) * (window * sums(b * b) - sb ** 2)
+    ok = var > 1e-12 * window ** 4
+    return np.where(ok, cov / np.sqrt(np.where(ok, var, 1)), 0.0)
+
+
+def consensusScores(signals, window, numWin):
+    # (numSignals, numStreams, numWin) correlation of every stream's signals
+    # with their per-frame median over the streams
+    consensus = np.median(signals, axis=1, keepdims=True)
+    return windowCorrelation(signals, np.broadcast_to(consensus, signals.shape), window, numWin)
+
+
+def consistentWindows(signals, window, numWin, min_opening, min_speed):
+    # (numWin,) mask of the windows where all streams follow the consensus
+    scores = consensusScores(signals, window, numWin)
+    mins = np.array([min_opening, min_speed])[:, None, None]
+    return np.all(scores >= mins, axis=(0, 1))
@@ -0,0 +1,206 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Lightweight instrumentation for the experiments.
+#
+#   with stage('mcd'):      time a pipeline stage; the seconds and calls add
+#       ...                 up per stage name until takeStages()
+#   record(event, **f)      write one JSON-lines record to the timings file
+#   Progress(total)         rate-limited progress bar with ETA on stderr
+#   Instrumented(func)      picklable wrapper that runs a cell with stage
+#                           timing (and optionally cProfile) in a worker and
+#                           returns (result, stages, seconds)
+#
+# Nothing is timed unless enable() was called: stage() then hands out one
+# shared no-op context manager, so leaving the calls in the hot path costs a
+# function call and a flag check.
+
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+
+_enabled = False
+_stages = {}
+_sink = None
+_NULL = contextlib.nullcontext()
+
+
+def enable(path=None):
+    # Start timing stages; records go to path (JSON lines, appended) if given
+    global _enabled, _sink
+    _enabled = True
+    if path is not None and _sink is None:
+        outDir = os.path.dirname(path)
+        if outDir and not os.path.exists(outDir):
+            os.makedirs(outDir)
+        _sink = open(path, 'a')
+
+
+def disable():
+    global _enabled, _sink
+    _enabled = False
+    if _sink is not None:
+        _sink.close()
+        _sink = None
+
+
+def enabled():
+    return _enabled
+
+
+class _Stage:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.t0
+        total = _stages.setdefault(self.name, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+
+def stage(name):
+    return _Stage(name) if _enabled else _NULL
+
+
+def takeStages():
+    # {stage: {'seconds', 'calls'}} accumulated since the last call
+    global _stages
+    stages = {name: {'seconds': s, 'calls': n} for name, (s, n) in _stages.items()}
+    _stages = {}
+    return stages
+
+
+def mergeStages(*stageDicts):
+    merged = {}
+    for stages in stageDicts:
+        for name, s in stages.items():
+            m = merged.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            m['seconds'] += s['seconds']
+            m['calls'] += s['calls']
+    return merged
+
+
+def record(event, **fields):
+    if _sink is None:
+        return
+    _sink.write(json.dumps(dict(event=event, time=time.time(), **fields)) + '\n')
+    _sink.flush()
+
+
+def summary(stages, file=sys.stderr):
+    # Stage table, largest first
+    total = sum(s['seconds'] for s in stages.values()) or 1.0
+    for name, s in sorted(stages.items(), key=lambda kv: -kv[1]['seconds']):
+        print(f'{name:<12} {s["seconds"]:10.3f}s {100 * s["seconds"] / total:6.1f}% '
+              f'{s["calls"]:9d} calls', file=file)
+
+
+class Instrumented:
+    # func wrapped for runCells: enables stage timing in the worker (the
+    # module flag isn't inherited by spawned processes), and with a profile
+    # path accumulates a cProfile of the worker's cells in <profile>.<pid>
+
+    def __init__(self, func, timings=True, profile=None):
+        self.func = func
+        self.timings = timings
+        self.profile = profile
+
+    def __call__(self, *args):
+        global _enabled
+        if self.timings:
+            _enabled = True
+        takeStages()
+        t0 = time.perf_counter()
+        if self.profile is None:
+            result = self.func(*args)
+        else:
+            profiler = _workerProfiler()
+            profiler.enable()
+            try:
+                result = self.func(*args)
+            finally:
+                profiler.disable()
+                profiler.dump_stats(f'{self.profile}.{os.getpid()}')
+        return result, takeStages(), time.perf_counter() - t0
+
+
+_profiler = None
+
+
+def _workerProfiler():
+    global _profiler
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+    return _profiler
+
+
+@contextlib.contextmanager
+def profiled(path):
+    # cProfile the block into path (open with pstats, snakeviz or flameprof
+    # for a flame graph); no-op without a path
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+class Progress:
+    # Progress bar on stderr, redrawn at most every `interval` seconds
+
+    def __init__(self, total, label='', interval=0.5, width=30, file=sys.stderr):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.width = width
+        self.file = file
+        self.count = 0
+        self.drawn = None
+        self.t0 = time.perf_counter()
+        self.last = -interval
+
+    def update(self, n=1):
+        self.count += n
+        now = time.perf_counter()
+        if now - self.last >= self.interval or self.count >= self.total:
+            self.last = now
+            self._draw(now)
+
+    def _draw(self, now):
+        self.drawn = self.count
+        elapsed = now - self.t0
+        done = self.count / self.total if self.total else 1.0
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.count) / rate if rate > 0 else 0.0
+        bar = '#' * int(self.width * done)
+        self.file.write(f'\r{self.label} [{bar:<{self.width}}] {self.count}/{self.total} '
+                        f'{rate:7.2f}/s ETA {_clock(eta)} ')
+        self.file.flush()
+
+    def close(self):
+        if self.drawn != self.count:
+            self._draw(time.perf_counter())
+        self.file.write('\n')
+        self.file.flush()
+
+
+def _clock(seconds):
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f'{h}:{m:02d}:{s:02d}'
@@ -0,0 +1,278 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Loading of the processed landmark files. Every participant comes as three
+# files, mouth-data-fake{2,3,4}-ID{n}.mat, which share the real cameras
+# cam1..cam6 and differ only in their 'fake' stream.
+#
+# Parsing the .mat files is slow and decodes cam1..cam6 three times, so a
+# participant can be converted once into a landmark cache: a single
+# ID<n>.npy array of shape (9, fullLen, num_features) in STREAMS order, already
+# trimmed to fullLen, with the real cameras stored once (from
+# mouth-data-fake2), plus an ID<n>.json with the original lengths and whether
+# the three files agree on the real cameras. When they don't, runs asking for
+# the cameras of another file read the .mat files instead. Cached participants are opened with np.load's
+# mmap_mode, so slices are zero-copy and processes reading the same
+# participant share its pages through the OS page cache.
+#
+# The files are read through socialverify.reader, which also opens MATLAB
+# v7.3 (HDF5) files. ParticipantReader reads only the variables the stacked
+# array needs (the real cameras from one file, the fake stream from each) and
+# hands them out in frame blocks on request (streamBlocks), so windowed
+# processing can start before a long recording is read, with memory bounded
+# by the block instead of the recording. Only the streaming detector
+# (replay.py) reads that way; the experiment scripts take the whole
+# recording from loadStreams.
+
+import json
+import os
+import warnings
+import numpy as np
+
+from socialverify.reader import MatReader
+
+# Row order of the stacked stream arrays used throughout
+STREAMS = ('cam1', 'cam2', 'cam3', 'cam4', 'cam5', 'cam6', 'fake2', 'fake3', 'fake4')
+FAKE_CAMS = (2, 3, 4)
+# The file the landmark cache takes cam1..cam6 from
+CACHE_CAMS = 2
+# Rows of the STREAMS in the camera sets X0..X3 of the experiments, where
+# cam4, cam3-4 and cam2-4 are replaced by their fakes
+CASE_ROWS = ([0, 1, 2, 3, 4, 5], [0, 1, 2, 8, 4, 5], [0, 1, 7, 8, 4, 5], [0, 6, 7, 8, 4, 5])
+
+
+def participantIDs(num_participants):
+    # There is no data for ID 17
+    return [i + 1 for i in range(num_participants) if i != 16]
+
+
+def participantFiles(data_dir, person):
+    return {k: os.path.join(data_dir, f'mouth-data-fake{k}-ID{person}.mat') for k in FAKE_CAMS}
+
+
+def loadParticipant(data_dir, person):
+    # Every variable of the three files, as {fake cam: {name: array}}
+    data = {}
+    for k, path in participantFiles(data_dir, person).items():
+        with MatReader(path) as f:
+            data[k] = {name: f.read(name) for name in f.variables}
+    return data
+
+
+def _stackStreams(data, camsFrom, dtype=np.float64):
+    fullLen = min(data[k]['cam1'].shape[0] for k in FAKE_CAMS)
+    cams = [data[camsFrom][f'cam{c}'][:fullLen, :] for c in range(1, 7)]
+    fakes = [data[k]['fake'][:fullLen, :] for k in FAKE_CAMS]
+    #filled stream by stream, so a float32 array never needs a float64 copy
+    out = np.empty((len(STREAMS), fullLen, cams[0].shape[1]), dtype=dtype)
+    for k, stream in enumerate(cams + fakes):
+        out[k] = stream
+    return out
+
+
+def cachePaths(cache_dir, person):
+    return (os.path.join(cache_dir, f'ID{person}.npy'),
+            os.path.join(cache_dir, f'ID{person}.json'))
+
+
+def _replace(path, mode, write):
+    # Write under a temporary name and rename, so concurrent readers never see
+    # a partial file
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, mode) as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def convertParticipant(data_dir, cache_dir, person):
+    # Write the landmark cache entry of one participant, returns its metadata
+    data = loadParticipant(data_dir, person)
+    streams = _stackStreams(data, camsFrom=CACHE_CAMS)
+    fullLen = streams.shape[1]
+    camsMatch = all(np.array_equal(data[k][f'cam{c}'][:fullLen, :], streams[c - 1])
+                    for k in FAKE_CAMS if k != CACHE_CAMS for c in range(1, 7))
+    if not camsMatch:
+        warnings.warn(f'ID{person}: cam1..cam6 differ between the fake2/3/4 files, caching the ones from '
+                      f'mouth-data-fake{CACHE_CAMS}; the others are read from the .mat files')
+    meta = {'person': person,
+            'streams': list(STREAMS),
+            'fullLen': fullLen,
+            'numFeatures': streams.shape[2],
+            'lengths': {f'fake{k}': int(data[k]['cam1'].shape[0]) for k in FAKE_CAMS},
+            'camsMatch': camsMatch}
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    arrayPath, metaPath = cachePaths(cache_dir, person)
+    _replace(arrayPath, 'wb', lambda f: np.save(f, streams))
+    # The metadata goes last: once it exists the entry is complete
+    _replace(metaPath, 'w', lambda f: json.dump(meta, f, indent = 1))
+    return meta
+
+
+def openCached(cache_dir, person):
+    arrayPath, _ = cachePaths(cache_dir, person)
+    return np.load(arrayPath, mmap_mode='r')
+
+
+def cacheMeta(cache_dir, person):
+    _, metaPath = cachePaths(cache_dir, person)
+    with open(metaPath) as f:
+        return json.load(f)
+
+
+def cacheHolds(cache_dir, person, camsFrom):
+    # Whether the cache entry of a participant has the real cameras of
+    # mouth-data-fake<camsFrom>: the ones it was built from, or any when the
+    # three files agree on them
+    return camsFrom == CACHE_CAMS or cacheMeta(cache_dir, person)['camsMatch']
+
+
+def loadStreams(data_dir, person, camsFrom=2, cache_dir=None, dtype=None):
+    # Returns a (9, fullLen, num_features) array in STREAMS order, with every
+    # stream trimmed to the shortest of the three files. The real cameras are
+    # taken from the mouth-data-fake<camsFrom> file.
+    #
+    # With a cache_dir the participant is converted on first use and returned
+    # as a read-only memory map, unless the cache doesn't hold the cameras of
+    # camsFrom (see cacheHolds).
+    #
+    # dtype (np.float32 for the compact mode) returns an in-memory array of
+    # that type instead, float64 being the default.
+    if cache_dir is not None:
+        if not os.path.exists(cachePaths(cache_dir, person)[1]):
+            convertParticipant(data_dir, cache_dir, person)
+        if cacheHolds(cache_dir, person, camsFrom):
+            streams = openCached(cache_dir, person)
+            return streams if dtype is None else streams.astype(dtype)
+    with ParticipantReader(data_dir, person, camsFrom) as reader:
+        return reader.read(dtype=dtype or np.float64)
+
+
+class ParticipantReader:
+
+    def __init__(self, data_dir, person, camsFrom=2):
+        # The real cameras come from the mouth-data-fake<camsFrom> file, only
+        # the fake stream is read from the other two
+        files = participantFiles(data_dir, person)
+        cams = [f'cam{c}' for c in range(1, 7)]
+        self.files = {k: MatReader(path, cams + ['fake'] if k == camsFrom else ['fake'])
+                      for k, path in files.items()}
+        # every stream is trimmed to the shortest of the three files
+        self.fullLen = min(f.shape('cam1')[0] for f in self.files.values())
+        self.numFeatures = self.files[camsFrom].shape('cam1')[1]
+        self.sources = [(self.files[camsFrom], cam) for cam in cams]
+        self.sources += [(self.files[k], 'fake') for k in FAKE_CAMS]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    @property
+    def shape(self):
+        return (len(STREAMS), self.fullLen, self.numFeatures)
+
+    def read(self, start=0, stop=None, dtype=np.float64):
+        # (9, stop - start, num_features) frames in STREAMS order
+        stop = self.fullLen if stop is None else min(stop, self.fullLen)
+        out = np.empty((len(STREAMS), stop - start, self.numFeatures), dtype=dtype)
+        for k, (f, name) in enumerate(self.sources):
+            f.read(name, start, stop, out=out[k])
+        return out
+
+    def blocks(self, block=1024, start=0, stop=None, dtype=np.float64):
+        # Yield (first frame, (9, n, num_features) block) in time order
+        stop = self.fullLen if stop is None else min(stop, self.fullLen)
+        for first in range(start, stop, block):
+            yield first, self.read(first, min(first + block, stop), dtype)
+
+
+def streamBlocks(data_dir, person, camsFrom=2, cache_dir=None, block=1024, stop=None, dtype=np.float64):
+    # ParticipantReader.blocks, or slices of the memory-mapped landmark cache
+    # when the participant is in cache_dir with the cameras of camsFrom
+    if cache_dir is not None and os.path.exists(cachePaths(cache_dir, person)[1]) and \
+            cacheHolds(cache_dir, person, camsFrom):
+        streams = openCached(cache_dir, person)
+        stop = streams.shape[1] if stop is None else min(stop, streams.shape[1])
+        for first in range(0, stop, block):
+            yield first, np.asarray(streams[:, first:min(first + block, stop)], dtype=dtype)
+        return
+    with ParticipantReader(data_dir, person, camsFrom) as reader:
+        yield from reader.blocks(block, stop=stop, dtype=dtype)
+
+
+def asFloats(streams):
+    # float32 streams (compact mode) stay float32, anything else is float64
+    streams = np.asarray(streams)
+    return streams if streams.dtype == np.float32 else streams.astype(np.float64, copy=False)
+
+
+class FrameView:
+    # A stream assembled from frames of the streams of a stacked array without
+    # copying them: frame t is streams[source[t], t]. Indexing gathers only
+    # the frames asked for, np.asarray materializes the whole stream.
+
+    def __init__(self, streams, source):
+        self.streams = streams
+        self.source = np.asarray(source, dtype=np.int16)
+        self.shape = self.source.shape + streams.shape[2:]
+        self.ndim = len(self.shape)
+        self.dtype = streams.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        rest = ()
+        if isinstance(key, tuple):
+            key, rest = key[0], key[1:]
+        if isinstance(key, slice):
+            frames = np.arange(*key.indices(self.shape[0]))
+        else:
+            frames = np.arange(self.shape[0])[key]
+        out = self.streams[self.source[frames], frames]
+        return out[(slice(None),) * np.ndim(frames) + rest] if rest else out
+
+    def __array__(self, dtype=None, copy=None):
+        # numpy 2 protocol (see requirements.txt): the frames are always
+        # gathered into a new array, so copy=False can't be honoured
+        if copy is False:
+            raise ValueError('a FrameView can only be converted to an array by copying its frames')
+        out = self[:]
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    def mean(self, axis=0, dtype=None, chunk=65536):
+        # Frame mean, gathered chunk by chunk
+        if axis != 0:
+            raise ValueError('FrameView only averages over frames')
+        total = np.zeros(self.shape[1:], dtype=dtype or np.float64)
+        for s in range(0, self.shape[0], chunk):
+            total += self[s:s + chunk].sum(axis=0, dtype=total.dtype)
+        return total / self.shape[0]
+
+
+class MappedArray:
+    # Picklable handle to a cached participant; opening it in a worker maps the
+    # file rather than copying the array through the pool
+
+    def __init__(self, cache_dir, person):
+        self.path = cachePaths(cache_dir, person)[0]
+
+    def get(self):
+        return np.load(self.path, mmap_mode='r')
+
+
+def asDataDicts(streams):
+    # Rebuild the loadmat-style dicts (data2, data3, data4) that the full
+    # sequence experiment works on, as views into a stacked stream array
+    cams = {f'cam{c}': streams[c - 1] for c in range(1, 7)}
+    return tuple(dict(cams, fake=streams[6 + i]) for i in range(len(FAKE_CAMS)))
@@ -0,0 +1,100 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Process-pool execution of independent experiment cells.
+#
+# The landmark streams of a participant are copied once into a shared memory
+# block; cells only carry a small SharedArray handle, and each worker maps the
+# block the first time it sees it instead of unpickling a private copy.
+# Participants in the landmark cache don't need the copy at all: their cells
+# carry a MappedArray and workers map the cache file directly.
+# Results are returned in cell order, so the output does not depend on which
+# worker finished first.
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+from socialverify.landmarks import MappedArray
+
+BLAS_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                 'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_FRAMEWORK_THREADS',
+                 'NUMEXPR_NUM_THREADS')
+
+# Shared memory blocks this process has attached to, by name
+_attached = {}
+
+
+class SharedArray:
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.name = self._shm.name
+        np.ndarray(self.shape, self.dtype, buffer=self._shm.buf)[...] = array
+
+    def __getstate__(self):
+        return {'name': self.name, 'shape': self.shape, 'dtype': self.dtype}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = None
+
+    def get(self):
+        shm = self._shm
+        if shm is None:
+            shm = _attached.get(self.name)
+            if shm is None:
+                shm = _attached[self.name] = shared_memory.SharedMemory(name=self.name)
+        array = np.ndarray(self.shape, self.dtype, buffer=shm.buf)
+        array.flags.writeable = False
+        return array
+
+    def release(self):
+        # Only the creating process owns (and removes) the block
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def asArray(data):
+    return data.get() if isinstance(data, (SharedArray, MappedArray)) else data
+
+
+def pinBlasThreads(n=1):
+    # One BLAS thread per worker, so N workers don't each spawn a thread per
+    # core. The environment covers freshly started interpreters, threadpoolctl
+    # the libraries that are already loaded.
+    for var in BLAS_ENV_VARS:
+        os.environ[var] = str(n)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(n)
+
+
+def runCells(func, cells, jobs=1, done=None):
+    # Evaluate func(*cell) for every cell, serially or on `jobs` processes.
+    # The result list is always in the order of `cells`. done() is called
+    # in this process whenever a cell finishes.
+    cells = list(cells)
+    if jobs is None or jobs <= 1:
+        results = []
+        for cell in cells:
+            results.append(func(*cell))
+            if done is not None:
+                done()
+        return results
+    with ProcessPoolExecutor(max_workers=jobs, initializer=pinBlasThreads) as pool:
+        futures = [pool.submit(func, *cell) for cell in cells]
+        if done is not None:
+            for _ in as_completed(futures):
+                done()
+        return [f.result() for f in futures]
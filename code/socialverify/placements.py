@@ -0,0 +1,64 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Evaluation over every placement of the fakes: each subset of the cameras
+# that have a fake stream, swapped for their fakes (2^m placements for m such
+# cameras, the empty one included), instead of the fixed X1..X3 of the
+# experiments.
+#
+# The feature vector of every real and fake stream, and the distances
+# between them, are computed once. A placement's distance matrix between the
+# cameras is then an index into those, and topOfTrees runs the detection for
+# all placements (and windows) in one batch.
+
+import itertools
+import numpy as np
+
+from socialverify.detect import detectFakes, isPartition, minority, pairwiseDistances, topOfTrees
+
+
+def allPlacements(fakeCams):
+    # Subsets of fakeCams (1-based camera numbers), by size
+    return [p for k in range(len(fakeCams) + 1) for p in itertools.combinations(fakeCams, k)]
+
+
+def placementRows(numCams, fakeCams, placements):
+    # (P, numCams): for each placement, the row of every camera in the stacked
+    # streams (the numCams real cameras, then the fakes of fakeCams)
+    rows = np.tile(np.arange(numCams), (len(placements), 1))
+    for p, placement in enumerate(placements):
+        for cam in placement:
+            rows[p, cam - 1] = numCams + list(fakeCams).index(cam)
+    return rows
+
+
+def placementScores(D, rows):
+    # D (..., numStreams, numStreams) distances between the stacked streams,
+    # rows from placementRows. Returns the topOfTree ratios (..., P) and
+    # labels (..., P, numCams) of every placement.
+    D = np.asarray(D)
+    sub = D[..., rows[:, :, None], rows[:, None, :]]
+    ratios, labels = topOfTrees(sub.reshape((-1,) + sub.shape[-2:]))
+    return ratios.reshape(sub.shape[:-2]), labels.reshape(sub.shape[:-1])
+
+
+def featureDistances(features, keep=None):
+    # Distances between the feature vectors (rows) of the stacked streams,
+    # over the frames in keep
+    return pairwiseDistances(features if keep is None else features[:, keep])
+
+
+def placementCorrect(ratios, labels, placements, threshes):
+    # (len(threshes), ..., P): exactly the swapped cameras detected as fakes,
+    # as full_sequence_exp.clusterHelper checks (an even split counts either
+    # way round)
+    numFakes = detectFakes(ratios, labels, threshes)
+    sizes = np.array([len(p) for p in placements])
+    numCams = labels.shape[-1]
+    flat = labels.reshape(-1, len(placements), numCams)
+    partition = np.array([[len(p) == 0 or isPartition(minority(c), [cam - 1 for cam in p], numCams)
+                           for c, p in zip(cs, placements)] for cs in flat]).reshape(labels.shape[:-1])
+    return (numFakes == sizes) & partition
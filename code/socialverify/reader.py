@@ -0,0 +1,128 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Lazy, chunked reading of the landmark .mat files.
+#
+# MatReader opens one file without reading it and reads a variable, or a
+# range of its frames, on demand. MATLAB v7.3 files are HDF5 and need h5py;
+# there a range of frames is a partial read of the chunks that hold it. Older
+# (v5) files can't be read partially: the requested variables are decoded on
+# first use, and only those (loadmat's variable_names).
+#
+# landmarks.ParticipantReader builds on it for the three files of a
+# participant.
+#
+# Mat73Writer writes v7.3 files block by block, for recordings that don't fit
+# in memory (and for the synthetic ones of reader_benchmark.py).
+
+import time
+import numpy as np
+from scipy.io import loadmat, whosmat
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+
+def _h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError('reading or writing MATLAB v7.3 (HDF5) files needs h5py (pip install h5py)')
+    return h5py
+
+
+def isHDF5(path):
+    # v7.3 files start with a 512 byte MATLAB header, then the HDF5 superblock
+    with open(path, 'rb') as f:
+        head = f.read(520)
+    return head.startswith(b'MATLAB 7.3') or HDF5_SIGNATURE in (head[:8], head[512:520])
+
+
+class MatReader:
+
+    def __init__(self, path, variables=None):
+        # variables: the names that will be read (all by default); for v5
+        # files the others are skipped when decoding
+        self.path = path
+        self.hdf5 = isHDF5(path)
+        self._arrays = None
+        if self.hdf5:
+            h5py = _h5py()
+            self.file = h5py.File(path, 'r')
+            # MATLAB is column-major: a (frames, features) matrix is stored
+            # as a (features, frames) dataset
+            self.shapes = {name: ds.shape[::-1] for name, ds in self.file.items()
+                           if isinstance(ds, h5py.Dataset) and ds.ndim == 2}
+        else:
+            self.file = None
+            self.shapes = {name: shape for name, shape, _ in whosmat(path)}
+        self.variables = list(self.shapes) if variables is None else list(variables)
+        missing = set(self.variables) - set(self.shapes)
+        if missing:
+            raise KeyError(f'{path} has no variables {sorted(missing)}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self._arrays = None
+
+    def shape(self, name):
+        return self.shapes[name]
+
+    def read(self, name, start=0, stop=None, out=None):
+        # Frames start..stop of a (frames, features) variable, into out if given
+        stop = self.shapes[name][0] if stop is None else stop
+        if self.hdf5:
+            block = self.file[name][:, start:stop].T
+        else:
+            if self._arrays is None:
+                self._arrays = loadmat(self.path, variable_names=self.variables)
+            block = self._arrays[name][start:stop]
+        if out is None:
+            return np.array(block, dtype=np.float64)
+        out[...] = block
+        return out
+
+
+class Mat73Writer:
+    # MATLAB v7.3 file of (numFrames, numFeatures) double matrices, written
+    # in blocks of frames. Datasets are chunked by `chunk` frames, the unit
+    # of MatReader's partial reads.
+
+    def __init__(self, path, names, numFrames, numFeatures, chunk=1024):
+        h5py = _h5py()
+        self.path = path
+        self.file = h5py.File(path, 'w', userblock_size=512)
+        for name in names:
+            ds = self.file.create_dataset(name, (numFeatures, numFrames), dtype=np.float64,
+                                          chunks=(numFeatures, min(chunk, numFrames)))
+            ds.attrs['MATLAB_class'] = np.bytes_('double')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, name, start, block):
+        self.file[name][:, start:start + len(block)] = np.asarray(block).T
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        # The 128 byte MATLAB header at the start of the user block
+        text = f'MATLAB 7.3 MAT-file, Platform: GLNXA64, Created on: {time.ctime()} HDF5 schema 1.00 .'
+        header = text.encode().ljust(116) + b' ' * 8 + b'\x00\x02' + b'IM'
+        with open(self.path, 'r+b') as f:
+            f.write(header)
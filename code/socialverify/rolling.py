@@ -0,0 +1,195 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Sliding-window version of verify.mahalanobisDistances.
+#
+# Consecutive windows share all but one frame, so instead of refitting
+# StandardScaler + PCA on every cam[start:end,:] we keep running sums of the
+# frames and of their cross-products, add the incoming frame and drop the
+# outgoing one on every step, and read the scaler statistics and feature
+# covariance straight off those sums. The principal subspace is then the top
+# eigenvectors of that (num_features x num_features) matrix, so the cost of
+# a step no longer depends on the window size. The only per-window work that
+# still scales with the window is projecting its frames and the MCD fit,
+# both of which produce the window-sized distance vector itself.
+#
+# Tolerance: PCA scores match sklearn up to the sign of each component, which
+# the (affine equivariant) MCD distances do not see. With the same estimator
+# and random_state the distance vectors agree with mahalanobisDistances to
+# roughly 1e-8 relative error; the running sums are recomputed from scratch
+# every `refresh` steps so the drift from add/drop updates stays bounded.
+
+import numpy as np
+from socialverify.estimators import makeEstimator
+from socialverify.instrument import stage
+
+
+class _WindowMahalanobis:
+    # Shared part of the sliding engines: subclasses keep `sum` and `cross`
+    # up to date for the frames returned by block(), stored relative to
+    # `shift`
+
+    def __init__(self, window, num_pcs, scale, random_state, refresh, estimator):
+        self.window = window
+        self.num_pcs = num_pcs
+        self.scale = scale
+        self.random_state = random_state
+        self.refresh = refresh
+        # One estimator per stream, so warm-started ones see consecutive windows
+        self.estimator = makeEstimator(estimator, random_state)
+
+    def block(self):
+        raise NotImplementedError
+
+    def index(self):
+        # Frame numbers of the rows of block()
+        raise NotImplementedError
+
+    def statistics(self):
+        # Mean and (population) standard deviation of the current window, as
+        # StandardScaler would compute them, plus the covariance PCA sees.
+        mean = self.sum / self.window
+        cov = self.cross / self.window - np.outer(mean, mean)
+        var = np.clip(np.diag(cov), 0, None)
+        if self.scale:
+            std = np.sqrt(var)
+            # StandardScaler leaves constant columns unscaled
+            std[std < 10 * np.finfo(np.float64).eps] = 1.0
+            cov = cov / np.outer(std, std)
+        else:
+            std = np.ones_like(mean)
+        return mean, std, cov
+
+    def scores(self):
+        # Equivalent of PCA(num_pcs).fit_transform(StandardScaler().fit_transform(window))
+        with stage('scaling'):
+            mean, std, cov = self.statistics()
+        with stage('pca'):
+            evals, evecs = np.linalg.eigh(cov)
+            comps = evecs[:, ::-1][:, :self.num_pcs]
+            return ((self.block() - mean) / std) @ comps
+
+    def distances(self):
+        T = self.scores()
+        with stage('mcd'):
+            robust_cov = self.estimator.fit(T, index=self.index())
+            return robust_cov.mahalanobis(T)
+
+
+class RollingMahalanobis(_WindowMahalanobis):
+
+    def __init__(self, data, window, num_pcs, scale=True, random_state=None,
+                 refresh=512, estimator='mcd'):
+        super().__init__(window, num_pcs, scale, random_state, refresh, estimator)
+        if not hasattr(data, 'shape'):
+            data = np.asarray(data, dtype=np.float64)
+        if window > data.shape[0]:
+            raise ValueError(f'window ({window}) is longer than the sequence ({data.shape[0]})')
+        # Accumulating around the sequence mean keeps the sums small, which
+        # avoids cancellation when turning them into a covariance. The
+        # frames are shifted as they are read, so data (float32 or a
+        # FrameView in compact mode) is never copied; the sums are float64.
+        self.shift = data.mean(axis=0, dtype=np.float64)
+        self.data = data
+        self.seek(0)
+
+    @property
+    def end(self):
+        return self.start + self.window
+
+    def block(self):
+        return self.data[self.start:self.end, :] - self.shift
+
+    def index(self):
+        return np.arange(self.start, self.end)
+
+    def seek(self, start):
+        if start < 0 or start + self.window > self.data.shape[0]:
+            raise IndexError(f'window start {start} out of range')
+        self.start = start
+        self._steps = 0
+        block = self.block()
+        self.sum = block.sum(axis=0)
+        self.cross = block.T @ block
+
+    def step(self):
+        # Slide the window forward by one frame
+        if self.end >= self.data.shape[0]:
+            raise IndexError('window is already at the end of the sequence')
+        self._steps += 1
+        if self._steps >= self.refresh:
+            self.seek(self.start + 1)
+            return
+        old = self.data[self.start, :] - self.shift
+        new = self.data[self.end, :] - self.shift
+        self.sum += new - old
+        self.cross += np.outer(new, new) - np.outer(old, old)
+        self.start += 1
+
+
+class RingMahalanobis(_WindowMahalanobis):
+    # Streaming counterpart of RollingMahalanobis: frames are pushed one at a
+    # time into a ring buffer of the last `window` frames, so memory and the
+    # cost of a push stay constant however long the stream runs.
+    #
+    # The ring is stored twice over (frame n goes to slots n % window and
+    # n % window + window), which keeps the current window available as a
+    # contiguous, chronologically ordered view.
+
+    def __init__(self, window, num_features, num_pcs, scale=True, random_state=None,
+                 refresh=512, estimator='mcd'):
+        super().__init__(window, num_pcs, scale, random_state, refresh, estimator)
+        self.ring = np.zeros((2 * window, num_features))
+        self.count = 0
+        self.shift = None
+        self.sum = np.zeros(num_features)
+        self.cross = np.zeros((num_features, num_features))
+
+    @property
+    def full(self):
+        return self.count >= self.window
+
+    def block(self):
+        if not self.full:
+            raise ValueError(f'only {self.count} of {self.window} frames received')
+        pos = self.count % self.window
+        return self.ring[pos:pos + self.window, :]
+
+    def index(self):
+        return np.arange(self.count - self.window, self.count)
+
+    def push(self, frame):
+        frame = np.asarray(frame, dtype=np.float64)
+        if self.shift is None:
+            # We don't know the stream's mean up front; the first frame is
+            # close enough to keep the sums small
+            self.shift = frame.copy()
+        new = frame - self.shift
+        pos = self.count % self.window
+        if self.full:
+            old = self.ring[pos, :]
+            self.sum -= old
+            self.cross -= np.outer(old, old)
+        self.ring[pos, :] = new
+        self.ring[pos + self.window, :] = new
+        self.sum += new
+        self.cross += np.outer(new, new)
+        self.count += 1
+        if self.full and self.count % self.refresh == 0:
+            block = self.block()
+            self.sum = block.sum(axis=0)
+            self.cross = block.T @ block
+
+
+def rollingDistances(data, window, num_pcs, numWin=None, **kwargs):
+    # Yield the distance vector of every window start in turn
+    engine = RollingMahalanobis(data, window, num_pcs, **kwargs)
+    if numWin is None:
+        numWin = engine.data.shape[0] - window + 1
+    for start in range(numWin):
+        if start > 0:
+            engine.step()
+        yield engine.distances()
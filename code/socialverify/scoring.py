@@ -0,0 +1,72 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Scoring of the sliding window experiment. Every window start gets one
+# outcome per fake-count case (X0..X3 of window_acc_exp.clusterWindow):
+#
+#   TP  window contains faked frames only & the fakes are detected
+#   TN  window contains real frames & no fake is detected
+#   FP  window contains real frames & a fake is detected, or the wrong number
+#       of fakes is detected
+#   FN  window contains faked frames only & the fakes are missed or the
+#       detected partition is the wrong one
+#
+# X0 has no fakes, so there only TN (nothing detected) and FP (anything else)
+# occur. The fake streams are spliced fake / real / fake in thirds, and a
+# window counts as fake when it misses the real middle third entirely.
+
+import numpy as np
+
+from socialverify.detect import detectFakes
+
+TP, TN, FP, FN = range(4)
+
+# 2-cluster partition of cam1..cam6 expected for X0..X3 (fakes replace cam4,
+# then cam3, then cam2), up to swapping the labels
+EXPECTED = np.array([[1, 1, 1, 1, 1, 1],
+                     [1, 1, 1, 2, 1, 1],
+                     [1, 1, 2, 2, 1, 1],
+                     [1, 2, 2, 2, 1, 1]])
+
+
+def fakeWindows(numWin, j, intervalWin):
+    # Windows [start, start + j) that don't overlap [intervalWin, 2*intervalWin)
+    start = np.arange(numWin)
+    return np.minimum(start + j, 2 * intervalWin) <= np.maximum(start, intervalWin)
+
+
+def windowOutcomes(numFakes, labels, isFake):
+    # numFakes has shape (..., 4, numWin) (see detectFakes), labels
+    # (4, numWin, numCams) and isFake (numWin,). Returns the TP/TN/FP/FN
+    # outcome of every case and window, with the shape of numFakes.
+    cases = np.arange(4)[:, None]
+    expected = EXPECTED[:, None, :]
+    correct = np.all(labels == expected, axis = -1) | np.all(labels == 3 - expected, axis = -1)
+    found = np.where(isFake, np.where(correct, TP, FN), FP)
+    missed = np.where(isFake, FN, TN)
+    out = np.where(numFakes == cases, found, np.where(numFakes == 0, missed, FP))
+    out[..., 0, :] = np.where(numFakes[..., 0, :] == 0, TN, FP)
+    return out
+
+
+def scoreWindows(ratios, labels, intervalWin, threshes, j):
+    # Outcome masks of one (participant, window size) cell for every
+    # threshold, shape (len(threshes), 4 cases, 4 outcomes, numWin): masks[t, k]
+    # are the rows TP, TN, FP, FN of fake-count case k
+    numFakes = detectFakes(ratios, labels, threshes)
+    isFake = fakeWindows(ratios.shape[1], j, intervalWin)
+    out = windowOutcomes(numFakes, labels, isFake)
+    return out[..., None, :] == np.arange(4)[:, None]
+
+
+def windowRates(masks):
+    # (TP rate, FP rate, accuracy) per threshold and case from scoreWindows
+    counts = np.sum(masks, axis = -1)
+    tp, tn, fp, fn = (counts[..., k] for k in range(4))
+    tpr = tp / (tp + fn + 1e-7)
+    fpr = fp / (fp + tn + 1e-7)
+    acc = (tp + tn) / np.maximum(np.sum(counts, axis = -1), 1)
+    return tpr, fpr, acc
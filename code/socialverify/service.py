@@ -0,0 +1,432 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Ingestion and verification service for event uploads, on asyncio and the
+# standard library only (a minimal HTTP/1.1 with keep-alive).
+#
+#   POST /events/<event>/cameras/<camera>   landmarks of one device, as an
+#                                           .npy body of shape (frames, features)
+#   POST /events/<event>/verify             verify with the cameras so far
+#   GET  /events/<event>                    state and, once done, the result
+#   GET  /status                            queue, pool and memory figures
+#
+# An event is verified once min_cams cameras have arrived (or on /verify).
+# Verification runs in a process pool of `workers` processes: a dispatcher
+# takes ready events off a bounded queue and, when a worker slot is free,
+# sends every event that is ready by then (up to batch_size) as one task, so
+# events that pile up under load share a round trip to the pool.
+#
+# Backpressure: uploads are refused with 503 and a Retry-After header when
+# they would start a new event while the landmarks held in memory exceed
+# max_bytes, or complete an event while the queue of events waiting for the
+# pool is full.
+#
+# Finished (done or failed) events are kept for keep_seconds, and at most
+# keep_events of them, for clients to fetch their result; older ones are
+# dropped and GET answers 404 for them. Events still collecting that get no
+# upload for collect_seconds are abandoned: they are dropped and their
+# landmarks no longer count against max_bytes. Both are checked on every
+# request and, between requests, every few seconds.
+#
+# Modes: 'full' is verify.verify_sequence, the check on the whole sequence;
+# 'window' is verify.verify_windows, the sliding window check every `stride`
+# frames.
+
+import asyncio
+import io
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+import numpy as np
+
+from socialverify.detect import minority
+from socialverify.parallel import pinBlasThreads
+from socialverify.verify import verify_sequence, verify_windows
+
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def contentLength(headers):
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(400, f'malformed Content-Length: {headers["content-length"]}')
+    return length
+
+
+def verifyEvent(streams, cameras, config):
+    # The verification of one event, in a worker: streams are the cameras'
+    # (frames, features) arrays, trimmed here to the shortest
+    length = min(len(s) for s in streams)
+    cams = np.stack([np.asarray(s[:length], dtype=np.float64) for s in streams])
+    options = dict(thresh=config['thresh'], num_pcs=config['num_pcs'], random_state=config['seed'],
+                   estimator=config['estimator'])
+    result = {'cameras': cameras, 'frames': length}
+    if config['mode'] == 'full':
+        numFakes, fakes, ratio = verify_sequence(cams, **options)
+        result.update(numFakes=numFakes, fakes=[cameras[k] for k in fakes], ratio=float(ratio))
+    else:
+        window = min(config['window'], length)
+        starts, numFakes, ratios, labels = verify_windows(cams, window, config['stride'], **options)
+        verdicts = []
+        for start, n, ratio, c in zip(starts, numFakes, ratios, labels):
+            fakes = [cameras[k] for k in minority(c)] if n else []
+            verdicts.append({'numFakes': int(n), 'fakes': fakes, 'ratio': float(ratio), 'start': int(start)})
+        result['windows'] = verdicts
+        result['numFakes'] = max((v['numFakes'] for v in verdicts), default=0)
+        result['fakes'] = sorted({c for v in verdicts for c in v['fakes']})
+    return result
+
+
+def verifyBatch(jobs, config):
+    # verifyEvent over a batch of (streams, cameras), errors reported per event
+    results = []
+    for streams, cameras in jobs:
+        t0 = time.perf_counter()
+        try:
+            result = verifyEvent(streams, cameras, config)
+        except Exception as e:
+            result = {'error': f'{type(e).__name__}: {e}'}
+        result['seconds'] = time.perf_counter() - t0
+        results.append(result)
+    return results
+
+
+class Event:
+
+    def __init__(self, name):
+        self.name = name
+        self.cameras = {}
+        self.state = 'collecting'
+        self.result = None
+        self.created = time.time()
+        self.ready = None
+        self.finished = None
+
+    @property
+    def nbytes(self):
+        return sum(s.nbytes for s in self.cameras.values())
+
+    def status(self):
+        out = {'event': self.name, 'state': self.state, 'cameras': sorted(self.cameras)}
+        if self.ready is not None and self.finished is not None:
+            out['latency'] = self.finished - self.ready
+        if self.result is not None:
+            out['result'] = self.result
+        return out
+
+
+class VerificationService:
+
+    def __init__(self, min_cams=6, workers=2, queue_size=16, batch_size=4, max_bytes=512 << 20,
+                 max_upload=64 << 20, mode='full', num_pcs=5, thresh=1.3, window=250, stride=30,
+                 seed=0, estimator='mcd', keep_seconds=600, keep_events=10000, collect_seconds=300):
+        if min_cams < 3:
+            raise ValueError('need at least 3 cameras to compare merge heights')
+        self.min_cams = min_cams
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.max_upload = max_upload
+        self.config = {'mode': mode, 'num_pcs': num_pcs, 'thresh': thresh, 'window': window,
+                       'stride': stride, 'seed': seed, 'estimator': estimator}
+        self.keep_seconds = keep_seconds
+        self.keep_events = keep_events
+        self.collect_seconds = collect_seconds
+        self.events = {}
+        # names of the finished events, oldest first, and of the events still
+        # collecting, least recently uploaded to first
+        self.done = OrderedDict()
+        self.collecting = OrderedDict()
+        self.queue = asyncio.Queue(queue_size)
+        self.slots = asyncio.Semaphore(workers)
+        self.held = 0
+        self.running = 0
+        self.counts = {'requests': 0, 'uploads': 0, 'rejected': 0, 'batches': 0, 'verified': 0,
+                       'expired': 0, 'abandoned': 0}
+        self.pool = None
+        self.janitor = None
+        self.server = None
+        self.tasks = set()
+        self.connections = {}
+
+    async def start(self, host='127.0.0.1', port=8080):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=pinBlasThreads)
+        self.dispatcher = asyncio.create_task(self.dispatch())
+        self.janitor = asyncio.create_task(self.sweep())
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            # idle keep-alive connections see EOF and end their handlers
+            for writer in list(self.connections.values()):
+                writer.close()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await self.server.wait_closed()
+        self.dispatcher.cancel()
+        self.janitor.cancel()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.pool.shutdown()
+
+    # Verification
+
+    def enqueue(self, event):
+        # Queue a complete event for the pool, or refuse it if the queue is full
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            raise HTTPError(503, 'verification queue is full', {'Retry-After': '1'})
+        event.state = 'queued'
+        self.collecting.pop(event.name, None)
+        event.ready = time.perf_counter()
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            for event in batch:
+                event.state = 'running'
+            self.running += 1
+            jobs = [(list(e.cameras.values()), list(e.cameras)) for e in batch]
+            future = loop.run_in_executor(self.pool, verifyBatch, jobs, self.config)
+            task = asyncio.create_task(self.finish(batch, future))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def finish(self, batch, future):
+        try:
+            try:
+                results = await future
+            except Exception as e:
+                results = [{'error': f'{type(e).__name__}: {e}'}] * len(batch)
+            self.counts['batches'] += 1
+            for event, result in zip(batch, results):
+                event.result = result
+                event.state = 'failed' if 'error' in result else 'done'
+                event.finished = time.perf_counter()
+                # the landmarks are not needed any more
+                self.held -= event.nbytes
+                event.cameras = dict.fromkeys(event.cameras, np.zeros(0))
+                self.counts['verified'] += 1
+                self.done[event.name] = event.finished
+            self.expire()
+        finally:
+            self.running -= 1
+            self.slots.release()
+
+    def expire(self):
+        # Drop the finished events past keep_seconds or keep_events, and the
+        # collecting ones without an upload for collect_seconds
+        now = time.perf_counter()
+        while self.done:
+            name, finished = next(iter(self.done.items()))
+            if len(self.done) <= self.keep_events and now - finished <= self.keep_seconds:
+                break
+            del self.done[name]
+            del self.events[name]
+            self.counts['expired'] += 1
+        while self.collecting:
+            name, updated = next(iter(self.collecting.items()))
+            if now - updated <= self.collect_seconds:
+                break
+            del self.collecting[name]
+            self.held -= self.events.pop(name).nbytes
+            self.counts['abandoned'] += 1
+
+    async def sweep(self):
+        # expire between requests, so an idle service releases its memory too
+        period = max(min(self.keep_seconds, self.collect_seconds) / 10, 0.1)
+        while True:
+            await asyncio.sleep(min(period, 5))
+            self.expire()
+
+    # HTTP
+
+    def status(self):
+        states = {}
+        for event in self.events.values():
+            states[event.state] = states.get(event.state, 0) + 1
+        return dict(self.counts, events=states, queued=self.queue.qsize(),
+                    running=self.running, workers=self.workers,
+                    held_bytes=self.held, max_bytes=self.max_bytes, config=self.config)
+
+    async def route(self, method, path, body):
+        self.expire()
+        parts = [p for p in urlsplit(path).path.split('/') if p]
+        if parts == ['status']:
+            if method != 'GET':
+                raise HTTPError(405, 'use GET')
+            return 200, self.status()
+        if len(parts) < 2 or parts[0] != 'events':
+            raise HTTPError(404, f'no route for {path}')
+        name = parts[1]
+        if len(parts) == 2:
+            if method != 'GET':
+                raise HTTPError(405, 'use GET')
+            if name not in self.events:
+                raise HTTPError(404, f'unknown event {name}')
+            return 200, self.events[name].status()
+        if method != 'POST':
+            raise HTTPError(405, 'use POST')
+        if parts[2:] == ['verify']:
+            event = self.events.get(name)
+            if event is None:
+                raise HTTPError(404, f'unknown event {name}')
+            if event.state != 'collecting':
+                raise HTTPError(409, f'event {name} is already {event.state}')
+            if len(event.cameras) < 3:
+                raise HTTPError(409, 'need at least 3 cameras')
+            self.enqueue(event)
+            return 202, event.status()
+        if len(parts) == 4 and parts[2] == 'cameras':
+            return 202, self.upload(name, parts[3], body)
+        raise HTTPError(404, f'no route for {path}')
+
+    def upload(self, name, camera, body):
+        event = self.events.get(name)
+        if event is not None and event.state != 'collecting':
+            raise HTTPError(409, f'event {name} is already {event.state}')
+        # Only new events wait for memory: the ones already collecting have
+        # to be able to complete, or the landmarks held would never go down
+        if event is None and self.held + len(body) > self.max_bytes:
+            raise HTTPError(503, 'too many landmarks held, retry later', {'Retry-After': '1'})
+        try:
+            stream = np.load(io.BytesIO(body), allow_pickle=False)
+        except Exception as e:
+            raise HTTPError(400, f'body is not an .npy array: {e}')
+        if stream.ndim != 2 or not np.issubdtype(stream.dtype, np.number):
+            raise HTTPError(400, f'expected a numeric (frames, features) array, got {stream.dtype} {stream.shape}')
+        if event is None:
+            event = self.events[name] = Event(name)
+        completes = camera not in event.cameras and len(event.cameras) + 1 >= self.min_cams
+        if completes and self.queue.full():
+            raise HTTPError(503, 'verification queue is full', {'Retry-After': '1'})
+        self.held += stream.nbytes - (event.cameras[camera].nbytes if camera in event.cameras else 0)
+        event.cameras[camera] = stream
+        self.collecting[name] = time.perf_counter()
+        self.collecting.move_to_end(name)
+        self.counts['uploads'] += 1
+        if completes:
+            self.enqueue(event)
+        return event.status()
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, path, _ = lines[0].split(' ', 2)
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'malformed request line'}, close=True)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        k, v = line.split(':', 1)
+                        headers[k.strip().lower()] = v.strip()
+                close = headers.get('connection', '').lower() == 'close'
+                try:
+                    length = contentLength(headers)
+                except HTTPError as e:
+                    await self.respond(writer, e.status, {'error': str(e)}, close=True)
+                    break
+                if length > self.max_upload:
+                    await self.respond(writer, 413, {'error': f'uploads are limited to {self.max_upload} bytes'},
+                                       close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                self.counts['requests'] += 1
+                try:
+                    status, payload = await self.route(method, path, body)
+                    extra = {}
+                except HTTPError as e:
+                    status, payload, extra = e.status, {'error': str(e)}, e.headers
+                    if status == 503:
+                        self.counts['rejected'] += 1
+                await self.respond(writer, status, payload, extra, close)
+                if close:
+                    break
+        except Exception as e:
+            await self.respond(writer, 500, {'error': f'{type(e).__name__}: {e}'}, close=True)
+        finally:
+            writer.close()
+            del self.connections[task]
+
+    async def respond(self, writer, status, payload, headers=None, close=False):
+        body = json.dumps(payload).encode()
+        head = [f'HTTP/1.1 {status} {REASONS.get(status, "")}', 'Content-Type: application/json',
+                f'Content-Length: {len(body)}', f'Connection: {"close" if close else "keep-alive"}']
+        head += [f'{k}: {v}' for k, v in (headers or {}).items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+class Client:
+    # Keep-alive HTTP client for the service, one request at a time
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b''):
+        # Returns (status, decoded JSON body, headers)
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n\r\n'
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+        lines = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ')[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                k, v = line.split(':', 1)
+                headers[k.strip().lower()] = v.strip()
+        payload = json.loads(await self.reader.readexactly(contentLength(headers)) or b'null')
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, payload, headers
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def encodeStream(stream):
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(stream), allow_pickle=False)
+    return buf.getvalue()
@@ -0,0 +1,168 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Persistent store of the per-window experiment outputs (the topOfTree ratios
+# and labels of X0..X3 for every window start), in one SQLite file.
+#
+# A cell, e.g. one (participant, window size) of window_acc_exp, is addressed
+# by the SHA-256 of its parameters (cellKey). The parameters include a code
+# version, a hash of the source that computes the outputs (codeVersion), so
+# changing that code starts new cells instead of mixing old and new results.
+# Outputs are written in chunks of consecutive window starts as they are
+# computed: an interrupted cell resumes at its first missing chunk, and a
+# cell is complete once its chunks cover every window start.
+#
+# The database runs in WAL mode, so worker processes can write their chunks
+# while others read. A ResultStore pickles as its path; each process opens
+# its own connection on first use.
+
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cells (
+    key TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    frames INTEGER NOT NULL,
+    windows INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    key TEXT NOT NULL REFERENCES cells(key),
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    cams INTEGER NOT NULL,
+    ratios BLOB NOT NULL,
+    labels BLOB NOT NULL,
+    PRIMARY KEY (key, start)
+);
+'''
+
+
+def cellKey(params):
+    # params is a JSON-serializable dict; key order does not matter
+    blob = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def codeVersion(*objects):
+    # Hash of the source of modules, classes or functions
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()[:16]
+
+
+class ResultStore:
+
+    def __init__(self, path, chunk=256, timeout=60.0):
+        # chunk is the number of window starts written at a time
+        self.path = path
+        self.chunk = chunk
+        self.timeout = timeout
+        self._db = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'chunk': self.chunk, 'timeout': self.timeout}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            outDir = os.path.dirname(self.path)
+            if outDir and not os.path.exists(outDir):
+                os.makedirs(outDir)
+            self._db = sqlite3.connect(self.path, timeout=self.timeout)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def addCell(self, key, params, frames, windows):
+        with self.db:
+            self.db.execute('INSERT OR IGNORE INTO cells VALUES (?, ?, ?, ?, ?)',
+                            (key, json.dumps(params, sort_keys=True), frames, windows, time.time()))
+
+    def cell(self, key):
+        # (params, frames, windows) of a cell, None if it was never added
+        row = self.db.execute('SELECT params, frames, windows FROM cells WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def putChunk(self, key, start, ratios, labels):
+        # ratios (4, n) and labels (4, n, numCams) of window starts start..start+n-1
+        ratios = np.ascontiguousarray(ratios, dtype=np.float64)
+        labels = np.ascontiguousarray(labels, dtype=np.int32)
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)',
+                            (key, start, start + ratios.shape[1], labels.shape[2],
+                             ratios.tobytes(), labels.tobytes()))
+
+    def _chunks(self, key):
+        return self.db.execute('SELECT start, stop, cams, ratios, labels FROM chunks '
+                               'WHERE key = ? ORDER BY start', (key,)).fetchall()
+
+    def missing(self, key):
+        # Ranges of window starts of a cell that have no output yet
+        info = self.cell(key)
+        if info is None:
+            raise KeyError(key)
+        gaps, pos = [], 0
+        for start, stop in self.db.execute('SELECT start, stop FROM chunks WHERE key = ? ORDER BY start',
+                                           (key,)):
+            if start > pos:
+                gaps.append(range(pos, start))
+            pos = max(pos, stop)
+        if pos < info[2]:
+            gaps.append(range(pos, info[2]))
+        return gaps
+
+    def load(self, key):
+        # (ratios, labels) of a complete cell, None if any window is missing
+        info = self.cell(key)
+        if info is None or self.missing(key):
+            return None
+        ratios, labels = [], []
+        for start, stop, cams, r, l in self._chunks(key):
+            n = stop - start
+            ratios.append(np.frombuffer(r, dtype=np.float64).reshape(4, n))
+            labels.append(np.frombuffer(l, dtype=np.int32).reshape(4, n, cams))
+        return np.concatenate(ratios, axis=1), np.concatenate(labels, axis=1)
+
+    def collect(self, key, windows, starts, progress=None):
+        # Run the per-window outputs of windows(starts) (an iterator of
+        # (ratios, labels) pairs, one per start) into the store chunk by
+        # chunk. starts is a range of consecutive window starts (e.g. from
+        # missing), since a chunk covers start..stop. progress is called once
+        # per window.
+        if not isinstance(starts, range) or starts.step != 1:
+            raise ValueError(f'collect needs a range of consecutive window starts, got {starts!r}')
+        results = windows(starts)
+        for first in range(starts.start, starts.stop, self.chunk):
+            n = min(self.chunk, starts.stop - first)
+            ratios, labels = None, None
+            for w in range(n):
+                r, c = next(results)
+                if ratios is None:
+                    ratios = np.zeros((4, n))
+                    labels = np.zeros((4, n, c.shape[-1]), dtype=np.int32)
+                ratios[:, w], labels[:, w, :] = r, c
+                if progress is not None:
+                    progress()
+            self.putChunk(key, first, ratios, labels)
@@ -0,0 +1,76 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Real-time verification over live camera feeds.
+#
+# Each camera pushes one frame of mouth landmarks at a time. We keep the last
+# `window` frames of every camera in a RingMahalanobis engine and, once the
+# window is full, emit a verdict every `stride` frames: detect.detectCameras
+# on the distances of the current window, for any number of cameras. Memory
+# and the work per verdict are fixed by the window size and camera count,
+# not by how long the stream has been running.
+
+import time
+from collections import namedtuple
+import numpy as np
+
+from socialverify.detect import detectCameras, minority
+from socialverify.rolling import RingMahalanobis
+
+# frame: number of the last frame in the window. fakes: indices of the
+# cameras in the minority partition (empty when numFakes is 0).
+# latency: seconds from the last frame arriving (or being due, see push) to
+# the verdict.
+Verdict = namedtuple('Verdict', ['frame', 'numFakes', 'labels', 'ratio', 'fakes', 'latency'])
+
+
+class StreamingDetector:
+
+    def __init__(self, numCams, numFeatures, window=250, stride=1, num_pcs=5,
+                 thresh=1.3, random_state=0, estimator='mcd'):
+        if numCams < 3:
+            raise ValueError('need at least 3 cameras to compare merge heights')
+        self.window = window
+        self.stride = stride
+        self.thresh = thresh
+        self.engines = [RingMahalanobis(window, numFeatures, num_pcs, random_state=random_state,
+                                        estimator=estimator)
+                        for _ in range(numCams)]
+
+    @property
+    def count(self):
+        return self.engines[0].count
+
+    def push(self, frames, arrived=None):
+        # frames holds one (numFeatures,) frame per camera. Returns a Verdict
+        # when one is due, otherwise None. arrived is the perf_counter time
+        # the frames arrived, now by default; a replay passes the time they
+        # were due, so falling behind shows in the latency.
+        if arrived is None:
+            arrived = time.perf_counter()
+        if len(frames) != len(self.engines):
+            raise ValueError(f'expected {len(self.engines)} frames, got {len(frames)}')
+        for engine, frame in zip(self.engines, frames):
+            engine.push(frame)
+        if self.count < self.window or (self.count - self.window) % self.stride:
+            return None
+        return self.verdict(arrived)
+
+    def verdict(self, arrived=None):
+        if arrived is None:
+            arrived = time.perf_counter()
+        X = np.array([engine.distances() for engine in self.engines])
+        numFakes, c, ratio = detectCameras(X, self.thresh)
+        fakes = tuple(minority(c)) if numFakes else ()
+        return Verdict(self.count - 1, numFakes, c, ratio, fakes, time.perf_counter() - arrived)
+
+    def run(self, cameras):
+        # Consume N camera iterators in lockstep, yielding verdicts as they are
+        # due. Stops when any camera runs out of frames.
+        for frames in zip(*cameras):
+            verdict = self.push(frames)
+            if verdict is not None:
+                yield verdict
@@ -0,0 +1,145 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Seeded synthetic landmark streams, for benchmarking and checking the
+# pipeline without the landmark dataset.
+#
+# One talking mouth is simulated as a latent trajectory (mouth opening, lip
+# width and a slow head drift) driving 20 landmarks: 12 on the outer and 8 on
+# the inner lip contour. Every camera sees it through its own fixed view
+# (rotation, foreshortening, scale and offset) plus landmark noise, so the
+# camera streams are correlated the way the real recordings are. Frames are
+# 40 features, the 20 x coordinates followed by the 20 y coordinates.
+#
+# Tracking failures are single frames where a camera's landmarks jump far off,
+# and fakes are copies of a camera where given segments are driven by a
+# different mouth trajectory (lip-synced to other speech).
+
+import numpy as np
+
+NUM_LANDMARKS = 20
+
+
+def _mouthShape():
+    # Unit contour angles and radii of the 20 landmarks at rest
+    outer = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+    inner = np.linspace(0, 2 * np.pi, 8, endpoint=False)
+    angles = np.concatenate([outer, inner])
+    radii = np.concatenate([np.ones(12), 0.6 * np.ones(8)])
+    return angles, radii
+
+
+def _smooth(x, width):
+    kernel = np.hanning(2 * width + 1)
+    kernel /= kernel.sum()
+    return np.stack([np.convolve(col, kernel, mode='same') for col in x.T], axis=1)
+
+
+def mouthMotion(length, rng):
+    # Latent (opening, width, drift x, drift y) per frame
+    opening = np.clip(_smooth(rng.normal(size=(length, 1)), 4)[:, 0] * 4, 0, None)
+    width = _smooth(rng.normal(size=(length, 1)), 8)[:, 0] * 0.8
+    drift = np.cumsum(rng.normal(scale=0.05, size=(length, 2)), axis=0)
+    return np.column_stack([opening, width, drift])
+
+
+def renderLandmarks(motion, view):
+    # (length, 4) latent motion -> (length, 40) landmarks seen from view
+    angles, radii = _mouthShape()
+    opening, width, dx, dy = motion.T
+    x = np.cos(angles) * radii * (1 + 0.1 * width[:, None]) + dx[:, None]
+    y = np.sin(angles) * radii * (0.4 + 0.25 * opening[:, None]) + dy[:, None]
+    rot, squash, scale, offset = view
+    c, s = np.cos(rot), np.sin(rot)
+    u = scale * squash * (c * x - s * y) + offset[0]
+    v = scale * (s * x + c * y) + offset[1]
+    return np.hstack([u, v])
+
+
+def _randomView(rng):
+    return (rng.uniform(-0.3, 0.3), rng.uniform(0.6, 1.0), rng.uniform(20, 40),
+            rng.uniform(100, 300, size=2))
+
+
+def _addSpikes(stream, rate, rng):
+    frames = np.flatnonzero(rng.random(stream.shape[0]) < rate)
+    stream[frames] += rng.normal(scale=50, size=(len(frames), stream.shape[1]))
+    return frames
+
+
+def syntheticCameras(numCams=6, length=1000, noise=0.5, spikes=0.002, fakeCams=(),
+                     segments=None, seed=0):
+    # Returns (streams, fakes): streams is (numCams, length, 40) real cameras,
+    # fakes is (len(fakeCams), length, 40) with fakes[k] a copy of camera
+    # fakeCams[k] (1-based) whose segments (list of (start, end) frames,
+    # default the whole sequence) follow a different mouth trajectory.
+    # spikes is the per-frame tracking failure rate of every stream.
+    rng = np.random.default_rng(seed)
+    motion = mouthMotion(length, rng)
+    views = [_randomView(rng) for _ in range(numCams)]
+    streams = np.stack([renderLandmarks(motion, view) for view in views])
+    fakes = np.zeros((len(fakeCams), length, 2 * NUM_LANDMARKS))
+    if segments is None:
+        segments = [(0, length)]
+    for k, cam in enumerate(fakeCams):
+        fakeMotion = motion.copy()
+        other = mouthMotion(length, rng)
+        for start, end in segments:
+            # keep the head pose, swap the mouth movements
+            fakeMotion[start:end, :2] = other[start:end, :2]
+        fakes[k] = renderLandmarks(fakeMotion, views[cam - 1])
+    streams += rng.normal(scale=noise, size=streams.shape)
+    fakes += rng.normal(scale=noise, size=fakes.shape)
+    for stream in list(streams) + list(fakes):
+        _addSpikes(stream, spikes, rng)
+    return streams, fakes
+
+
+def syntheticParticipant(length=1000, noise=0.5, spikes=0.002, segments=None, seed=0):
+    # A (9, length, 40) array in landmarks.STREAMS order, like loadStreams
+    streams, fakes = syntheticCameras(6, length, noise, spikes, (2, 3, 4), segments, seed)
+    return np.concatenate([streams, fakes])
+
+
+def syntheticDistances(numCams=6, length=1000, numFakes=1, noise=0.3, seed=0):
+    # (numCams, length) per-frame Mahalanobis-like distances for detection at
+    # crowd scale, without fitting numCams estimators: the real cameras share
+    # one chi(5)-distributed profile up to noise, the last numFakes cameras
+    # each follow their own
+    rng = np.random.default_rng(seed)
+    profile = np.sqrt(rng.chisquare(5, size=length))
+    X = profile + noise * rng.normal(size=(numCams, length))
+    if numFakes:
+        X[numCams - numFakes:] = np.sqrt(rng.chisquare(5, size=(numFakes, length)))
+    return X
+
+
+
+def iterUnsyncedCameras(numCams=6, length=1000, offsets=None, drifts=None, noise=0.5, spikes=0.002, seed=0):
+    # Real cameras that are not synchronized, one (length, 40) stream at a
+    # time: camera c's frame t shows the mouth at time offsets[c] +
+    # (1 + drifts[c]) * t of camera 1's clock (offsets[0] and drifts[0] are 0)
+    rng = np.random.default_rng(seed)
+    offsets = np.zeros(numCams) if offsets is None else np.asarray(offsets, dtype=np.float64)
+    drifts = np.zeros(numCams) if drifts is None else np.asarray(drifts, dtype=np.float64)
+    first = min(offsets.min(), (offsets + (1 + drifts) * (length - 1)).min())
+    last = max(offsets.max(), (offsets + (1 + drifts) * (length - 1)).max())
+    start = int(np.floor(first))
+    motion = mouthMotion(int(np.ceil(last)) - start + 2, rng)
+    for c in range(numCams):
+        # the latent motion between frames, linearly interpolated
+        pos = offsets[c] + (1 + drifts[c]) * np.arange(length) - start
+        base = np.floor(pos).astype(int)
+        frac = (pos - base)[:, None]
+        stream = renderLandmarks((1 - frac) * motion[base] + frac * motion[base + 1], _randomView(rng))
+        stream += rng.normal(scale=noise, size=stream.shape)
+        _addSpikes(stream, spikes, rng)
+        yield stream
+
+
+def unsyncedCameras(numCams=6, length=1000, offsets=None, drifts=None, noise=0.5, spikes=0.002, seed=0):
+    # (numCams, length, 40) array of iterUnsyncedCameras
+    return np.stack(list(iterUnsyncedCameras(numCams, length, offsets, drifts, noise, spikes, seed)))
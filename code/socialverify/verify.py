@@ -0,0 +1,171 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Library entry points of the detection, over one (n_cams, n_frames,
+# n_features) array of camera streams.
+#
+#   verify_sequence(cams)                  the full sequence check
+#   verify_windows(cams, window, stride)   the sliding window check
+#
+# Both describe every camera by a feature vector, per-frame robust
+# Mahalanobis distances after PCA ('pca') or the haar wavelet coefficients
+# ('wavelet'), drop the frames with tracking failures (one mask for all
+# cameras) and split the cameras at the top of the single linkage tree (see
+# socialverify.detect). The PCA of all cameras is one stacked NumPy call
+# (socialverify.batched); only the covariance estimator is fitted per camera.
+#
+# The experiment scripts run the same steps on the 9 streams of a
+# participant, scoring several camera sets (X0..X3) from one set of features
+# with caseScores.
+
+import numpy as np
+
+from socialverify.batched import iterBatchedScores, pcaScores, standardize
+from socialverify.detect import detectFakes, detectSplit, topOfTree, trackingFailures
+from socialverify.estimators import makeEstimator
+from socialverify.instrument import stage
+from socialverify.landmarks import asFloats
+from socialverify.rolling import RollingMahalanobis
+from socialverify.wavelets import iterWindowFeatures, waveletFeatures
+
+
+def mahalanobisDistances(cams, num_pcs=5, scale=False, random_state=None, estimator='mcd'):
+    # (n_cams, n_frames, n_features) -> (n_cams, n_frames): PCA of every
+    # camera (after a StandardScaler with scale), then the distances of the
+    # frames under a robust covariance estimator (MinCovDet by default, see
+    # socialverify.estimators) fitted to them
+    cams = asFloats(cams)
+    with stage('scaling'):
+        Z = standardize(cams, scale)
+    with stage('pca'):
+        T = pcaScores(Z, num_pcs)
+    with stage('mcd'):
+        return np.array([makeEstimator(estimator, random_state).fit(t).mahalanobis(t) for t in T])
+
+
+def sequenceFeatures(cams, features='pca', num_pcs=5, scale=False, random_state=None, estimator='mcd'):
+    # (n_cams, n_frames, n_features) -> (n_cams, n_values), one feature
+    # vector per camera
+    if features == 'wavelet':
+        with stage('wavelet'):
+            return waveletFeatures(cams)
+    return mahalanobisDistances(cams, num_pcs, scale, random_state, estimator)
+
+
+def startChunks(starts, window, chunk):
+    # Split an increasing sequence of window starts into runs of at most
+    # chunk windows starting less than chunk frames apart. Yields the run and
+    # the frames [lo, hi) its windows cover, so that only those frames need to
+    # be gathered from views (FrameViews of --compact, memory maps).
+    starts = np.asarray(starts)
+    c = 0
+    while c < len(starts):
+        lo = starts[c]
+        end = c + np.searchsorted(starts[c:c + chunk], lo + chunk)
+        yield starts[c:end], lo, starts[end - 1] + window
+        c = end
+
+
+def windowFeatures(cams, window, features='pca', engine='rolling', num_pcs=5, scale=True,
+                   random_state=None, estimator='mcd'):
+    # Returns windows(starts): an iterator of the (n_cams, n_values) features
+    # of the windows cams[:, s:s + window] for an increasing sequence of
+    # starts s. cams may be a list of streams (memory maps or FrameViews).
+    # The PCA engines (see --pca-engine) slide the scaler/PCA along the
+    # sequence (rolling, whose state carries over between calls), batch many
+    # windows of all cameras in one call (batched), or fit every window
+    # (refit). The wavelet features and the batched engine gather the frames
+    # of one chunk of windows at a time (startChunks), so FrameViews are never
+    # copied whole.
+    if features == 'wavelet':
+        def windows(starts, chunk=1024):
+            for part, lo, hi in startChunks(starts, window, chunk):
+                chunks = iterWindowFeatures(np.stack([cam[lo:hi] for cam in cams]), window, starts=part - lo)
+                while True:
+                    with stage('wavelet'):
+                        _, values = next(chunks, (None, None))
+                    if values is None:
+                        break
+                    yield from np.swapaxes(values, 0, 1)
+        return windows
+
+    if engine == 'rolling':
+        engines = [RollingMahalanobis(cam, window, num_pcs, scale, random_state, estimator=estimator)
+                   for cam in cams]
+        def windows(starts):
+            prev = None
+            for start in starts:
+                with stage('scaling'):
+                    for e in engines:
+                        if prev is not None and start == prev + 1:
+                            e.step()
+                        else:
+                            e.seek(start)
+                prev = start
+                yield np.array([e.distances() for e in engines])
+    elif engine == 'batched':
+        estimators = [makeEstimator(estimator, random_state) for _ in cams]
+        def windows(starts, chunk=256):
+            for part, lo, hi in startChunks(starts, window, chunk):
+                frames = np.stack([cam[lo:hi] for cam in cams])
+                for block, scores in iterBatchedScores(frames, window, num_pcs, chunk, scale, starts=part - lo):
+                    for w, start in enumerate(block + lo):
+                        index = np.arange(start, start + window)
+                        with stage('mcd'):
+                            yield np.array([e.fit(T, index=index).mahalanobis(T)
+                                            for e, T in zip(estimators, scores[:, w])])
+    else:
+        def windows(starts):
+            for start in starts:
+                yield mahalanobisDistances(np.stack([cam[start:start + window] for cam in cams]), num_pcs,
+                                           scale, random_state, estimator)
+    return windows
+
+
+def caseScores(X, cases):
+    # topOfTree ratios (numCases,) and 2-cluster labels (numCases, numCams)
+    # of the camera sets X[rows] for the rows of every case. The frames where
+    # the first case has tracking failures are dropped from all of them.
+    with stage('tracking'):
+        keep = np.flatnonzero(~trackingFailures(X[cases[0]]))
+    with stage('linkage'):
+        scores = [topOfTree(X[np.ix_(rows, keep)]) for rows in cases]
+    ratios = np.array([ratio for ratio, _ in scores])
+    labels = np.array([c for _, c in scores])
+    return ratios, labels
+
+
+def verify_sequence(cams, thresh=1.3, features='pca', num_pcs=5, scale=False, random_state=None,
+                    estimator='mcd'):
+    # Fakes among the cameras of cams (n_cams >= 3, n_frames, n_features)
+    # over the whole sequence: the number of fakes, the indices of the
+    # cameras flagged (empty when the linkage ratio is below thresh) and
+    # the ratio
+    X = sequenceFeatures(cams, features, num_pcs, scale, random_state, estimator)
+    with stage('tracking'):
+        keep = ~trackingFailures(X)
+    with stage('linkage'):
+        return detectSplit(X[:, keep], thresh)
+
+
+def verify_windows(cams, window, stride=1, thresh=1.3, features='pca', engine='rolling', num_pcs=5,
+                   scale=True, random_state=None, estimator='mcd'):
+    # verify_sequence over the windows cams[:, s:s + window] for every
+    # stride-th start s. Returns the starts (numWin,), the number of fakes
+    # (numWin,), the linkage ratios (numWin,) and the 2-cluster labels
+    # (numWin, n_cams); the fakes of a window are the minority of its labels
+    # (detect.minority) when it has any.
+    numCams, numFrames = len(cams), cams[0].shape[0]
+    if window > numFrames:
+        raise ValueError(f'window ({window}) is longer than the sequence ({numFrames})')
+    starts = np.arange(0, numFrames - window + 1, stride)
+    ratios = np.zeros(len(starts))
+    labels = np.zeros((len(starts), numCams), dtype=np.int32)
+    windows = windowFeatures(cams, window, features, engine, num_pcs, scale, random_state, estimator)
+    for w, X in enumerate(windows(starts)):
+        ratio, c = caseScores(X, [np.arange(numCams)])
+        ratios[w], labels[w] = ratio[0], c[0]
+    return starts, detectFakes(ratios, labels, thresh)[0], ratios, labels
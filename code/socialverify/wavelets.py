@@ -0,0 +1,209 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Haar wavelet features of the no-PCA method, for many streams at once.
+#
+# socialVerificationNoPCA describes a stream by
+# createDecompVector(wavedec2(stream, 'haar', level)): the coefficients
+# cA_L, (cH_L, cV_L, cD_L), ..., (cH_1, cV_1, cD_1), each flattened row-major
+# (frames x features). waveletFeatures computes the same vector for a stack of
+# streams with one Haar step per level over the whole stack, writing into a
+# preallocated (n_streams, n_coeffs) buffer.
+#
+# iterWindowFeatures does it for every window start of a sliding window. The
+# 2D Haar pyramid is separable: every band is a feature-axis transform (per
+# frame, independent of the window) followed by a time-axis transform. Along
+# time, element k of level l covers frames [k 2^l, (k+1) 2^l) of the window,
+# so it is a dyadic block sum (approximation) or difference of half-block sums
+# (detail), scaled by 2^(-l/2). Those blocks are shared by all windows, so
+# they are computed once for every frame offset from prefix sums, and a window
+# only gathers its blocks. Only the last element of a level can involve the
+# padding of odd lengths (pywt's 'symmetric' mode repeats the last sample);
+# it is evaluated from its handful of frame ranges.
+#
+# Both match pywt up to floating point (the prefix sums cost a few digits on
+# long sequences, about 1e-10 absolute on landmark coordinates).
+
+import numpy as np
+from pywt import dwt_max_level
+from socialverify.landmarks import asFloats
+
+SQRT2 = np.sqrt(2.0)
+
+
+def bandShapes(n_frames, n_features, level):
+    # (frames, features) of cA_L, then of cH, cV, cD for levels L..1
+    sizes = [(n_frames, n_features)]
+    for _ in range(level):
+        sizes.append(((sizes[-1][0] + 1) // 2, (sizes[-1][1] + 1) // 2))
+    return [sizes[level]] + [sizes[l] for l in range(level, 0, -1) for _ in range(3)]
+
+
+def _offsets(shapes):
+    return np.cumsum([0] + [r * c for r, c in shapes])
+
+
+def _haarStep(x, axis):
+    # One Haar level along axis: (approximation, detail)
+    x = np.moveaxis(x, axis, -1)
+    if x.shape[-1] % 2:
+        x = np.concatenate([x, x[..., -1:]], axis=-1)
+    even, odd = x[..., 0::2], x[..., 1::2]
+    return np.moveaxis((even + odd) / SQRT2, -1, axis), np.moveaxis((even - odd) / SQRT2, -1, axis)
+
+
+def waveletFeatures(streams, level=None, out=None):
+    # (n_streams, n_frames, n_features) -> (n_streams, n_coeffs), row s being
+    # createDecompVector(wavedec2(streams[s], 'haar', level)). level defaults
+    # to dwt_max_level(n_frames, 'haar'), as in socialVerificationNoPCA.
+    # float32 streams are transformed in float32.
+    streams = asFloats(streams)
+    C, n, f = streams.shape
+    if level is None:
+        level = dwt_max_level(n, 'haar')
+    offsets = _offsets(bandShapes(n, f, level))
+    if out is None:
+        out = np.empty((C, offsets[-1]), dtype=streams.dtype)
+    ll = streams
+    for l in range(1, level + 1):
+        timeA, timeD = _haarStep(ll, 1)
+        ll, cV = _haarStep(timeA, 2)
+        cH, cD = _haarStep(timeD, 2)
+        b = 1 + 3 * (level - l)
+        for k, band in enumerate((cH, cV, cD)):
+            out[:, offsets[b + k]:offsets[b + k + 1]] = band.reshape(C, -1)
+    out[:, offsets[0]:offsets[1]] = ll.reshape(C, -1)
+    return out
+
+
+def _combine(left, right, wl, wr):
+    # Pieces ({(start, end): weight} frame ranges) of wl * left + wr * right
+    pieces = {}
+    for side, w in ((left, wl), (right, wr)):
+        for r, v in side.items():
+            pieces[r] = pieces.get(r, 0.0) + w * v
+    return {r: v for r, v in pieces.items() if v != 0.0}
+
+
+def _tails(window, level):
+    # Time-axis pyramid of a window length: per level l = 1..L, the number of
+    # regular elements (window >> l) and the pieces of the irregular last
+    # approximation and detail element (None when there is none)
+    lastA = None
+    n = window
+    tails = []
+    for l in range(1, level + 1):
+        regular = window >> l
+        nNext = (n + 1) // 2
+        if nNext == regular:
+            tailA = tailD = None
+        else:
+            k = 2 * (nNext - 1)
+            size = 1 << (l - 1)
+            def element(i):
+                if i < window >> (l - 1):
+                    return {(i * size, (i + 1) * size): SQRT2 ** -(l - 1)}
+                return lastA
+            left = element(k)
+            right = element(k + 1) if k + 1 < n else left
+            tailA = _combine(left, right, 1 / SQRT2, 1 / SQRT2)
+            tailD = _combine(left, right, 1 / SQRT2, -1 / SQRT2)
+        tails.append((regular, tailA, tailD))
+        lastA = tailA
+        n = nNext
+    return tails
+
+
+class _Band:
+    # Prefix sums of one feature-axis band over the whole sequence, plus its
+    # time-axis dyadic blocks at every frame offset, built on first use
+
+    def __init__(self, Y):
+        C, N, f = Y.shape
+        self.prefix = np.zeros((C, N + 1, f))
+        np.cumsum(Y, axis=1, dtype=np.float64, out=self.prefix[:, 1:])
+        self.blocks = {}
+
+    def rangeSum(self, starts, a, b):
+        return self.prefix[:, starts + b] - self.prefix[:, starts + a]
+
+    def dyadic(self, l, detail):
+        key = (l, detail)
+        if key not in self.blocks:
+            P, size = self.prefix, 1 << l
+            if detail:
+                half = size // 2
+                block = 2 * P[:, half:P.shape[1] - half] - P[:, :P.shape[1] - size] - P[:, size:]
+            else:
+                block = P[:, size:] - P[:, :P.shape[1] - size]
+            self.blocks[key] = block * SQRT2 ** -l
+        return self.blocks[key]
+
+    def timeBand(self, out, starts, l, regular, tail, detail):
+        # Fill out, (C, len(starts), n_l, f), with the time-axis level l
+        # coefficients of the windows starting at starts
+        size = 1 << l
+        blocks = self.dyadic(l, detail)
+        idx = starts[:, None] + size * np.arange(regular)[None, :]
+        out[:, :, :regular] = blocks[:, idx]
+        if tail is not None:
+            # the padded last element; an empty tail is a detail that cancels
+            last = out[:, :, regular]
+            last[...] = 0.0
+            for (a, b), w in tail.items():
+                last += w * self.rangeSum(starts, a, b)
+
+
+def iterWindowFeatures(streams, window, level=None, chunk=64, starts=None):
+    # Yield (window starts, features) per chunk of window starts, with
+    # features of shape (n_streams, n_chunk_windows, n_coeffs) equal to
+    # waveletFeatures(streams[:, s:s + window], level) for every start s. The
+    # features array is reused between chunks. starts picks the windows (a
+    # range or any increasing sequence of window starts, default all of
+    # them). The feature-axis transform of float32 streams stays float32,
+    # the prefix sums are always float64.
+    streams = asFloats(streams)
+    C, N, f = streams.shape
+    if level is None:
+        level = dwt_max_level(window, 'haar')
+    shapes = bandShapes(window, f, level)
+    offsets = _offsets(shapes)
+    tails = _tails(window, level)
+
+    # Feature-axis pyramid, per frame: approx[l] feeds cA_L and cH_l, detail[l] cV_l and cD_l
+    approx, detail = [_Band(streams)], [None]
+    featA = streams
+    for l in range(1, level + 1):
+        featA, featD = _haarStep(featA, 2)
+        approx.append(_Band(featA))
+        detail.append(_Band(featD))
+
+    numWin = N - window + 1
+    starts = np.arange(numWin) if starts is None else np.asarray(starts)
+    starts = starts[starts < numWin]
+    out = np.empty((C, min(chunk, len(starts)), offsets[-1]))
+    for s in range(0, len(starts), chunk):
+        block = starts[s:s + chunk]
+        buf = out[:, :len(block)]
+
+        def band(k):
+            # band k of buf as a (C, windows, frames, features) view
+            view = buf[:, :, offsets[k]:offsets[k + 1]]
+            view.shape = (C, len(block)) + shapes[k]
+            return view
+
+        for l in range(1, level + 1):
+            regular, tailA, tailD = tails[l - 1]
+            b = 1 + 3 * (level - l)
+            approx[l].timeBand(band(b), block, l, regular, tailD, True)
+            detail[l].timeBand(band(b + 1), block, l, regular, tailA, False)
+            detail[l].timeBand(band(b + 2), block, l, regular, tailD, True)
+        if level == 0:
+            approx[0].timeBand(band(0), block, 0, window, None, False)
+        else:
+            regular, tailA, _ = tails[level - 1]
+            approx[level].timeBand(band(0), block, level, regular, tailA, False)
+        yield block, buf
@@ -0,0 +1,220 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Work queue in a directory of a shared filesystem, for sweeps spread over
+# any number of worker processes on any number of nodes, without a server.
+#
+#   root/units/<id>.json     one unit of work each, written once by put
+#   root/leases/<id>         the claim on a unit, created with O_CREAT | O_EXCL
+#                            so exactly one worker gets it; it names the
+#                            worker, and its mtime is the worker's heartbeat
+#   root/done/<id>.npz       the unit's outputs, written under a temporary
+#                            name and renamed into place
+#   root/clock/<worker>      touched to read the filesystem's time
+#
+# A worker claims a unit with no outputs and no lease and, while it computes,
+# touches the lease every few seconds (Heartbeat). A lease not touched
+# for `timeout` seconds belongs to a dead worker and is reclaimed: renamed
+# away first (a rename is atomic, so of several workers reclaiming it only
+# one succeeds), then claimed as usual. Lease ages are measured against the
+# mtime of a file touched just then, so the nodes' clocks don't need to
+# agree. A unit finished twice, by a worker that was wrongly declared dead
+# and by the one that reclaimed it, keeps one complete output either way.
+
+import json
+import os
+import socket
+import threading
+from collections import namedtuple
+import numpy as np
+
+# reclaimed: the unit was taken over from a worker whose lease went stale
+Lease = namedtuple('Lease', ['id', 'unit', 'worker', 'reclaimed'])
+
+
+def workerName():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class WorkQueue:
+
+    def __init__(self, root, timeout=60.0):
+        self.root = root
+        self.timeout = timeout
+        for sub in ('units', 'leases', 'done', 'clock'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _path(self, sub, name):
+        return os.path.join(self.root, sub, name)
+
+    def put(self, units):
+        # units maps ids (ordered the way they should be claimed) to
+        # JSON-serializable dicts; units already in the queue are kept
+        for uid, unit in units.items():
+            path = self._path('units', f'{uid}.json')
+            if not os.path.exists(path):
+                self._write(path, json.dumps(unit).encode())
+
+    def _write(self, path, data):
+        tmp = f'{path}.{workerName()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def ids(self):
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.root, 'units'))
+                      if name.endswith('.json'))
+
+    def unit(self, uid):
+        with open(self._path('units', f'{uid}.json')) as f:
+            return json.load(f)
+
+    def isDone(self, uid):
+        return os.path.exists(self._path('done', f'{uid}.npz'))
+
+    def now(self, worker):
+        # The filesystem's current time
+        path = self._path('clock', worker)
+        with open(path, 'a'):
+            os.utime(path)
+        return os.stat(path).st_mtime
+
+    def _age(self, uid, now):
+        try:
+            return now - os.stat(self._path('leases', uid)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _create(self, uid, worker):
+        try:
+            fd = os.open(self._path('leases', uid), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(worker)
+        return True
+
+    def claim(self, worker):
+        # Lease on the first unit that is neither done nor leased, or whose
+        # lease went stale; None when there is none right now
+        now = None
+        for uid in self.ids():
+            if self.isDone(uid):
+                continue
+            if self._create(uid, worker):
+                # it may have been finished between the check and the claim
+                if self.isDone(uid):
+                    self.release(Lease(uid, None, worker, False))
+                    continue
+                return Lease(uid, self.unit(uid), worker, False)
+            if now is None:
+                now = self.now(worker)
+            age = self._age(uid, now)
+            if age is not None and age > self.timeout:
+                lease = self._path('leases', uid)
+                stale = self._path('leases', f'{uid}.stale.{worker}')
+                try:
+                    os.rename(lease, stale)
+                except FileNotFoundError:
+                    continue
+                # another worker may have reclaimed it since the check; then
+                # the lease renamed away is fresh and goes back
+                if self.now(worker) - os.stat(stale).st_mtime <= self.timeout:
+                    try:
+                        os.link(stale, lease)
+                    except FileExistsError:
+                        pass
+                    os.remove(stale)
+                    continue
+                os.remove(stale)
+                if self._create(uid, worker):
+                    return Lease(uid, self.unit(uid), worker, True)
+        return None
+
+    def holder(self, uid):
+        try:
+            with open(self._path('leases', uid)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def touch(self, lease):
+        # Heartbeat; False when the lease was reclaimed by another worker
+        if self.holder(lease.id) != lease.worker:
+            return False
+        try:
+            os.utime(self._path('leases', lease.id))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, lease):
+        # Give a unit back (on an error, or after completing it)
+        if self.holder(lease.id) == lease.worker:
+            try:
+                os.remove(self._path('leases', lease.id))
+            except FileNotFoundError:
+                pass
+
+    def complete(self, lease, **arrays):
+        # Store the unit's outputs (np.savez arrays) and drop the lease
+        path = self._path('done', f'{lease.id}.npz')
+        tmp = f'{path}.{lease.worker}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.release(lease)
+
+    def outputs(self, uid):
+        with np.load(self._path('done', f'{uid}.npz')) as data:
+            return {name: data[name] for name in data.files}
+
+    def status(self, worker=None):
+        # Counts of units done, leased (alive), stale and waiting
+        now = self.now(worker or workerName())
+        counts = dict(units=0, done=0, leased=0, stale=0, waiting=0)
+        for uid in self.ids():
+            counts['units'] += 1
+            if self.isDone(uid):
+                counts['done'] += 1
+                continue
+            age = self._age(uid, now)
+            if age is None:
+                counts['waiting'] += 1
+            else:
+                counts['stale' if age > self.timeout else 'leased'] += 1
+        return counts
+
+
+class Heartbeat:
+    # Touches a lease every `interval` seconds from a thread while the block
+    # runs; `lost` is set once the lease turns out to have been reclaimed
+
+    def __init__(self, queue, lease, interval=10.0):
+        self.queue = queue
+        self.lease = lease
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.queue.touch(self.lease):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,258 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Sharded window_acc_exp.py sweep over any number of worker processes on any
+# number of nodes, through a work queue in a directory they all see (e.g. on
+# NFS; see socialverify.workqueue). No server is involved.
+#
+#   sweep.py init QUEUE [--unit-windows N] [window_acc_exp.py options]
+#       splits every (participant, window size) cell of the experiment into
+#       units of N consecutive window starts and queues them
+#   sweep.py work QUEUE [--workers N]
+#       runs N workers here (start it on as many nodes as there are): each
+#       claims a unit, computes its topOfTree scores and stores them, until
+#       all units are done. Units of workers that stop heartbeating are
+#       reclaimed by the others.
+#   sweep.py status QUEUE
+#   sweep.py merge QUEUE [--save-dir DIR] [--store FILE]
+#       puts the units' scores into a result store and runs the scoring and
+#       plotting of window_acc_exp.py from it (--plot-only), which gives the
+#       tpResults/fpResults/accResults and plots of a single-process run
+#
+# The scores do not depend on the thresholds, so those are only applied at
+# the merge. Workers check that their code computes the same scores as the
+# code that queued the sweep (scoreVersion) before they start.
+
+import argparse
+import json
+import os
+import time
+from multiprocessing import get_context
+
+import window_acc_exp
+from window_acc_exp import cascadeSettings, cellParams, participantStreams, scoreVersion, waveletScores, \
+    windowScores
+from socialverify.landmarks import ParticipantReader, cacheMeta, cachePaths, participantIDs
+from socialverify.parallel import pinBlasThreads
+from socialverify.store import ResultStore, cellKey
+from socialverify.workqueue import Heartbeat, WorkQueue, workerName
+
+
+def manifestPath(root):
+    return os.path.join(root, 'manifest.json')
+
+
+def readManifest(root):
+    path = manifestPath(root)
+    if not os.path.exists(path):
+        raise SystemExit(f'{root} holds no sweep (run sweep.py init first)')
+    with open(path) as f:
+        return json.load(f)
+
+
+def openQueue(root, checkVersion=False):
+    manifest = readManifest(root)
+    if checkVersion and scoreVersion() != manifest['version']:
+        raise SystemExit('This code computes different scores than the code that queued the sweep')
+    return WorkQueue(root, manifest['lease_timeout']), manifest
+
+
+def unitID(i, j, start):
+    # Sorts participant by participant, so workers share the streams they load
+    return f'{i:03d}-{j:05d}-{start:08d}'
+
+
+def recordingLength(exp, i):
+    # Frames of participant i as the cells see them, without loading the
+    # recording: from the landmark cache metadata or the variable shapes of
+    # the .mat files. Alignment trims the streams to their overlap, so only
+    # then are they loaded and aligned.
+    if exp.align != 'none':
+        return participantStreams(exp, i).shape[1]
+    if exp.cache_dir is not None and os.path.exists(cachePaths(exp.cache_dir, i)[1]):
+        return cacheMeta(exp.cache_dir, i)['fullLen']
+    with ParticipantReader(exp.data_dir, i, camsFrom=3) as reader:
+        return reader.fullLen
+
+
+def init(root, exp, unitWindows, leaseTimeout, heartbeat):
+    if exp.scan != 'dense':
+        raise SystemExit('Only dense scans are sharded (adaptive scans are not kept in the store)')
+    manifest = dict(args=vars(exp), version=scoreVersion(), lease_timeout=leaseTimeout, heartbeat=heartbeat)
+    manifest = json.loads(json.dumps(manifest))
+    if os.path.exists(manifestPath(root)):
+        if readManifest(root) != manifest:
+            raise SystemExit(f'{root} already holds a different sweep')
+    else:
+        os.makedirs(root, exist_ok=True)
+        with open(manifestPath(root), 'w') as f:
+            json.dump(manifest, f, indent=1)
+    queue = WorkQueue(root, leaseTimeout)
+    units = {}
+    for i in participantIDs(exp.num_participants):
+        #The unit boundaries need the (aligned) length of every recording
+        fullLen = recordingLength(exp, i)
+        for j in exp.window_sizes:
+            for start in range(0, fullLen - j, unitWindows):
+                units[unitID(i, j, start)] = dict(participant=i, window=j, frames=fullLen, start=start,
+                                                  stop=min(start + unitWindows, fullLen - j))
+    queue.put(units)
+    return queue
+
+
+def unitScores(exp, streams, unit):
+    # (ratios, labels) of the unit's window starts, as in windowScores
+    starts = range(unit['start'], unit['stop'])
+    cascade = cascadeSettings(exp)
+    if exp.features == 'wavelet':
+        return waveletScores(streams, unit['window'], compact=exp.compact, cascade=cascade, starts=starts)
+    return windowScores(streams, unit['window'], exp.num_pcs, exp.pca_engine, exp.seed, exp.estimator,
+                        compact=exp.compact, cascade=cascade, starts=starts)
+
+
+def work(root, poll=5.0):
+    # One worker: claims units until every unit of the queue is done
+    queue, manifest = openQueue(root, checkVersion=True)
+    exp = argparse.Namespace(**manifest['args'])
+    worker = workerName()
+    person, streams = None, None
+    done, reclaimed, t0 = 0, 0, time.perf_counter()
+    while True:
+        lease = queue.claim(worker)
+        if lease is None:
+            status = queue.status(worker)
+            if status['done'] == status['units']:
+                break
+            #the other units are leased; wait in case their workers die
+            time.sleep(poll)
+            continue
+        unit = lease.unit
+        with Heartbeat(queue, lease, manifest['heartbeat']):
+            try:
+                if unit['participant'] != person:
+                    streams = participantStreams(exp, unit['participant'])
+                    person = unit['participant']
+                ratios, labels = unitScores(exp, streams, unit)
+            except BaseException:
+                queue.release(lease)
+                raise
+        #the scores are deterministic, so a unit that was reclaimed in the
+        #meantime is stored either way
+        queue.complete(lease, ratios=ratios, labels=labels)
+        done += 1
+        reclaimed += lease.reclaimed
+    print(f'{worker}: {done} units ({reclaimed} reclaimed) in {time.perf_counter() - t0:.1f}s')
+
+
+def runWorkers(root, workers, poll=5.0):
+    # workers processes of work on this node
+    if workers <= 1:
+        work(root, poll)
+        return
+    ctx = get_context()
+    procs = [ctx.Process(target=workerMain, args=(root, poll)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    failed = sum(p.exitcode != 0 for p in procs)
+    if failed:
+        raise SystemExit(f'{failed} of {workers} workers failed')
+
+
+def workerMain(root, poll):
+    pinBlasThreads()
+    work(root, poll)
+
+
+def merge(root, save_dir=None, store=None):
+    # Stores every unit's scores and scores/plots the sweep from the store.
+    # Returns tpResults, fpResults and accResults of window_acc_exp.run.
+    queue, manifest = openQueue(root, checkVersion=True)
+    status = queue.status()
+    if status['done'] < status['units']:
+        raise SystemExit(f'{status["units"] - status["done"]} of {status["units"]} units are not done')
+    exp = argparse.Namespace(**manifest['args'])
+    if save_dir is not None:
+        exp.save_dir = save_dir
+    if store is not None:
+        exp.store = store
+    exp.store = exp.store or os.path.join(exp.save_dir, 'results.sqlite')
+    results = ResultStore(exp.store)
+    for uid in queue.ids():
+        unit = queue.unit(uid)
+        i, j = unit['participant'], unit['window']
+        params = cellParams(exp, i, j, manifest['version'])
+        key = cellKey(params)
+        results.addCell(key, params, unit['frames'], unit['frames'] - j)
+        outputs = queue.outputs(uid)
+        results.putChunk(key, unit['start'], outputs['ratios'], outputs['labels'])
+    results.close()
+    exp.plot_only = True
+    exp.jobs = 1
+    exp.timings = exp.profile = None
+    return window_acc_exp.run(exp)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Sharded window_acc_exp.py sweep over a shared-directory work queue',
+                                     allow_abbrev=False)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('init', allow_abbrev=False,
+                    help='Queue the units of a sweep; other options are passed to window_acc_exp.py')
+    p.add_argument('queue', type=str, help='Queue directory, shared by all workers')
+    p.add_argument('--unit-windows', type=int, default=2048,
+                    help='Window starts per unit of work')
+    p.add_argument('--lease-timeout', type=float, default=300,
+                    help='Seconds without a heartbeat after which a unit is reclaimed from its worker')
+    p.add_argument('--heartbeat', type=float, default=30,
+                    help='Seconds between the heartbeats of a worker')
+
+    p = commands.add_parser('work', help='Run workers until every unit is done')
+    p.add_argument('queue', type=str)
+    p.add_argument('--workers', type=int, default=1,
+                    help='Worker processes to run on this node')
+    p.add_argument('--poll', type=float, default=5.0,
+                    help='Seconds between looks at the queue while the remaining units are leased')
+
+    p = commands.add_parser('status', help='Count the units done, leased, stale and waiting')
+    p.add_argument('queue', type=str)
+
+    p = commands.add_parser('merge', help='Store, score and plot the finished sweep')
+    p.add_argument('queue', type=str)
+    p.add_argument('--save-dir', type=str, default=None,
+                    help='Directory for the plots and result store (default: the --save-dir of init)')
+    p.add_argument('--store', type=str, default=None,
+                    help='Result store to merge into (default: the --store of init, or <save-dir>/results.sqlite)')
+
+    args, rest = parser.parse_known_args()
+    if args.command == 'init':
+        args.exp = window_acc_exp.parse_args(rest)
+    elif rest:
+        parser.error('unrecognized arguments: ' + ' '.join(rest))
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.command == 'init':
+        queue = init(args.queue, args.exp, args.unit_windows, args.lease_timeout, args.heartbeat)
+        print(f'{len(queue.ids())} units in {args.queue}')
+    elif args.command == 'work':
+        runWorkers(args.queue, args.workers, args.poll)
+    elif args.command == 'status':
+        queue, _ = openQueue(args.queue)
+        print(', '.join(f'{n} {name}' for name, n in queue.status().items()))
+    else:
+        merge(args.queue, args.save_dir, args.store)
+
+
+if __name__ == '__main__':
+    main()
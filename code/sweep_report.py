@@ -0,0 +1,173 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Sharded sweep (sweep.py) against the single-process window_acc_exp.py run,
+# on one node with worker processes sharing a temporary queue directory.
+#
+# scaling:  wall time of init + work + merge for every --workers count, the
+#           speedup over one worker and the efficiency (speedup / workers).
+#           Workers beyond the CPU count of the node can't speed anything up.
+# reclaim:  a sweep where one of the workers is killed (SIGKILL, no cleanup)
+#           once the first unit is done; the others reclaim its unit after
+#           --lease-timeout
+# Every merged tpResults/fpResults/accResults is checked against the
+# single-process run.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+import window_acc_exp
+from sweep import init, merge
+from socialverify.estimators import ESTIMATORS
+from socialverify.parallel import BLAS_ENV_VARS
+from socialverify.workqueue import WorkQueue
+
+SWEEP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sweep.py')
+
+
+def experimentArgs(args, save_dir):
+    argv = ['--data-dir', args.data_dir, '--num_participants', str(args.num_participants),
+            '--window-sizes', *map(str, args.window_sizes), '--num_pcs', str(args.num_pcs),
+            '--pca-engine', args.pca_engine, '--estimator', args.estimator, '--save-dir', save_dir,
+            '--no-progress']
+    if args.cache_dir is not None:
+        argv += ['--cache-dir', args.cache_dir]
+    return window_acc_exp.parse_args(argv)
+
+
+def quietly(func, *args):
+    # window_acc_exp prints a line per participant, threshold and window size
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def startWorkers(root, n, logDir):
+    env = dict(os.environ, **{var: '1' for var in BLAS_ENV_VARS})
+    procs = []
+    for w in range(n):
+        log = open(os.path.join(logDir, f'{os.path.basename(root)}.worker{w}.log'), 'w')
+        procs.append((subprocess.Popen([sys.executable, SWEEP, 'work', root, '--poll', '0.5'], stdout=log,
+                                       stderr=subprocess.STDOUT, env=env), log))
+    return procs
+
+
+def waitWorkers(procs):
+    # Exit codes, and the units each worker reports as reclaimed
+    codes, reclaimed = [], 0
+    for proc, log in procs:
+        codes.append(proc.wait())
+        log.close()
+        with open(log.name) as f:
+            reclaimed += sum(int(m) for m in re.findall(r'\((\d+) reclaimed\)', f.read()))
+    return codes, reclaimed
+
+
+def maxDifference(results, reference):
+    return float(max(np.max(np.abs(r - ref)) for r, ref in zip(results, reference) if ref is not None))
+
+
+def sweep(args, tmp, name, workers, kill=False):
+    root = os.path.join(tmp, name)
+    t0 = time.perf_counter()
+    queue = init(root, experimentArgs(args, os.path.join(tmp, name + '-merged')), args.unit_windows,
+                 args.lease_timeout, args.heartbeat)
+    initSeconds = time.perf_counter() - t0
+    procs = startWorkers(root, workers, tmp)
+    killed = None
+    if kill:
+        while queue.status()['done'] == 0:
+            time.sleep(0.2)
+        procs[0][0].send_signal(signal.SIGKILL)
+        killed = procs[0][0].pid
+    codes, reclaimed = waitWorkers(procs)
+    workSeconds = time.perf_counter() - t0 - initSeconds
+    results = quietly(merge, root)
+    return dict(workers=workers, units=len(queue.ids()), init_seconds=initSeconds, work_seconds=workSeconds,
+                seconds=time.perf_counter() - t0, exit_codes=codes, killed=killed, reclaimed=reclaimed,
+                status=WorkQueue(root).status()), results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Sharded sweep scaling report')
+
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
+                    help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py)')
+    parser.add_argument('--num_participants', type=int, default=2,
+                    help='Number of participants')
+    parser.add_argument("--window-sizes", nargs="+", type=int, default=[250])
+    parser.add_argument('--num_pcs', type=int, default=5,
+                    help='Number of principal components to use')
+    parser.add_argument('--pca-engine', type=str, default='rolling', choices=['rolling', 'batched', 'refit'])
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS))
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4],
+                    help='Worker counts to time')
+    parser.add_argument('--unit-windows', type=int, default=256,
+                    help='Window starts per unit of work')
+    parser.add_argument('--lease-timeout', type=float, default=10,
+                    help='Seconds without a heartbeat after which a unit is reclaimed')
+    parser.add_argument('--heartbeat', type=float, default=2)
+    parser.add_argument('--no-kill', dest='kill', action='store_false',
+                    help='Skip the run with a killed worker')
+    parser.add_argument('--out', type=str, default='results/sweep_report.json',
+                    help='Where to write the report')
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    report = dict(cpus=os.cpu_count(), runs=[])
+    with tempfile.TemporaryDirectory() as tmp:
+        exp = experimentArgs(args, os.path.join(tmp, 'single'))
+        t0 = time.perf_counter()
+        reference = quietly(window_acc_exp.run, exp)
+        report['single_seconds'] = time.perf_counter() - t0
+        print(f'Single process: {report["single_seconds"]:.1f}s ({report["cpus"]} CPUs on this node)')
+
+        print('%8s %6s %10s %10s %8s %10s %10s' % ('workers', 'units', 'seconds', 'work', 'speedup',
+                                                   'efficiency', 'max diff'))
+        for n in args.workers:
+            run, results = sweep(args, tmp, f'queue{n}', n)
+            run['max_difference'] = maxDifference(results, reference)
+            report['runs'].append(run)
+        base = next((r for r in report['runs'] if r['workers'] == 1), report['runs'][0])
+        for run in report['runs']:
+            run['speedup'] = base['seconds'] / run['seconds'] * base['workers']
+            run['efficiency'] = run['speedup'] / run['workers']
+            print('%8d %6d %9.1fs %9.1fs %8.2f %9.1f%% %10.2g' % (run['workers'], run['units'], run['seconds'],
+                  run['work_seconds'], run['speedup'], 100 * run['efficiency'], run['max_difference']))
+
+        if args.kill:
+            run, results = sweep(args, tmp, 'killed', 2, kill=True)
+            run['max_difference'] = maxDifference(results, reference)
+            report['reclaim'] = run
+            print(f'Killed worker {run["killed"]} after the first unit: {run["reclaimed"]} unit(s) reclaimed, '
+                  f'{run["status"]["done"]} of {run["units"]} done in {run["seconds"]:.1f}s, '
+                  f'max diff {run["max_difference"]:.2g}')
+
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# The scripts run from code/, where socialverify and the experiment modules
+# are importable; the tests import them the same way
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from scipy.io import savemat
+
+from socialverify.landmarks import participantFiles
+
+
+@pytest.fixture
+def writeParticipant(tmp_path):
+    # Writes the mouth-data-fake{2,3,4}-ID<person>.mat files of a (9, frames,
+    # features) stream array into tmp_path, returns the directory. With
+    # camsDiffer every file gets its own (shifted) cam1..cam6.
+    def write(person, streams, camsDiffer=False):
+        for k, path in participantFiles(str(tmp_path), person).items():
+            cams = {f'cam{c}': streams[c - 1] + (k if camsDiffer else 0) for c in range(1, 7)}
+            savemat(path, dict(cams, fake=streams[4 + k]))
+        return str(tmp_path)
+    return write
@@ -0,0 +1,69 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# The adaptive scan of the window starts against the exhaustive one
+
+import functools
+
+import numpy as np
+
+from socialverify.adaptive import adaptiveScan, frameVerdicts, segments
+from socialverify.detect import detectFakes
+from socialverify.scoring import EXPECTED
+from socialverify.synthetic import syntheticParticipant
+from window_acc_exp import windowScores
+
+THRESHES = [1.3, 1.5]
+
+
+def intervalWindows(fake, window, rng):
+    # windows(starts) of a stream faked over the frames [fake[0], fake[1]):
+    # windows inside it flag the expected partitions, the others nothing,
+    # with ratios that vary within either kind
+    def windows(starts):
+        for start in starts:
+            inside = fake[0] <= start and start + window <= fake[1]
+            ratios = rng.uniform(2, 3, 4) if inside else rng.uniform(1, 1.2, 4)
+            ratios[0] = 1.1
+            labels = EXPECTED if inside else np.ones((4, 6), dtype=int)
+            yield ratios, labels
+    return windows
+
+
+def test_scan_finds_fake_interval():
+    numFrames, window = 3000, 100
+    numWin = numFrames - window + 1
+    windows = intervalWindows((1234, 2345), window, np.random.default_rng(11))
+    ratios, labels, evaluated = adaptiveScan(windows, numWin, THRESHES, stride=32)
+    dense = [np.array(x) for x in zip(*windows(range(numWin)))]
+    dense = np.moveaxis(dense[0], 0, 1), np.moveaxis(dense[1], 0, 1)
+    # the verdicts agree at every start, from a fraction of the windows
+    np.testing.assert_array_equal(detectFakes(ratios, labels, THRESHES), detectFakes(*dense, THRESHES))
+    np.testing.assert_array_equal(labels, dense[1])
+    assert evaluated.sum() < numWin / 10
+    flagged = detectFakes(ratios, labels, THRESHES)[0, 1] > 0
+    assert segments(flagged) == [(1234, 2345 - window + 1)]
+    assert segments(frameVerdicts(flagged, window, numFrames)) == [(1234 + window // 2, 2345 - window // 2)]
+
+
+def test_scan_matches_exhaustive_on_streams():
+    # the fakes of window_acc_exp are real in the middle third
+    streams = syntheticParticipant(600, spikes=0, seed=10)
+    window = 100
+    ratios, labels = windowScores(streams, window, 5, 'rolling', 0, 'empirical')
+    scan = functools.partial(adaptiveScan, threshes=THRESHES, stride=16)
+    fast, fastLabels, evaluated = windowScores(streams, window, 5, 'rolling', 0, 'empirical', scan=scan)
+    assert evaluated.sum() < len(evaluated) / 4
+    np.testing.assert_allclose(fast[:, evaluated], ratios[:, evaluated], rtol=1e-8)
+    np.testing.assert_array_equal(fastLabels[:, evaluated], labels[:, evaluated])
+    numFakes, fastFakes = detectFakes(ratios, labels, THRESHES), detectFakes(fast, fastLabels, THRESHES)
+    assert np.mean(numFakes == fastFakes) > 0.98
+    # the 1 fake case finds the faked thirds, with the same boundaries up to a few frames
+    dense = segments(frameVerdicts(numFakes[0, 1] > 0, window, 600))
+    adaptive = segments(frameVerdicts(fastFakes[0, 1] > 0, window, 600))
+    assert len(dense) == len(adaptive) == 2
+    assert np.max(np.abs(np.subtract(dense, adaptive))) <= 10
+    assert dense[0][0] == 0 and abs(dense[0][1] - 200) < 20 and abs(dense[1][0] - 400) < 20
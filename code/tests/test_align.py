@@ -0,0 +1,55 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Recovery of known start offsets and clock drifts of synthetic cameras
+
+import numpy as np
+
+from socialverify.align import alignParticipant, alignStreams, estimateDrift, estimateOffset, frameIndex
+from socialverify.geometry import mouthOpening
+from socialverify.synthetic import syntheticParticipant, unsyncedCameras
+
+OFFSETS = np.array([0, 137.4, -212.8, 58.1])
+DRIFTS = np.array([0, 1.5e-3, -8e-4, 4e-4])
+
+
+def test_estimate_offset():
+    streams = unsyncedCameras(4, 6000, OFFSETS, seed=1)
+    ref = mouthOpening(streams[0])
+    for stream, offset in zip(streams[1:], OFFSETS[1:]):
+        a = estimateOffset(ref, mouthOpening(stream))
+        assert abs(a.offset - offset) < 0.25
+        assert a.drift == 0
+
+
+def test_estimate_drift():
+    streams = unsyncedCameras(4, 9000, OFFSETS, DRIFTS, seed=2)
+    ref = mouthOpening(streams[0])
+    for stream, offset, drift in zip(streams[1:], OFFSETS[1:], DRIFTS[1:]):
+        a = estimateDrift(ref, mouthOpening(stream))
+        assert abs(a.offset - offset) < 0.5
+        assert abs(a.drift - drift) < 2e-5
+
+
+def test_align_streams():
+    # every re-indexed frame is within a frame of the reference time it
+    # stands for
+    length = 6000
+    streams = unsyncedCameras(4, length, OFFSETS, DRIFTS, seed=3)
+    aligned, alignments = alignStreams(list(streams), drift=True)
+    index = frameIndex(alignments, [length] * 4)
+    assert aligned.shape == (4, index.shape[1], streams.shape[2])
+    np.testing.assert_array_equal(aligned[2], streams[2][index[2]])
+    start = int(np.ceil(max(a.offset for a in alignments) - 0.5))
+    r = start + np.arange(index.shape[1])
+    assert np.all(np.abs(OFFSETS[:, None] + (1 + DRIFTS[:, None]) * index - r) <= 1)
+
+
+def test_synchronized_streams_pass_through():
+    streams = syntheticParticipant(3000, seed=4)
+    aligned, alignments = alignParticipant(streams)
+    assert all(abs(a.offset) < 0.25 for a in alignments)
+    np.testing.assert_array_equal(aligned, streams)
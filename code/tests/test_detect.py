@@ -0,0 +1,63 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# The minimum spanning tree detection against scipy's single linkage and
+# fcluster, which it replaces
+
+import numpy as np
+from scipy.cluster.hierarchy import linkage
+
+from socialverify.detect import detectFakes, linkScores, pairwiseDistances, spanningTree, spanningTrees, \
+    topOfTree, topOfTrees
+from socialverify.synthetic import syntheticDistances
+
+
+def cameraSets():
+    # distinct pairwise distances (no ties), 3 to 40 cameras, with and
+    # without fakes
+    rng = np.random.default_rng(0)
+    for numCams in (3, 4, 6, 9, 40):
+        for numFakes in (0, 1, numCams // 2):
+            yield rng.normal(size=(numCams, 50)) + np.r_[np.zeros(numCams - numFakes), 3 * np.ones(numFakes)][:, None]
+    for numCams in (6, 50):
+        yield syntheticDistances(numCams, 200, numFakes=2, seed=numCams)
+
+
+def test_top_of_tree_matches_linkage():
+    for X in cameraSets():
+        ratio, c = topOfTree(X)
+        expected = linkScores(linkage(X))
+        np.testing.assert_allclose(ratio, expected[0], rtol=1e-9)
+        np.testing.assert_array_equal(c, expected[1])
+
+
+def test_spanning_trees_match_per_matrix():
+    sets = [X for X in cameraSets() if X.shape[0] == 6]
+    D = np.stack([pairwiseDistances(X) for X in sets])
+    order, parent, weight = spanningTrees(D)
+    ratios, labels = topOfTrees(D)
+    for k, X in enumerate(sets):
+        single = spanningTree(D[k])
+        np.testing.assert_array_equal(order[k], single[0])
+        np.testing.assert_array_equal(parent[k], single[1])
+        np.testing.assert_allclose(weight[k], single[2])
+        ratio, c = topOfTree(X)
+        np.testing.assert_allclose(ratios[k], ratio)
+        np.testing.assert_array_equal(labels[k], c)
+
+
+def test_exact_tie():
+    # Equally spaced cameras: the top two merge heights are equal. fcluster
+    # can't cut the tree into exactly 2 clusters and returns a single one,
+    # topOfTree still cuts the longest edge it picked. The ratio is 1, which
+    # no threshold above 1 flags, so both mean no fakes.
+    X = np.arange(4, dtype=float)[:, None]
+    ratio, c = topOfTree(X)
+    expected = linkScores(linkage(X))
+    assert ratio == expected[0] == 1.0
+    np.testing.assert_array_equal(expected[1], [1, 1, 1, 1])
+    assert set(c) == {1, 2}
+    assert detectFakes(ratio, c, 1.3)[0] == detectFakes(*expected, 1.3)[0] == 0
@@ -0,0 +1,32 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# The landmark cache gives the same streams as the .mat files, also when the
+# three files of a participant disagree on the real cameras
+
+import warnings
+
+import numpy as np
+import pytest
+
+from socialverify.landmarks import FAKE_CAMS, loadStreams, streamBlocks
+from socialverify.synthetic import syntheticParticipant
+
+
+@pytest.mark.parametrize('camsDiffer', [False, True])
+def test_cache_gives_the_files_cameras(tmp_path, writeParticipant, camsDiffer):
+    streams = syntheticParticipant(300, seed=6)
+    writeParticipant(1, streams, camsDiffer)
+    cache = str(tmp_path / 'cache')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for camsFrom in FAKE_CAMS:
+            expected = loadStreams(str(tmp_path), 1, camsFrom)
+            np.testing.assert_array_equal(loadStreams(str(tmp_path), 1, camsFrom, cache_dir=cache), expected)
+            blocks = np.concatenate([b for _, b in streamBlocks(str(tmp_path), 1, camsFrom, cache_dir=cache,
+                                                                block=128)], axis=1)
+            np.testing.assert_array_equal(blocks, expected)
+    assert camsDiffer == (not np.array_equal(loadStreams(str(tmp_path), 1, 2), loadStreams(str(tmp_path), 1, 3)))
@@ -0,0 +1,46 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# The batched placement scores against the linkage of every placement's
+# camera set on its own
+
+import numpy as np
+from scipy.cluster.hierarchy import linkage
+
+from socialverify.detect import linkScores
+from socialverify.placements import allPlacements, featureDistances, placementRows, placementScores
+
+
+def naiveScores(features, placement):
+    # The camera set of one placement, the real streams with the cameras of
+    # the placement swapped for their fakes, clustered from scratch
+    X = features[:6].copy()
+    for cam in placement:
+        X[cam - 1] = features[6 + cam - 2]
+    return linkScores(linkage(X))
+
+
+def test_placement_scores_match_naive():
+    rng = np.random.default_rng(12)
+    fakeCams = (2, 3, 4)
+    placements = allPlacements(fakeCams)
+    assert len(placements) == 8
+    rows = placementRows(6, fakeCams, placements)
+    # a few windows of features: 6 real streams, then the fakes of cam2..cam4
+    windows = rng.normal(size=(5, 9, 50))
+    windows[:, 6:] += rng.uniform(0, 2, size=(5, 3, 1))
+    D = np.stack([featureDistances(X) for X in windows])
+    ratios, labels = placementScores(D, rows)
+    assert ratios.shape == (5, 8) and labels.shape == (5, 8, 6)
+    for w, features in enumerate(windows):
+        for p, placement in enumerate(placements):
+            ratio, c = naiveScores(features, placement)
+            np.testing.assert_allclose(ratios[w, p], ratio, rtol=1e-10)
+            np.testing.assert_array_equal(labels[w, p], c)
+    # one set of features at a time gives the same
+    single = placementScores(D[0], rows)
+    np.testing.assert_array_equal(single[0], ratios[0])
+    np.testing.assert_array_equal(single[1], labels[0])
@@ -0,0 +1,41 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# The sliding-window engine against refitting StandardScaler + PCA + a seeded
+# MinCovDet on every window, as the original mahalanobis_calculate did
+
+import numpy as np
+from sklearn.covariance import MinCovDet
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+
+from socialverify.rolling import RollingMahalanobis, rollingDistances
+from socialverify.synthetic import syntheticCameras
+
+
+def refitDistances(cam, num_pcs, random_state):
+    T = PCA(n_components=num_pcs).fit_transform(StandardScaler().fit_transform(cam))
+    return MinCovDet(random_state=random_state).fit(T).mahalanobis(T)
+
+
+def test_rolling_matches_refit():
+    cam = syntheticCameras(1, 400, seed=1)[0][0]
+    window, num_pcs = 120, 5
+    # refresh=64 so some windows come after a recomputation of the sums
+    rolled = list(rollingDistances(cam, window, num_pcs, numWin=150, random_state=0, refresh=64))
+    for start in (0, 1, 63, 64, 65, 149):
+        expected = refitDistances(cam[start:start + window], num_pcs, 0)
+        np.testing.assert_allclose(rolled[start], expected, rtol=1e-6)
+
+
+def test_seek_matches_step():
+    cam = syntheticCameras(1, 300, seed=2)[0][0]
+    engine = RollingMahalanobis(cam, 100, 5, random_state=0)
+    for _ in range(37):
+        engine.step()
+    stepped = engine.distances()
+    engine.seek(37)
+    np.testing.assert_allclose(engine.distances(), stepped, rtol=1e-8)
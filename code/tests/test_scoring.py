@@ -0,0 +1,81 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# The vectorized window outcomes against the per-window branches of the
+# original scoreCell of window_acc_exp.py (with a buffer per case, where the
+# original shared one between acc0..acc3)
+
+import numpy as np
+
+from socialverify.detect import detectFakes
+from socialverify.scoring import EXPECTED, scoreWindows
+
+
+# The partitions the original compared each case's labels with
+PARTITIONS = {1: ([1,1,1,2,1,1], [2,2,2,1,2,2]),
+              2: ([1,1,2,2,1,1], [2,2,1,1,2,2]),
+              3: ([1,2,2,2,1,1], [2,1,1,1,2,2])}
+
+
+def scoreCell(ratios, labels, intervalWin, t, j):
+    numWin = ratios.shape[1]
+    numFakes = detectFakes(ratios, labels, t)[0]
+    acc = np.zeros((4, 4, numWin))
+    for start in range(numWin):
+        end = start + j
+        isFake = (len(set(range(start, end)).intersection(set(range(intervalWin, 2*intervalWin)))) == 0)
+
+        #0 fakes case
+        if numFakes[0, start] == 0:
+            acc[0][1][start] = 1
+        else:
+            acc[0][2][start] = 1
+
+        #k fakes case
+        for k in (1, 2, 3):
+            n, c = numFakes[k, start], labels[k, start]
+            if n == k:
+                if isFake == 0:
+                    acc[k][2][start] = 1
+                elif np.all(c == np.array(PARTITIONS[k][0])) or np.all(c == np.array(PARTITIONS[k][1])):
+                    acc[k][0][start] = 1
+                else:
+                    acc[k][3][start] = 1
+            elif n != 0:
+                acc[k][2][start] = 1
+            elif isFake == 0:
+                acc[k][1][start] = 1
+            else:
+                acc[k][3][start] = 1
+    return acc
+
+
+def randomScores(numWin, rng):
+    # Ratios around the thresholds, and labels that are often the expected
+    # partitions (either numbering), 0 fakes (all one label) or 3 fakes
+    ratios = rng.uniform(0.9, 1.8, (4, numWin))
+    choices = np.concatenate([EXPECTED, 3 - EXPECTED, [[1, 2, 2, 2, 1, 1], [1, 1, 1, 1, 1, 1]]])
+    labels = choices[rng.integers(len(choices), size=(4, numWin))]
+    random = rng.random((4, numWin)) < 0.3
+    labels[random] = rng.integers(1, 3, size=(random.sum(), 6))
+    return ratios, labels.astype(np.int32)
+
+
+def test_outcomes_match_branches():
+    rng = np.random.default_rng(7)
+    threshes = [1.0, 1.3, 1.5, 2.0]
+    for fullLen, j in ((300, 50), (301, 100), (120, 45)):
+        numWin = fullLen - j
+        intervalWin = fullLen // 3
+        ratios, labels = randomScores(numWin, rng)
+        masks = scoreWindows(ratios, labels, intervalWin, threshes, j)
+        for t, thresh in enumerate(threshes):
+            np.testing.assert_array_equal(masks[t], scoreCell(ratios, labels, intervalWin, thresh, j))
+        # every window has exactly one outcome per case
+        assert np.all(masks.sum(axis=2) == 1)
+        # the 0-fake and 3-fake cases occur in the draws
+        numFakes = detectFakes(ratios, labels, threshes)
+        assert np.any(numFakes == 0) and np.any(numFakes[:, 3] == 3)
@@ -0,0 +1,55 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Expiry of abandoned uploads and malformed requests in the verification
+# service
+
+import asyncio
+
+import numpy as np
+
+from socialverify.service import Client, VerificationService, encodeStream
+
+
+def serve(test, **options):
+    async def main():
+        service = VerificationService(min_cams=3, workers=1, **options)
+        host, port = await service.start(port=0)
+        try:
+            await test(service, Client(host, port))
+        finally:
+            await service.stop()
+    asyncio.run(main())
+
+
+def test_abandoned_upload_is_dropped():
+    body = encodeStream(np.zeros((100, 40)))
+
+    async def test(service, client):
+        status, _, _ = await client.request('POST', '/events/e/cameras/1', body)
+        assert status == 202 and service.held == 100 * 40 * 8
+        # no more requests: the timer drops it
+        await asyncio.sleep(0.5)
+        assert service.held == 0 and 'e' not in service.events
+        assert service.counts['abandoned'] == 1
+        # the memory is free for new events again
+        status, _, _ = await client.request('POST', '/events/f/cameras/1', body)
+        assert status == 202
+        await client.close()
+
+    serve(test, collect_seconds=0.2, max_bytes=len(body))
+
+
+def test_malformed_content_length():
+    async def test(service, client):
+        reader, writer = await asyncio.open_connection(client.host, client.port)
+        writer.write(b'POST /events/e/cameras/1 HTTP/1.1\r\nContent-Length: abc\r\n\r\n')
+        await writer.drain()
+        head = await reader.readuntil(b'\r\n\r\n')
+        assert head.startswith(b'HTTP/1.1 400')
+        writer.close()
+
+    serve(test)
@@ -0,0 +1,106 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Resuming interrupted cells, the missing ranges and the code version in the
+# cell keys of the result store
+
+import numpy as np
+import pytest
+
+from socialverify.store import ResultStore, cellKey, codeVersion
+
+
+def fakeOutputs(numWin, cams=6):
+    rng = np.random.default_rng(8)
+    return rng.random((4, numWin)), rng.integers(1, 3, size=(4, numWin, cams)).astype(np.int32)
+
+
+def windowsOf(ratios, labels, computed, stopAfter=None):
+    # windows(starts) over precomputed outputs, logging the starts computed
+    # and failing after stopAfter windows
+    def windows(starts):
+        for start in starts:
+            if stopAfter is not None and len(computed) == stopAfter:
+                raise KeyboardInterrupt
+            computed.append(start)
+            yield ratios[:, start], labels[:, start]
+    return windows
+
+
+def test_resume_after_interruption(tmp_path):
+    numWin = 23
+    ratios, labels = fakeOutputs(numWin)
+    store = ResultStore(str(tmp_path / 'results.sqlite'), chunk=4)
+    key = cellKey({'participant': 1, 'window': 50})
+    store.addCell(key, {'participant': 1, 'window': 50}, numWin + 50, numWin)
+    assert store.missing(key) == [range(0, numWin)]
+
+    computed = []
+    with pytest.raises(KeyboardInterrupt):
+        store.collect(key, windowsOf(ratios, labels, computed, stopAfter=10), range(numWin))
+    # the two full chunks were saved, the third was lost
+    assert store.missing(key) == [range(8, numWin)]
+    assert store.load(key) is None
+
+    # a new process resumes at the first missing start
+    store.close()
+    store = ResultStore(store.path, chunk=4)
+    computed = []
+    for starts in store.missing(key):
+        store.collect(key, windowsOf(ratios, labels, computed), starts)
+    assert computed == list(range(8, numWin))
+    assert store.missing(key) == []
+    got = store.load(key)
+    np.testing.assert_array_equal(got[0], ratios)
+    np.testing.assert_array_equal(got[1], labels)
+
+
+def test_missing_ranges(tmp_path):
+    ratios, labels = fakeOutputs(20)
+    store = ResultStore(str(tmp_path / 'results.sqlite'))
+    with pytest.raises(KeyError):
+        store.missing('unknown')
+    store.addCell('k', {}, 70, 20)
+    store.putChunk('k', 15, ratios[:, 15:18], labels[:, 15:18])
+    store.putChunk('k', 3, ratios[:, 3:6], labels[:, 3:6])
+    store.putChunk('k', 5, ratios[:, 5:9], labels[:, 5:9])
+    assert store.missing('k') == [range(0, 3), range(9, 15), range(18, 20)]
+
+
+def test_collect_needs_consecutive_starts(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.sqlite'))
+    store.addCell('k', {}, 70, 20)
+    for starts in (range(0, 20, 2), [0, 1, 2]):
+        with pytest.raises(ValueError):
+            store.collect('k', windowsOf(*fakeOutputs(20), []), starts)
+
+
+def version1():
+    return 1
+
+
+def version2():
+    return 2
+
+
+def test_code_change_starts_new_cells(tmp_path):
+    ratios, labels = fakeOutputs(10)
+    store = ResultStore(str(tmp_path / 'results.sqlite'))
+    params = {'participant': 1, 'window': 50, 'code': codeVersion(version1)}
+    key = cellKey(params)
+    store.addCell(key, params, 60, 10)
+    store.putChunk(key, 0, ratios, labels)
+    assert store.load(key) is not None
+    # the key doesn't depend on the order of the parameters
+    assert cellKey(dict(reversed(list(params.items())))) == key
+
+    changed = dict(params, code=codeVersion(version2))
+    assert codeVersion(version1) != codeVersion(version2)
+    assert cellKey(changed) != key
+    assert store.cell(cellKey(changed)) is None
+    store.addCell(cellKey(changed), changed, 60, 10)
+    assert store.load(cellKey(changed)) is None
+    assert store.missing(cellKey(changed)) == [range(0, 10)]
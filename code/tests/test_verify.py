@@ -0,0 +1,47 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# The sliding window features gather only the frames of a chunk of windows
+# from FrameViews (--compact), and give what the stacked streams give
+
+import numpy as np
+import pytest
+
+from socialverify.landmarks import FrameView
+from socialverify.synthetic import syntheticParticipant
+from socialverify.verify import windowFeatures
+
+pytestmark = pytest.mark.filterwarnings('ignore:Level value')
+
+
+class GatherLog(FrameView):
+    # A FrameView that refuses to be copied whole and logs the frames asked for
+
+    def __init__(self, streams, source, log):
+        super().__init__(streams, source)
+        self.log = log
+
+    def __getitem__(self, key):
+        out = super().__getitem__(key)
+        self.log.append(len(out))
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        raise AssertionError('FrameView copied whole')
+
+
+@pytest.mark.parametrize('features, engine', [('wavelet', None), ('pca', 'batched')])
+def test_window_features_gather_chunks(features, engine):
+    streams = syntheticParticipant(800, seed=5)
+    window, chunk = 100, 150
+    log = []
+    cams = [GatherLog(streams, np.full(streams.shape[1], k), log) for k in range(len(streams))]
+    starts = np.concatenate([np.arange(0, 400, 4), np.arange(450, 701, 50)])
+    options = dict(engine=engine, random_state=0, estimator='empirical') if engine else {}
+    got = np.array([X.copy() for X in windowFeatures(cams, window, features, **options)(starts, chunk=chunk)])
+    assert 0 < max(log) <= chunk - 1 + window
+    expected = np.array([X.copy() for X in windowFeatures(list(streams), window, features, **options)(starts)])
+    np.testing.assert_allclose(got, expected, rtol=1e-7, atol=1e-7)
@@ -0,0 +1,46 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# The stacked and sliding-window Haar features against pywt.wavedec2 of every
+# stream, flattened the way createDecompVector did
+
+import numpy as np
+import pytest
+import pywt
+
+from socialverify.synthetic import syntheticParticipant
+from socialverify.wavelets import iterWindowFeatures, waveletFeatures
+
+# The no-PCA method decomposes to dwt_max_level of the frames, past the
+# level of the 40 features, which pywt warns about
+pytestmark = pytest.mark.filterwarnings('ignore:Level value')
+
+
+def decompVector(stream, level=None):
+    if level is None:
+        level = pywt.dwt_max_level(stream.shape[0], 'haar')
+    coeffs = pywt.wavedec2(stream, 'haar', level=level)
+    return np.concatenate([coeffs[0].ravel()] + [band.ravel() for bands in coeffs[1:] for band in bands])
+
+
+def test_features_match_wavedec2():
+    # odd lengths exercise pywt's symmetric padding
+    for length in (256, 301):
+        streams = syntheticParticipant(length, seed=3)
+        expected = np.stack([decompVector(stream) for stream in streams])
+        np.testing.assert_allclose(waveletFeatures(streams), expected, rtol=1e-10, atol=1e-10)
+
+
+def test_window_features_match_wavedec2():
+    streams = syntheticParticipant(400, seed=4)
+    window = 75
+    starts = [0, 1, 2, 63, 64, 200, 325]
+    # the features array is reused between chunks, hence the copies
+    got = np.concatenate([values.copy() for _, values in iterWindowFeatures(streams, window, chunk=3,
+                                                                             starts=starts)], axis=1)
+    for w, start in enumerate(starts):
+        expected = np.stack([decompVector(stream[start:start + window]) for stream in streams])
+        np.testing.assert_allclose(got[:, w], expected, rtol=1e-8, atol=1e-8)
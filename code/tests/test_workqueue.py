@@ -0,0 +1,86 @@
+#
+# Social Video Verification
+# Harman Suri, Eleanor Tursman
+# Brown University, 2020
+#
+
+# Claims, lease expiry and reclaim of the shared-directory work queue, and a
+# sharded sweep merged against the single-process window_acc_exp.py run
+
+import contextlib
+import io
+import os
+import time
+
+import numpy as np
+
+import window_acc_exp
+from socialverify.synthetic import syntheticParticipant
+from socialverify.workqueue import WorkQueue
+from sweep import init, merge, runWorkers
+
+
+def age(queue, uid, seconds):
+    # Backdate a lease, as if its worker stopped heartbeating seconds ago
+    path = os.path.join(queue.root, 'leases', uid)
+    t = os.stat(path).st_mtime - seconds
+    os.utime(path, (t, t))
+
+
+def test_claims_are_exclusive(tmp_path):
+    queue = WorkQueue(str(tmp_path), timeout=60)
+    queue.put({f'u{k}': {'k': k} for k in range(5)})
+    leases = [queue.claim(worker) for worker in ('a', 'b', 'a', 'b', 'a')]
+    assert sorted(lease.id for lease in leases) == queue.ids()
+    assert queue.claim('b') is None
+    assert queue.status() == dict(units=5, done=0, leased=5, stale=0, waiting=0)
+
+    queue.complete(leases[0], x=np.arange(3))
+    queue.release(leases[1])
+    assert queue.status() == dict(units=5, done=1, leased=3, stale=0, waiting=1)
+    # the released unit is claimed again, the done one never
+    assert queue.claim('b').id == leases[1].id
+    assert queue.claim('a') is None
+    np.testing.assert_array_equal(queue.outputs(leases[0].id)['x'], np.arange(3))
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    queue = WorkQueue(str(tmp_path), timeout=30)
+    queue.put({'u0': {}})
+    dead = queue.claim('a')
+    assert queue.claim('b') is None
+    age(queue, 'u0', 60)
+    assert queue.status()['stale'] == 1
+    lease = queue.claim('b')
+    assert lease.id == 'u0' and lease.reclaimed and queue.holder('u0') == 'b'
+    # the old holder lost the lease and can't release the new one
+    assert not queue.touch(dead)
+    queue.release(dead)
+    assert queue.holder('u0') == 'b' and queue.touch(lease)
+    # both finish: one complete output is kept
+    queue.complete(dead, x=np.ones(2))
+    queue.complete(lease, x=np.ones(2))
+    assert queue.status() == dict(units=1, done=1, leased=0, stale=0, waiting=0)
+    assert queue.claim('c') is None
+
+
+def test_sweep_matches_single_run(tmp_path, writeParticipant):
+    dataDir = writeParticipant(1, syntheticParticipant(240, seed=9))
+    argv = ['--data-dir', dataDir, '--num_participants', '1', '--window-sizes', '40', '60',
+            '--estimator', 'empirical', '--no-progress']
+    root = str(tmp_path / 'queue')
+    queue = init(root, window_acc_exp.parse_args(argv + ['--save-dir', str(tmp_path / 'sweep')]), 50, 30, 0.2)
+    assert len(queue.ids()) == 8
+
+    # a worker died holding the first unit
+    assert queue._create(queue.ids()[0], 'dead')
+    age(queue, queue.ids()[0], 60)
+    runWorkers(root, 2, poll=0.1)
+    assert queue.status()['done'] == 8
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        merged = merge(root)
+        single = window_acc_exp.run(window_acc_exp.parse_args(argv + ['--save-dir', str(tmp_path / 'single')]))
+    assert all(r is not None for r in single)
+    for got, expected in zip(merged, single):
+        np.testing.assert_array_equal(got, expected)
@@ -8,89 +8,222 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import functools
 import os
+import time
 import numpy as np
-from scipy.io import loadmat
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
-from sklearn.covariance import MinCovDet
-from scipy.cluster.hierarchy import linkage, fcluster
 import matplotlib.pyplot as plt
+from socialverify import align, batched, detect, estimators, geometry, instrument, landmarks, rolling, verify, wavelets
+from socialverify.adaptive import adaptiveScan, frameVerdicts, segments
+from socialverify.align import alignParticipant
+from socialverify.detect import detectFakes
+from socialverify.estimators import ESTIMATORS
+from socialverify.geometry import LAYOUTS, Cascade, consistentWindows, mouthSignals
+from socialverify.instrument import Instrumented, Progress, stage
+from socialverify.landmarks import CASE_ROWS, FAKE_CAMS, FrameView, MappedArray, cacheHolds, loadStreams, \
+    participantIDs
+from socialverify.parallel import SharedArray, asArray, runCells
+from socialverify.scoring import scoreWindows, windowRates
+from socialverify.store import ResultStore, cellKey, codeVersion
+from socialverify.verify import caseScores, windowFeatures
 
-def mahalanobis_calculate(data, num_pcs):
-    pca = PCA(num_pcs)
-    T = pca.fit_transform(StandardScaler().fit_transform(data))
-    # fit a Minimum Covariance Determinant (MCD) robust estimator to data 
-    robust_cov = MinCovDet().fit(T)
-    # Get the Mahalanobis distance
-    m = robust_cov.mahalanobis(T)
-    return m
-
-def detectFakesTree(link, thresh):
-    ratio = link[-1][-2] / link[-2][-2]
-    if ratio > thresh:
-        c = fcluster(link, 2,criterion='maxclust')
-        partition1 = len(np.argwhere(c==1))
-        partition2 = len(np.argwhere(c==2))
-        if (partition1 > partition2):
-            numFakes = partition2
-        else:
-            numFakes = partition1
-    else:
-        numFakes = 0
-        c = 0
-    return numFakes, c
+# Returns the topOfTree scores of X0..X3, as a (4,) vector of ratios and the
+# (4, numCams) 2-cluster labels, from the features X of cam1..cam6,
+# fake2..fake4 in one window
 
+def clusterWindow(X):
+    return caseScores(X, CASE_ROWS)
 
-def onlyPCA(cam1, cam2, cam3, cam4, cam5, cam6, fake2, 
-            fake3, fake4, start, end, num_pcs, thresh):
-    
-    cam1Out = mahalanobis_calculate(cam1[start:end,:], num_pcs)
-    cam2Out = mahalanobis_calculate(cam2[start:end,:], num_pcs)
-    cam3Out = mahalanobis_calculate(cam3[start:end,:], num_pcs)
-    cam4Out = mahalanobis_calculate(cam4[start:end,:], num_pcs)
-    cam5Out = mahalanobis_calculate(cam5[start:end,:], num_pcs)
-    cam6Out = mahalanobis_calculate(cam6[start:end,:], num_pcs)
-    
-    camFake1 = mahalanobis_calculate(fake2[start:end,:], num_pcs)
-    camFake2 = mahalanobis_calculate(fake3[start:end,:], num_pcs)
-    camFake3 = mahalanobis_calculate(fake4[start:end,:], num_pcs)
-    
-    X0 = np.array([cam1Out, cam2Out, cam3Out, cam4Out, cam5Out, cam6Out])
-    X1 = np.array([cam1Out, cam2Out, cam3Out, camFake3, cam5Out, cam6Out])
-    X2 = np.array([cam1Out, cam2Out, camFake2, camFake3, cam5Out, cam6Out])
-    X3 = np.array([cam1Out, camFake1, camFake2, camFake3, cam5Out, cam6Out])
-    
-    #Test for tracking failures and remove
-    badInds = []
+
+def cascadeFilter(spliced, j, numWin, cascade):
+    # (4, numWin) mask of the window starts whose cameras are clearly
+    # consistent in X0..X3 by the geometric pre-filter (see socialverify.geometry)
+    with stage('cascade'):
+        signals = mouthSignals(spliced, LAYOUTS[cascade.layout])
+        return np.array([consistentWindows(signals[:, rows], j, numWin, cascade.min_opening, cascade.min_speed)
+                         for rows in CASE_ROWS])
+
+
+def cascadeWindows(windows, consistent):
+    # windows(starts) run only on the starts the pre-filter leaves ambiguous
+    # in some case. The consistent cases get a ratio of 0, below any
+    # threshold: no fakes.
+    skip = np.all(consistent, axis = 0)
+    def filtered(starts):
+        starts = np.asarray(starts)
+        results = windows(starts[~skip[starts]])
+        for start in starts:
+            ratios, labels = (np.zeros(4), np.ones((4, 6), dtype = np.int32)) if skip[start] else next(results)
+            ratios = np.where(consistent[:, start], 0.0, ratios)
+            labels = np.where(consistent[:, start, None], 1, labels)
+            yield ratios, labels
+    return filtered
+
+
+def spliceStreams(streams, views=False):
+    #split the fake streams into two thirds (fake, real, fake), the real
+    #third coming from the camera each fake replaces. The real cameras stay
+    #views into streams, the fakes are copied, or with views are FrameViews
+    #that read the frames from streams
+    fullLen = streams.shape[1]
+    intervalWin = fullLen // 3
+    fakes = []
+    for k, (cam, fake) in enumerate(zip(streams[1:4], streams[6:9])):
+        if views:
+            source = np.full(fullLen, 6 + k)
+            source[intervalWin:(2*intervalWin)] = 1 + k
+            fakes.append(FrameView(streams, source))
+            continue
+        spliced = np.array(fake)
+        spliced[intervalWin:(2*intervalWin), :] = cam[intervalWin:(2*intervalWin), :]
+        fakes.append(spliced)
+    return list(streams[:6]) + fakes, intervalWin
+
+
+def compactStreams(streams, compact):
+    # float32 streams in compact mode (a no-op unless they come from the
+    # float64 landmark cache)
+    return streams.astype(np.float32, copy=False) if compact else streams
+
+
+def runWindows(windows, numWin, j, store=None, key=None, progress=False, scan=None, starts=None):
+    # Collect windows(starts), an iterator of clusterWindow outputs for an
+    # increasing sequence of window starts, over all numWin starts (or the
+    # range starts, e.g. one unit of a sweep.py queue). With a
+    # store only the starts missing from cell key are computed, saved chunk
+    # by chunk as they finish, and the complete cell is read back.
+    # scan(windows, numWin), e.g. socialverify.adaptive.adaptiveScan, picks
+    # the starts to evaluate instead; it returns the mask of evaluated starts
+    # as a third output and bypasses the store.
+    if scan is not None:
+        bar = Progress(numWin, f'Window size {j}') if progress else None
+        def counted(starts):
+            for out in windows(starts):
+                if bar is not None:
+                    bar.update()
+                yield out
+        result = scan(counted, numWin)
+        if bar is not None:
+            bar.close()
+        return result
     
-    for i, row in enumerate(X0.T):
-        if np.max(row) >= 10:
-            badInds.append(i)
+    if starts is None:
+        starts = range(numWin)
+    todo = [starts] if store is None else store.missing(key)
+    bar = Progress(sum(len(r) for r in todo), f'Window size {j}') if progress else None
+    update = bar.update if bar is not None else None
+    if store is None:
+        ratios = np.zeros((4, len(starts)))
+        labels = np.zeros((4, len(starts), 6), dtype = np.int32)
+        for w, (r, c) in enumerate(windows(starts)):
+            ratios[:, w], labels[:, w, :] = r, c
+            if update is not None:
+                update()
+    else:
+        for starts in todo:
+            store.collect(key, windows, starts, update)
+    if bar is not None:
+        bar.close()
+    return (ratios, labels) if store is None else store.load(key)
+
+
+def windowScores(streams, j, num_pcs, engine, seed, estimator, store=None, key=None, progress=False,
+                 compact=False, numWin=None, scan=None, cascade=None, starts=None):
+    # Threshold-independent part of one (participant, window size) cell:
+    # topOfTree scores of X0..X3 for every window start. Returns ratios with
+    # shape (4, numWin) and labels with shape (4, numWin, numCams).
+    # streams holds cam1..cam6 and fake2..fake4 (spliced here, see spliceStreams).
+    # store/key resume the cell from a ResultStore (see runWindows), progress
+    # draws a bar over the window starts, for in-process runs. compact works
+    # on float32 streams and spliced views (see --compact), numWin limits the
+    # run to the first window starts, scan picks the starts to evaluate (see
+    # runWindows), cascade (a geometry.Cascade) skips the windows the
+    # geometric pre-filter finds clearly consistent, starts (a range, without
+    # a store) computes only those window starts
+    streams = compactStreams(asArray(streams), compact)
+    if numWin is None:
+        numWin = streams.shape[1] - j
+    with stage('splice'):
+        spliced, _ = spliceStreams(streams, views=compact)
+    features = windowFeatures(spliced, j, 'pca', engine, num_pcs, True, seed, estimator)
     
-    X0 = np.delete(X0, badInds, axis = 1)
-    X1 = np.delete(X1, badInds, axis = 1)
-    X2 = np.delete(X2, badInds, axis = 1)
-    X3 = np.delete(X3, badInds, axis = 1)
+    def windows(starts):
+        for X in features(starts):
+            yield clusterWindow(X)
     
-    link0 = linkage(X0)
-    link1 = linkage(X1)
-    link2 = linkage(X2)
-    link3 = linkage(X3)
+    if cascade is not None:
+        windows = cascadeWindows(windows, cascadeFilter(spliced, j, numWin, cascade))
+    return runWindows(windows, numWin, j, store, key, progress, scan, starts)
+
+
+def waveletScores(streams, j, store=None, key=None, progress=False, compact=False, numWin=None,
+                  scan=None, cascade=None, starts=None):
+    # windowScores for the no-PCA method of full_sequence_exp: every window
+    # is described by its haar wavelet coefficients (see socialverify.wavelets)
+    streams = compactStreams(asArray(streams), compact)
+    if numWin is None:
+        numWin = streams.shape[1] - j
+    with stage('splice'):
+        spliced, _ = spliceStreams(streams, views=compact)
+    features = windowFeatures(spliced, j, 'wavelet')
     
-    numFakes0, _ = detectFakesTree(link0, thresh)
-    numFakes1, c1 = detectFakesTree(link1, thresh)
-    numFakes2, c2 = detectFakesTree(link2, thresh)
-    numFakes3, c3 = detectFakesTree(link3, thresh)
+    def windows(starts):
+        for X in features(starts):
+            yield clusterWindow(X)
     
-    return numFakes0, numFakes1, numFakes2, numFakes3, c1, c2, c3
+    if cascade is not None:
+        windows = cascadeWindows(windows, cascadeFilter(spliced, j, numWin, cascade))
+    return runWindows(windows, numWin, j, store, key, progress, scan, starts)
+
+
+def participantStreams(args, i):
+    # cam1..cam6, fake2..fake4 of participant i as the cells see them. The
+    # whole recording is read (a memory map with --cache-dir): the splice
+    # points, alignment, cascade filter and the rolling engine's mean all
+    # span the sequence, so memory is bounded by the recording, not the
+    # window; replay.py is the block-wise path (see landmarks.streamBlocks)
+    with stage('load'):
+        streams = loadStreams(args.data_dir, i, camsFrom=3, cache_dir=args.cache_dir,
+                              dtype=np.float32 if args.compact else None)
+    if args.align != 'none':
+        with stage('align'):
+            streams, _ = alignParticipant(streams, args.align == 'drift', args.landmark_layout)
+    return streams
+
+
+def cellParams(args, i, j, version):
+    # Everything the per-window outputs of a cell depend on, see socialverify.store
+    params = dict(participant=i, fakes=list(FAKE_CAMS), window=j, features=args.features,
+                  compact=args.compact, code=version)
+    if args.features == 'pca':
+        params.update(num_pcs=args.num_pcs, engine=args.pca_engine, seed=args.seed,
+                      estimator=args.estimator)
+    if args.align != 'none':
+        params.update(align=args.align, layout=args.landmark_layout, align_code=codeVersion(align))
+    if args.cascade:
+        params.update(cascade=cascadeSettings(args)._asdict(), cascade_code=codeVersion(cascadeFilter,
+                      cascadeWindows, geometry))
+    return params
+
+
+def cascadeSettings(args):
+    return Cascade(args.cascade_min_opening, args.cascade_min_speed, args.landmark_layout) if args.cascade else None
 
 
-def parse_args():
+def scoreVersion():
+    # Hash of the code behind the stored outputs (not of the scoring and
+    # plotting, which are redone from the store on every run)
+    return codeVersion(clusterWindow, spliceStreams, compactStreams, runWindows, windowScores, waveletScores,
+                       batched, detect, estimators, landmarks, rolling, verify, wavelets)
+
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='DeepFake Detection Experiment')
 
-    parser.add_argument('--data-dir', type=str, default='Data',
+    parser.add_argument('--data-dir', type=str, default='data/Processed-Landmarks',
                     help='Directory where processed landmark files live')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                    help='Landmark cache (see convert_landmarks.py); participants missing from it are converted on first use')
     parser.add_argument('--num_pcs', type=int, default=5,
                     help='Number of principal components to use')
     parser.add_argument('--num_participants', type=int, default=1,
@@ -101,11 +234,64 @@ def parse_args():
     parser.add_argument('--roc-window-size', type=int, default=250, help = "Window size to use when generating ROC curve")
     parser.add_argument('--acc-threshold', type=float, default=1.3, help = "Threshold to use when generating ACC curve")
     parser.add_argument('--accOn', action = 'store_false')
-    parser.add_argument("--thresholds", nargs="+", default=[1.3,1.5])
-    parser.add_argument("--window-sizes", nargs="+", default=[200,250])
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[1.3,1.5])
+    parser.add_argument("--roc-thresholds", nargs="+", type=float, default=None,
+                    help = "Thresholds for the ROC curve (default: --thresholds). Evaluated from the stored scores, so a dense list is cheap")
+    parser.add_argument("--window-sizes", nargs="+", type=int, default=[200,250])
+    parser.add_argument('--features', type=str, default='pca', choices=['pca', 'wavelet'],
+                    help='Per-window camera features: Mahalanobis distances after PCA, or the haar wavelet '
+                    'coefficients of the no-PCA method')
+    parser.add_argument('--pca-engine', type=str, default='rolling', choices=['rolling', 'batched', 'refit'],
+                    help='How the per-window scaler/PCA is computed: slid along the sequence (rolling), '
+                    'for many windows at once with stacked NumPy calls (batched), or refit per window (refit)')
+    parser.add_argument('--no-rolling', dest='pca_engine', action='store_const', const='refit',
+                    help='Same as --pca-engine refit')
+    parser.add_argument('--compact', action='store_true',
+                    help='Memory-bounded mode: float32 landmarks in one array, fake streams spliced as index views '
+                    'instead of copies, refit/batched PCA and wavelets in float32 (the rolling sums, distances '
+                    'and clustering stay float64)')
+    parser.add_argument('--scan', type=str, default='dense', choices=['dense', 'adaptive'],
+                    help='Evaluate every window start (dense), or a coarse grid refined only where the '
+                    'verdict changes (adaptive; prints the per-frame fake segments, not kept in the store)')
+    parser.add_argument('--coarse-stride', type=int, default=32,
+                    help='Stride of the first pass of the adaptive scan')
+    parser.add_argument('--ratio-tol', type=float, default=None,
+                    help='Also refine the adaptive scan where the linkage ratio changes by more than this '
+                    'fraction between neighbouring windows')
+    parser.add_argument('--cascade', action='store_true',
+                    help='Run a geometric pre-filter (mouth opening and landmark speed of every camera against '
+                    'their consensus) over all windows first, and the PCA/MCD/linkage path only on the windows '
+                    'it finds ambiguous')
+    parser.add_argument('--cascade-min-opening', type=float, default=0.8,
+                    help='Windows where every camera\'s mouth opening correlates with the consensus by at least '
+                    'this much (and the speed by --cascade-min-speed) are consistent and skip the full path')
+    parser.add_argument('--cascade-min-speed', type=float, default=0.7)
+    parser.add_argument('--align', type=str, default='none', choices=['none', 'offset', 'drift'],
+                    help='Re-index the cameras onto cam1\'s frames before detection, by the cross-correlation of '
+                    'their mouth opening: a start offset per camera, or an offset and a linear clock drift')
+    parser.add_argument('--landmark-layout', type=str, default='blocks', choices=sorted(LAYOUTS),
+                    help='Order of the landmark coordinates in a frame: x0..x19 then y0..y19 (blocks), or '
+                    'x0, y0, x1, ... (interleaved)')
+    parser.add_argument('--seed', type=int, default=0,
+                    help='Random state for the MCD estimator')
+    parser.add_argument('--estimator', type=str, default='mcd', choices=sorted(ESTIMATORS),
+                    help='Covariance estimator for the Mahalanobis distances')
+    parser.add_argument('--jobs', type=int, default=1,
+                    help='Number of worker processes to spread the experiment cells over')
+    parser.add_argument('--store', type=str, default=None,
+                    help='SQLite result store for the per-window outputs (default: none, everything is computed). '
+                    'Finished cells are skipped and interrupted ones resume')
+    parser.add_argument('--plot-only', action='store_true',
+                    help='Score and plot from the result store (--store) alone, without loading data or computing')
+    parser.add_argument('--timings', type=str, default=None,
+                    help='Time the pipeline stages and append JSON-lines records (one per participant load, cell and run) to this file')
+    parser.add_argument('--profile', type=str, default=None,
+                    help='Write a cProfile dump of the run here (with --jobs, workers write <profile>.<pid>)')
+    parser.add_argument('--no-progress', dest='progress', action='store_false',
+                    help='Do not draw the progress bar')
     
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
 
 
@@ -116,66 +302,124 @@ def main():
     #Running it for 1 participant takes a bit over an hour. 
     
     args = parse_args()
+    with instrument.profiled(args.profile):
+        run(args)
+
+
+def run(args):
+    t0 = time.perf_counter()
+    if args.timings is not None:
+        instrument.enable(args.timings)
     
     if not os.path.exists(args.save_dir):
         os.makedirs(args.save_dir)
         
-    threshNum = len(args.thresholds)
+    #Thresholds only enter after the (stored) per-window scores, so they
+    #are evaluated separately from the window sizes
+    threshes = args.thresholds
+    rocThreshes = args.roc_thresholds if args.roc_thresholds else threshes
+    window_sizes = args.window_sizes
+    
+    threshNum = len(rocThreshes)
     if args.num_participants >= 17:
         n  = args.num_participants - 1
     else:
         n = args.num_participants
     
+    tpResults = fpResults = accResults = None
     if args.rocOn:
         tpResults = np.zeros((threshNum,3,n))
         fpResults = np.zeros((threshNum,3,n))
         
     if args.accOn:
         accResults = np.zeros((4,len(args.window_sizes),n))
+    
+    #Per-window outputs are only kept, and reused, with --store
+    store = ResultStore(args.store) if args.store else None
+    if store is None and args.plot_only:
+        raise SystemExit('--plot-only reads the result store given with --store')
+    version = scoreVersion()
+    cascade = cascadeSettings(args)
+    
+    #The adaptive scan is cheap and its outputs are not kept in the store
+    scan = None
+    if args.scan == 'adaptive':
+        if args.plot_only:
+            raise SystemExit('--plot-only reads the result store, which only holds dense scans')
+        scan = functools.partial(adaptiveScan, threshes=sorted(set(threshes + rocThreshes + [args.acc_threshold])),
+                                 stride=args.coarse_stride, ratioTol=args.ratio_tol)
         
-        
-    for i in range(args.num_participants):
-        if i == 16:
+    # There is no data for ID 17
+    people = participantIDs(args.num_participants)
+    intervalWins = []
+    shared = []
+    cells = []
+    stored = {}
+    missing = []
+    totals = {}
+    for i in people:
+        keys = [cellKey(cellParams(args, i, j, version)) for j in window_sizes]
+        for j, key in zip(window_sizes, keys):
+            result = store.load(key) if store is not None and scan is None else None
+            if result is not None:
+                stored[(i, j)] = result
+        if all((i, j) in stored for j in window_sizes):
+            #Only the sequence length is needed to score stored cells
+            intervalWins.append(store.cell(keys[0])[1] // 3)
+            continue
+        if args.plot_only:
+            missing.extend((i, j) for j in window_sizes if (i, j) not in stored)
             continue
         
-        if i > 16:
-            person = i -1
-        else:
-            person = i
-            
-        if args.accOn:
-            accs = np.zeros((4, len(args.window_sizes)))
-        
-        data2 = loadmat(os.path.join(args.data_dir, f'mouth-data-fake2-ID{i+1}.mat'))
-        data3 = loadmat(os.path.join(args.data_dir, f'mouth-data-fake3-ID{i+1}.mat'))
-        data4 = loadmat(os.path.join(args.data_dir, f'mouth-data-fake4-ID{i+1}.mat'))
-        
-        fullLen = min(data2['cam1'].shape[0], data3['cam1'].shape[0], data4['cam1'].shape[0])
-        
-        cam1 = data3['cam1'][:fullLen,:]
-        cam2 = data3['cam2'][:fullLen,:]
-        cam3 = data3['cam3'][:fullLen,:]
-        cam4 = data3['cam4'][:fullLen,:]
-        cam5 = data3['cam5'][:fullLen,:]
-        cam6 = data3['cam6'][:fullLen,:]
-        
-        #split into two thirds (fake, real, fake)
-        intervalWin = fullLen // 3
-        fake2 = np.vstack([data2['fake'][:intervalWin,:], 
-                           cam2[intervalWin:(2*intervalWin),:], 
-                           data2['fake'][(2*intervalWin):fullLen,:]])
-        fake3 = np.vstack([data3['fake'][:intervalWin,:], 
-                           cam3[intervalWin:(2*intervalWin),:], 
-                           data3['fake'][(2*intervalWin):fullLen,:]])
-        fake4 = np.vstack([data4['fake'][:intervalWin,:], 
-                           cam4[intervalWin:(2*intervalWin),:], 
-                           data4['fake'][(2*intervalWin):fullLen,:]])
+        streams = participantStreams(args, i)
+        loadStages = instrument.takeStages()
+        totals = instrument.mergeStages(totals, loadStages)
+        instrument.record('load', script='window_acc_exp', participant=i, stages=loadStages)
+        fullLen = streams.shape[1]
+        intervalWins.append(fullLen // 3)
+        if args.jobs > 1:
+            #The cache holds the streams as recorded, not aligned
+            if args.cache_dir is not None and args.align == 'none' and cacheHolds(args.cache_dir, i, 3):
+                streams = MappedArray(args.cache_dir, i)
+            else:
+                streams = SharedArray(streams)
+                shared.append(streams)
+        for j, key in zip(window_sizes, keys):
+            if (i, j) in stored:
+                continue
+            if store is not None and scan is None:
+                store.addCell(key, cellParams(args, i, j, version), fullLen, fullLen - j)
+                cellStore = store
+            else:
+                cellStore = key = None
+            progress = args.progress and args.jobs <= 1
+            if args.features == 'wavelet':
+                cells.append((streams, j, cellStore, key, progress, args.compact, None, scan, cascade))
+            else:
+                cells.append((streams, j, args.num_pcs, args.pca_engine, args.seed, args.estimator, cellStore, key,
+                              progress, args.compact, None, scan, cascade))
+    if missing:
+        raise SystemExit(f'{len(missing)} cells are not in {store.path}: '
+                         + ', '.join(f'ID{i} window {j}' for i, j in missing))
+    if stored:
+        print(f'Reusing {len(stored)} finished cells from {store.path}')
     
+    #Workers time their own stages and hand them back with the results
+    func = Instrumented(waveletScores if args.features == 'wavelet' else windowScores,
+                        args.timings is not None, args.profile if args.jobs > 1 else None)
+    bar = Progress(len(cells), 'Cells') if args.progress and args.jobs > 1 else None
+    try:
+        results = runCells(func, cells, args.jobs, done = bar.update if bar else None)
+    finally:
+        for streams in shared:
+            streams.release()
+    if bar is not None:
+        bar.close()
     
-        #Iterate over diffrent thresholds and window sizes
-        threshes = args.thresholds
-        window_sizes = args.window_sizes
-        
+    computed = iter(results)
+    for person, i in enumerate(people):
+        if args.accOn:
+            accs = np.zeros((4, len(args.window_sizes)))
         
 # =============================================================================
 #         (1) TP if window contains a faked frame & fake is detected
@@ -184,147 +428,104 @@ def main():
 #         (4) FN if window contains a faked frame & fake is not detected
 # =============================================================================
         
-        for ind, t in enumerate(threshes):
-            for ind2, j in enumerate(window_sizes):
-                numWin = fullLen - j
-                acc0 = acc1 = acc2 = acc3 = np.zeros((4,numWin))
-                for start in range(fullLen):
-                    end = start + j
-                    if end > fullLen-1:
-                        continue
-                    
-                    numFakes0, numFakes1, numFakes2, numFakes3, c1, c2, c3 = onlyPCA(cam1, cam2, cam3, cam4, cam5, cam6, fake2, 
-            fake3, fake4, start, end, args.num_pcs, t)
-                    
-                    isFake = (len(set(range(start, end)).intersection(set(range(intervalWin, 2*intervalWin)))) == 0)
-                        
-                    #0 fakes case
-                    if numFakes0 ==0:
-                        acc0[1][start] = 1 
-                    else:
-                        acc0[2][start] = 1
-                        
-                        
-                    #1 fake case
-                    if numFakes1 ==1:
-                        if isFake==0:
-                            acc1[2][start] = 1
-                        else:
-                            if (np.all(c1 == np.array([1,1,1,2,1,1])) or np.all(c1 == np.array([2,2,2,1,2,2]))):
-                                acc1[0][start] = 1
-                            else:
-                                acc1[3][start] = 1
-                    elif numFakes1 > 1:
-                        acc1[2][start] = 1
-                    else:
-                        if isFake == 0:
-                            acc1[1][start] = 1
-                        else:
-                            acc1[3][start] = 1
-                            
-                    #2 fakes case
-                    if numFakes2 ==2:
-                        if isFake==0:
-                            acc2[2][start] = 1
-                        else:
-                            if (np.all(c2 == np.array([1,1,2,2,1,1])) or np.all(c2 == np.array([2,2,1,1,2,2]))):
-                                acc2[0][start] = 1
-                            else:
-                                acc2[3][start] = 1
-                    elif ((numFakes2 == 1) or (numFakes2 > 2)):
-                        acc2[2][start] = 1
-                    else:
-                        if isFake == 0:
-                            acc2[1][start] = 1
-                        else:
-                            acc2[3][start] = 1
-                            
-                    #3 fakes case
-                    
-                    if numFakes3 ==3:
-                        if isFake==0:
-                            acc3[2][start] = 1
-                        else:
-                            if (np.all(c3 == np.array([1,2,2,2,1,1])) or np.all(c3 == np.array([2,1,1,1,2,2]))):
-                                acc3[0][start] = 1
-                            else:
-                                acc3[3][start] = 1
-                    elif ((numFakes3 == 1) or (numFakes3 == 2) or (numFakes3 > 3)):
-                        acc3[2][start] = 1
-                    else:
-                        if isFake == 0:
-                            acc3[1][start] = 1
-                        else:
-                            acc3[3][start] = 1
-                            
-                    print(f'Window Start: {start}')
-                    
-                print(f'ID: {i}. Threshold: {t}. Window size: {j}.'
-                          f'TP: {np.mean(acc0, axis = 1)}. TN: {np.mean(acc1, axis = 1)}.'
-                          f'FP: {np.mean(acc2, axis = 1)}. FN: {np.mean(acc3, axis = 1)}.')
+        for ind2, j in enumerate(window_sizes):
+            hit = (i, j) in stored
+            result, cellStages, seconds = (stored[(i, j)], {}, 0.0) if hit else next(computed)
+            ratios, labels = result[:2]
+            if scan is not None:
+                printSegments(i, j, ratios, labels, result[2], args.acc_threshold)
+            
+            with stage('scoring'):
+                masks = scoreWindows(ratios, labels, intervalWins[person], threshes, j)
+                for t, (acc0, acc1, acc2, acc3) in zip(threshes, masks):
+                    print(f'ID: {i-1}. Threshold: {t}. Window size: {j}.'
+                              f'TP: {np.mean(acc0, axis = 1)}. TN: {np.mean(acc1, axis = 1)}.'
+                              f'FP: {np.mean(acc2, axis = 1)}. FN: {np.mean(acc3, axis = 1)}.')
                 
                 if (args.rocOn and j == args.roc_window_size):
-                    tpResults[ind,0,person] = np.sum(acc1[0,:]) / (np.sum(acc1[0,:]) + np.sum(acc1[3,:]) + 1e-7)
-                    tpResults[ind,1,person] = np.sum(acc2[0,:]) / (np.sum(acc2[0,:]) + np.sum(acc2[3,:]) + 1e-7)
-                    tpResults[ind,2,person] = np.sum(acc3[0,:]) / (np.sum(acc3[0,:]) + np.sum(acc3[3,:]) + 1e-7)
-                    
-                    fpResults[ind,0,person] = np.sum(acc1[2,:]) / (np.sum(acc1[2,:]) + np.sum(acc1[1,:]) +1e-7)
-                    fpResults[ind,1,person] = np.sum(acc2[2,:]) / (np.sum(acc2[2,:]) + np.sum(acc2[1,:])+ 1e-7)
-                    fpResults[ind,2,person] = np.sum(acc3[2,:]) / (np.sum(acc3[2,:]) + np.sum(acc3[1,:])+ 1e-7)
-
-                if (args.accOn and t == args.acc_threshold):
-                    
-                    accs[0,ind2] = (np.sum(acc0[0,:]) + np.sum(acc0[1,:])) / (np.sum(acc0[0,:]) + np.sum(acc0[1,:]) + np.sum(acc0[2,:]) + np.sum(acc0[3,:]))
-                    accs[1,ind2] = (np.sum(acc1[0,:]) + np.sum(acc1[1,:])) / (np.sum(acc1[0,:]) + np.sum(acc1[1,:]) + np.sum(acc1[2,:]) + np.sum(acc1[3,:]))
-                    accs[2,ind2] = (np.sum(acc2[0,:]) + np.sum(acc2[1,:])) / (np.sum(acc2[0,:]) + np.sum(acc2[1,:]) + np.sum(acc2[2,:]) + np.sum(acc2[3,:]))
-                    accs[3,ind2] = (np.sum(acc3[0,:]) + np.sum(acc3[1,:])) / (np.sum(acc3[0,:]) + np.sum(acc3[1,:]) + np.sum(acc3[2,:]) + np.sum(acc3[3,:]))
+                    tpr, fpr, _ = windowRates(scoreWindows(ratios, labels, intervalWins[person], rocThreshes, j))
+                    tpResults[:,:,person] = tpr[:,1:]
+                    fpResults[:,:,person] = fpr[:,1:]
+    
+                if args.accOn:
+                    _, _, acc = windowRates(scoreWindows(ratios, labels, intervalWins[person], args.acc_threshold, j))
+                    accs[:,ind2] = acc[0]
+            
+            cellStages = instrument.mergeStages(cellStages, instrument.takeStages())
+            totals = instrument.mergeStages(totals, cellStages)
+            instrument.record('cell', script='window_acc_exp', participant=i, window=j,
+                              features=args.features, engine=args.pca_engine, estimator=args.estimator, stored=hit,
+                              seconds=seconds, stages=cellStages)
             
         if args.accOn:
             accResults[:,:,person] = accs
-                        
-    if args.rocOn:
-        meanTP = np.mean(tpResults, axis = 2)     
-        meanFP = np.mean(fpResults,axis = 2)
-        stdTP = np.std(tpResults,axis = 2)
-        stdFP = np.std(fpResults,axis = 2)
-        
-        oneFake = np.array([meanFP[:,0],meanTP[:,0] ])
-        twoFake = np.array([meanFP[:,1],meanTP[:,1] ])
-        threeFake = np.array([meanFP[:,2],meanTP[:,2] ])
-        
-        oneFake = oneFake[oneFake[:,1].argsort()]
-        twoFake = twoFake[twoFake[:,1].argsort()]
-        threeFake = threeFake[threeFake[:,1].argsort()]
-        
-        plt.errorbar(oneFake[:,0],oneFake[:,1], stdTP[:,0],stdFP[:,0], label = 'One Fake')
-        plt.errorbar(twoFake[:,0],twoFake[:,1], stdTP[:,1],stdFP[:,1], label = 'Two Fakes')
-        plt.errorbar(twoFake[:,0],twoFake[:,1], stdTP[:,2],stdFP[:,2], label = 'Three Fakes')
-        plt.xlabel("False Positive Rate")
-        plt.ylabel("True Positive Rate")
-        plt.xlim([0,1])
-        plt.ylim([0,1])
-        plt.legend()
-        plt.title(f"ROC Curve. Window size = {args.roc_window_size}")
-        plt.savefig(os.path.join(args.save_dir, f"roc_window_size_{args.roc_window_size}.jpg"))
-        
-        
-    if args.accOn:
-        meanRes = np.mean(accResults,axis = 2)
-        stdRes = np.std(accResults,axis = 2)
     
-        plt.errorbar(args.window_sizes, meanRes[0,:], yerr = stdRes[0,:], label = "No Fakes")
-        plt.errorbar(args.window_sizes, meanRes[1,:],yerr = stdRes[1,:], label = "One Fake")
-        plt.errorbar(args.window_sizes, meanRes[2,:], yerr = stdRes[2,:],label = "Two Fakes")
-        #plt.plot(args.window_sizes, meanRes[3,:], label = "Three Fakes")
-        plt.xlim([min(args.window_sizes),max(args.window_sizes) + 50])
-        plt.ylim([0,1])
-        plt.xlabel("Window Size")
-        plt.ylabel("Accuracy")
-        plt.title(f"Detection Accuracy vs. Window Size with Threshold = {args.acc_threshold}")
-        plt.legend()
-        plt.savefig(os.path.join(args.save_dir, f"acc_vs_window_size_thresh{args.acc_threshold}.jpg"))
-        
-                    
+    with stage('plot'):
+        if args.rocOn:
+            plotROC(args, tpResults, fpResults)
+        if args.accOn:
+            plotAcc(args, accResults)
+    if store is not None:
+        store.close()
+    
+    runStages = instrument.takeStages()
+    totals = instrument.mergeStages(totals, runStages)
+    instrument.record('run', script='window_acc_exp', participants=people, windows=window_sizes,
+                      jobs=args.jobs, seconds=time.perf_counter() - t0, stages=runStages, totals=totals)
+    if instrument.enabled():
+        instrument.summary(totals)
+        instrument.disable()
+    return tpResults, fpResults, accResults
+
+
+def printSegments(i, j, ratios, labels, evaluated, thresh):
+    #per-frame fake segments of the 1-3 fakes cases from an adaptive scan
+    numWin = ratios.shape[1]
+    flagged = detectFakes(ratios, labels, thresh)[0, 1:] > 0
+    frames = frameVerdicts(flagged, j, numWin + j)
+    print(f'ID: {i-1}. Window size: {j}. Evaluated {np.sum(evaluated)} of {numWin} windows.')
+    for k in range(3):
+        print(f'ID: {i-1}. Window size: {j}. Threshold: {thresh}. {k+1} fake(s) segments: {segments(frames[k])}')
+
+
+def plotROC(args, tpResults, fpResults):
+    plt.figure()
+    meanTP = np.mean(tpResults, axis = 2)     
+    meanFP = np.mean(fpResults,axis = 2)
+    stdTP = np.std(tpResults,axis = 2)
+    stdFP = np.std(fpResults,axis = 2)
+    
+    #one (FP, TP) point per threshold, ordered along the curve
+    labels = ['One Fake', 'Two Fakes', 'Three Fakes']
+    for k in range(3):
+        order = np.lexsort((meanTP[:,k], meanFP[:,k]))
+        plt.errorbar(meanFP[order,k], meanTP[order,k], stdTP[order,k], stdFP[order,k], label = labels[k])
+    plt.xlabel("False Positive Rate")
+    plt.ylabel("True Positive Rate")
+    plt.xlim([0,1])
+    plt.ylim([0,1])
+    plt.legend()
+    plt.title(f"ROC Curve. Window size = {args.roc_window_size}")
+    plt.savefig(os.path.join(args.save_dir, f"roc_window_size_{args.roc_window_size}.jpg"))
+
+
+def plotAcc(args, accResults):
+    plt.figure()
+    meanRes = np.mean(accResults,axis = 2)
+    stdRes = np.std(accResults,axis = 2)
+
+    plt.errorbar(args.window_sizes, meanRes[0,:], yerr = stdRes[0,:], label = "No Fakes")
+    plt.errorbar(args.window_sizes, meanRes[1,:],yerr = stdRes[1,:], label = "One Fake")
+    plt.errorbar(args.window_sizes, meanRes[2,:], yerr = stdRes[2,:],label = "Two Fakes")
+    #plt.plot(args.window_sizes, meanRes[3,:], label = "Three Fakes")
+    plt.xlim([min(args.window_sizes),max(args.window_sizes) + 50])
+    plt.ylim([0,1])
+    plt.xlabel("Window Size")
+    plt.ylabel("Accuracy")
+    plt.title(f"Detection Accuracy vs. Window Size with Threshold = {args.acc_threshold}")
+    plt.legend()
+    plt.savefig(os.path.join(args.save_dir, f"acc_vs_window_size_thresh{args.acc_threshold}.jpg"))
+
 
 if __name__ == "__main__":
     main()